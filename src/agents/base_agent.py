@@ -1,6 +1,19 @@
+import json
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Sequence, Tuple
 from datetime import datetime
+from .structured_output import (
+    LLM_PARSE_RESULTS,
+    SIGNAL_FIELDS,
+    StreamingJSONParser,
+    chunk_text,
+    extract_json,
+    normalize_confidence,
+    normalize_signal,
+)
+from .llm_calls import Attempt, call_with_policy, get_llm_budget
+from ..config import get_config
+from ..services.llm_cache import get_llm_cache, make_key
 
 
 class BaseAgent(ABC):
@@ -8,20 +21,115 @@ class BaseAgent(ABC):
         self.name = name
         self.model = model
         self.weight = weight
+        # 主模型响应慢时发出对冲请求的备用模型，None 表示不对冲
+        self.backup_llm = None
 
     @abstractmethod
     async def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """分析数据并返回结果"""
         pass
 
+    async def invoke_llm(
+        self,
+        prompt,
+        variables: Dict[str, Any],
+        fields: Sequence[str] = SIGNAL_FIELDS,
+        cap_field: str = None,
+    ) -> str:
+        """渲染提示词并流式调用 self.llm，返回响应文本
+
+        响应按 JSON 对象增量解析：fields 都已完整且 cap_field 超过 llm.reasoning_max_chars
+        个字符时停止读取。能解析出对象时返回规范化后的 JSON，否则返回原文。
+        调用受 Agent 截止时间约束，瞬时错误退避重试，设置了 backup_llm 时对慢请求对冲。
+        未命中缓存时，每次实际请求都须先取得全局 LLM 预算（并发数和每分钟请求数）。
+        相同 (模型, 温度, 提示词) 的调用在缓存有效期内直接复用之前主模型解析成功的响应。
+        """
+        messages = prompt.format_messages(**variables)
+        # 备用模型返回的结果，用于识别对冲胜出的响应
+        backup_results = []
+
+        async def attempt(use_backup: bool) -> Attempt:
+            # 每次请求（含重试和对冲请求）各自占用一个并发名额和一个速率令牌
+            async with get_llm_budget().slot():
+                result = await self._stream(
+                    self.backup_llm if use_backup else self.llm,
+                    messages,
+                    fields,
+                    cap_field,
+                )
+            if use_backup:
+                backup_results.append(result)
+            return result
+
+        async def call() -> Tuple[str, bool]:
+            """返回 (响应文本, 是否可缓存)
+
+            只缓存主模型解析成功的响应：缓存键是主模型的 (模型, 温度, 提示词)，
+            对冲胜出的备用模型响应不能以主模型的名义复用。
+            """
+            result = await call_with_policy(
+                self.name, attempt, hedge=self.backup_llm is not None
+            )
+            text, value, status = result
+            LLM_PARSE_RESULTS.labels(self.name, status).inc()
+            if value is None:
+                print(f"{self.name} 响应无法解析为 JSON: {text[:200]}")
+                return text, False
+            from_backup = any(r is result for r in backup_results)
+            return json.dumps(value, ensure_ascii=False), not from_backup
+
+        cache = get_llm_cache()
+        if cache is None:
+            return (await call())[0]
+
+        model = getattr(self.llm, "model_name", None) or getattr(
+            self.llm, "model", self.model
+        )
+        key = make_key(model, getattr(self.llm, "temperature", None), messages)
+        return await cache.get_or_call(key, call, agent=self.name)
+
+    async def _stream(
+        self, llm, messages, fields: Sequence[str], cap_field: str
+    ) -> Attempt:
+        """执行一次请求并增量解析，返回 (响应文本, 解析出的对象, 解析方式)"""
+        parser = StreamingJSONParser(
+            fields, cap_field, get_config("llm.reasoning_max_chars", 2000)
+        )
+        if get_config("llm.stream", True):
+            stream = llm.astream(messages)
+            try:
+                async for chunk in stream:
+                    if parser.feed(chunk_text(chunk.content)):
+                        break
+            finally:
+                await stream.aclose()
+        else:
+            parser.feed(chunk_text((await llm.ainvoke(messages)).content))
+        value, status = parser.finish()
+        return parser.text, value, status
+
+    def parse_json(
+        self,
+        content: str,
+        default: Dict[str, Any],
+        fields: Sequence[str] = SIGNAL_FIELDS,
+    ) -> Dict[str, Any]:
+        """解析 invoke_llm 的响应，无法解析或缺少 fields 时返回 default"""
+        value, _ = extract_json(content)
+        if value is None or not all(f in value for f in fields):
+            return default
+        return value
+
     def format_output(
         self, signal: str, confidence: float, reasoning: str
     ) -> Dict[str, Any]:
+        """Agent 的标准输出；信号和置信度来自模型原文，无效时按 HOLD / 0.5 处理"""
+        confidence = normalize_confidence(confidence)
         return {
             "agent": self.name,
             "model": self.model,
-            "signal": signal,
-            "confidence": confidence,
+            "signal": normalize_signal(signal) or "HOLD",
+            "confidence": 0.5 if confidence is None else confidence,
             "reasoning": reasoning,
             "timestamp": datetime.now().isoformat(),
             "weight": self.weight,
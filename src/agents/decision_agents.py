@@ -1,14 +1,39 @@
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from .base_agent import BaseAgent
-from typing import Dict, Any, List
+from .discussion_memory import (
+    DiscussionMemory,
+    compact_opinions,
+    count_tokens,
+    load_encoding,
+)
+from .llm_providers import backup_llm, create_llm
+from .structured_output import normalize_confidence, normalize_signal
+from ..config import get_config
+from typing import Awaitable, Callable, Dict, Any, List
 import json
 
+# 讨论主持人与反思 Agent 响应中必须包含的字段
+ROUND_FIELDS = ("consensus", "confidence")
+REFLECTION_FIELDS = ("adjusted_confidence",)
+
+
+def _stable(results):
+    """去掉 format_output 附带的生成时间戳
+
+    时间戳对决策没有信息量，却会让每次渲染出的提示词都不同，导致 LLM 缓存无法命中。
+    """
+    if isinstance(results, list):
+        return [_stable(r) for r in results]
+    if isinstance(results, dict):
+        return {k: v for k, v in results.items() if k != "timestamp"}
+    return results
+
 
 class DecisionAgent(BaseAgent):
     def __init__(self):
         super().__init__("DecisionAgent", "gpt-4", 1.0)
-        self.llm = ChatOpenAI(model="gpt-4", temperature=0.2)
+        self.llm = create_llm("openai", "gpt-4", 0.2, self.name)
+        self.backup_llm = backup_llm("openai", 0.2, self.name)
 
     async def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
         tech_results = data.get("technical_analysis", [])
@@ -18,7 +43,7 @@ class DecisionAgent(BaseAgent):
             [
                 (
                     "system",
-                    """你是最终决策者。综合技术分析和新闻分析结果，做出最终交易决策。
+                    """你是最终决策者。综合 {symbol} 的技术分析和新闻分析结果，做出最终交易决策。
             
             考虑因素：
             1. 各Agent的信号和置信度
@@ -31,91 +56,237 @@ class DecisionAgent(BaseAgent):
             ]
         )
 
-        chain = prompt | self.llm
-        response = await chain.ainvoke(
+        content = await self.invoke_llm(
+            prompt,
             {
-                "tech": json.dumps(tech_results, ensure_ascii=False, indent=2),
-                "news": json.dumps(news_results, ensure_ascii=False, indent=2),
-            }
+                "symbol": data.get("symbol", "BTC/USDT"),
+                "tech": json.dumps(
+                    _stable(tech_results), ensure_ascii=False, indent=2
+                ),
+                "news": json.dumps(
+                    _stable(news_results), ensure_ascii=False, indent=2
+                ),
+            },
+            cap_field="reasoning",
         )
 
-        result = self._parse_response(response.content)
+        result = self._parse_response(content)
         return self.format_output(
-            result["signal"], result["confidence"], result["reasoning"]
+            result["signal"], result["confidence"], result.get("reasoning", "")
         )
 
     def _parse_response(self, content: str) -> Dict:
-        try:
-            return json.loads(content)
-        except:
-            return {"signal": "HOLD", "confidence": 0.5, "reasoning": content}
+        return self.parse_json(
+            content, {"signal": "HOLD", "confidence": 0.5, "reasoning": content}
+        )
 
 
 class DiscussionAgent(BaseAgent):
     def __init__(self):
         super().__init__("DiscussionAgent", "gpt-4", 1.0)
-        self.llm = ChatOpenAI(model="gpt-4", temperature=0.5)
+        self.llm = create_llm("openai", "gpt-4", 0.5, self.name)
+        self.backup_llm = backup_llm("openai", 0.5, self.name)
+
+    async def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.moderate_discussion(
+            data.get("agents_results", []), data.get("rounds")
+        )
+
+    def assess_agreement(self, agents_results: List[Dict]) -> Dict[str, Any]:
+        """各 Agent 观点的加权一致度
+
+        按 权重 x 置信度 投票：agreement 为得票最多信号的得分占比，
+        confidence 为支持该信号的 Agent 按权重平均的置信度。
+        """
+        scores, weights = {}, {}
+        for result in agents_results:
+            # 无效的信号或置信度不参与投票
+            signal = normalize_signal(result.get("signal"))
+            confidence = normalize_confidence(result.get("confidence"))
+            if signal is None or confidence is None:
+                continue
+            weight = result.get("weight", 0.5)
+            scores[signal] = scores.get(signal, 0) + weight * confidence
+            weights[signal] = weights.get(signal, 0) + weight
+        total = sum(scores.values())
+        if not scores or total <= 0:
+            return {"signal": "HOLD", "agreement": 0.0, "confidence": 0.5}
+        signal = max(scores, key=scores.get)
+        return {
+            "signal": signal,
+            "agreement": scores[signal] / total,
+            "confidence": scores[signal] / weights[signal],
+        }
+
+    def _converged(self, memory: DiscussionMemory) -> bool:
+        """最近两轮共识信号相同且置信度变化在容差内"""
+        if len(memory.positions) < 2:
+            return False
+        previous, last = memory.positions[-2], memory.positions[-1]
+        if last["consensus"] is None or last["consensus"] != previous["consensus"]:
+            return False
+        try:
+            change = abs(float(last["confidence"]) - float(previous["confidence"]))
+        except (TypeError, ValueError):
+            return False
+        return change <= get_config("decision.discussion_stop_tolerance", 0.05)
 
     async def moderate_discussion(
-        self, agents_results: List[Dict], rounds: int = 3
+        self,
+        agents_results: List[Dict],
+        rounds: int = None,
+        completed: List[Dict] = None,
+        on_round: Callable[[Dict], Awaitable[None]] = None,
     ) -> Dict[str, Any]:
-        """主持多Agent辩论式讨论"""
-        discussion_history = []
-
-        for round_num in range(rounds):
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        """你是讨论主持人。各Agent已提出初步观点，现在进行第{round}轮讨论。
+        """主持多Agent辩论式讨论
+
+        各 Agent 已高度一致时跳过讨论；否则最多进行 rounds 轮，
+        共识信号和置信度在相邻两轮间稳定后提前结束。实际轮数记录在 rounds_used。
+
+        各轮之间只传递 DiscussionMemory 中的滚动摘要和结构化增量，
+        各 Agent 观点压缩一次后每轮复用，单轮提示词大小与轮数无关。
+
+        completed 为此前中断的讨论已完成的轮次记录，据此恢复记忆后从下一轮继续；
+        on_round 在每轮完成后以该轮记录调用，用于持久化。
+        """
+        if rounds is None:
+            rounds = get_config("decision.discussion_rounds", 3)
+
+        agreement = self.assess_agreement(agents_results)
+        if agreement["agreement"] >= get_config(
+            "decision.discussion_skip_agreement", 0.9
+        ) and agreement["confidence"] >= get_config(
+            "decision.discussion_skip_confidence", 0.6
+        ):
+            output = self.format_output(
+                agreement["signal"],
+                agreement["confidence"],
+                f"各Agent观点一致（加权一致度 {agreement['agreement']:.2f}），跳过讨论",
+            )
+            output["rounds"] = []
+            output["rounds_used"] = 0
+            return output
+
+        await load_encoding(self.model)
+        memory = DiscussionMemory(
+            budget=get_config("decision.discussion_memory_tokens", 600),
+            model=self.model,
+        )
+        opinions = json.dumps(
+            compact_opinions(
+                agents_results,
+                get_config("decision.discussion_opinion_tokens", 1200),
+                self.model,
+            ),
+            ensure_ascii=False,
+        )
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                (
+                    "system",
+                    """你是讨论主持人。各Agent已提出初步观点，现在进行第{round}轮讨论。
                 
                 请：
                 1. 指出观点分歧点
                 2. 要求Agent解释其推理
                 3. 寻找共识
+                4. 将此前摘要与本轮讨论合并为不超过150字的新摘要
                 
-                返回JSON：{{"consensus": "BUY/SELL/HOLD", "confidence": 0.85, "key_points": [...], "disagreements": [...]}}""",
-                    ),
-                    ("user", "当前观点：\n{opinions}\n\n历史讨论：\n{history}"),
-                ]
+                返回JSON：{{"consensus": "BUY/SELL/HOLD", "confidence": 0.85, "summary": "...", "key_points": [...], "disagreements": [...]}}""",
+                ),
+                ("user", "当前观点：\n{opinions}\n\n历史讨论：\n{history}"),
+            ]
+        )
+
+        records = list(completed or [])
+        for record in records:
+            content = record["argument"]
+            memory.add_round(record["round"], self._parse_round(content), content)
+        if self._converged(memory):
+            rounds = len(records)
+
+        for round_num in range(len(records) + 1, rounds + 1):
+            variables = {
+                "round": round_num,
+                "opinions": opinions,
+                "history": memory.render(),
+            }
+            prompt_tokens = sum(
+                count_tokens(m.content, self.model)
+                for m in prompt.format_messages(**variables)
             )
+            try:
+                content = await self.invoke_llm(prompt, variables, fields=ROUND_FIELDS)
+            except Exception as e:
+                # 超时或重试耗尽时结束讨论，以已完成的轮次（或投票结果）为准
+                print(f"第{round_num}轮讨论失败: {e}")
+                break
 
-            chain = prompt | self.llm
-            response = await chain.ainvoke(
+            parsed = self._parse_round(content)
+            memory.add_round(round_num, parsed, content)
+            records.append(
                 {
-                    "round": round_num + 1,
-                    "opinions": json.dumps(agents_results, ensure_ascii=False),
-                    "history": json.dumps(discussion_history, ensure_ascii=False),
+                    "round": round_num,
+                    "agent": self.name,
+                    "position": normalize_signal(parsed.get("consensus")),
+                    "confidence": normalize_confidence(parsed.get("confidence")),
+                    "argument": content,
+                    "prompt_tokens": prompt_tokens,
                 }
             )
+            if on_round is not None:
+                await on_round(records[-1])
+            if self._converged(memory):
+                break
 
-            discussion_history.append(
-                {"round": round_num + 1, "summary": response.content}
-            )
-
-        # Final consensus
-        final_result = self._extract_consensus(discussion_history)
-        return self.format_output(
+        final_result = self._extract_consensus(memory, agreement)
+        output = self.format_output(
             final_result["signal"],
             final_result["confidence"],
             final_result["reasoning"],
         )
+        output["rounds"] = records
+        output["rounds_used"] = len(records)
+        return output
 
-    def _extract_consensus(self, history: List[Dict]) -> Dict:
-        if not history:
-            return {"signal": "HOLD", "confidence": 0.5, "reasoning": "No discussion"}
+    def _parse_round(self, content: str) -> Dict:
+        return self.parse_json(content, {}, fields=ROUND_FIELDS)
 
-        last_round = history[-1]["summary"]
-        try:
-            return json.loads(last_round)
-        except:
-            return {"signal": "HOLD", "confidence": 0.5, "reasoning": last_round}
+    def _extract_consensus(self, memory: DiscussionMemory, agreement: Dict) -> Dict:
+        if not memory.positions:
+            return {
+                "signal": agreement["signal"],
+                "confidence": agreement["confidence"],
+                "reasoning": "讨论未完成，采用各Agent加权投票结果",
+            }
+
+        last = memory.positions[-1]
+        signal = normalize_signal(last["consensus"])
+        confidence = normalize_confidence(last["confidence"])
+        if signal is None or confidence is None:
+            # 结论不是合法的信号或置信度，写库和后续格式化都会出错
+            return {
+                "signal": agreement["signal"],
+                "confidence": agreement["confidence"],
+                "reasoning": "讨论结论无效，采用各Agent加权投票结果",
+            }
+        return {
+            "signal": signal,
+            "confidence": confidence,
+            "reasoning": memory.summary or "；".join(memory.key_points),
+        }
 
 
 class ReflectionAgent(BaseAgent):
     def __init__(self):
         super().__init__("ReflectionAgent", "gpt-4", 1.0)
-        self.llm = ChatOpenAI(model="gpt-4", temperature=0.3)
+        self.llm = create_llm("openai", "gpt-4", 0.3, self.name)
+        self.backup_llm = backup_llm("openai", 0.3, self.name)
+
+    async def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.reflect(
+            data.get("signal", {}), data.get("historical_performance", [])
+        )
 
     async def reflect(
         self, signal_data: Dict, historical_performance: List[Dict]
@@ -133,22 +304,24 @@ class ReflectionAgent(BaseAgent):
             ]
         )
 
-        chain = prompt | self.llm
-        response = await chain.ainvoke(
+        content = await self.invoke_llm(
+            prompt,
             {
-                "signal": json.dumps(signal_data, ensure_ascii=False),
+                "signal": json.dumps(_stable(signal_data), ensure_ascii=False),
                 "performance": json.dumps(historical_performance, ensure_ascii=False),
-            }
+            },
+            fields=REFLECTION_FIELDS,
         )
 
-        return self._parse_response(response.content)
+        return self._parse_response(content)
 
     def _parse_response(self, content: str) -> Dict:
-        try:
-            return json.loads(content)
-        except:
-            return {
+        return self.parse_json(
+            content,
+            {
                 "adjusted_confidence": 0.5,
                 "weight_adjustments": {},
                 "insights": content,
-            }
+            },
+            fields=REFLECTION_FIELDS,
+        )
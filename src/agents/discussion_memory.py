@@ -0,0 +1,186 @@
+import asyncio
+import json
+import re
+import time
+from typing import Dict, List, Optional
+
+CJK_RE = re.compile(r"[一-鿿]")
+
+# 单条要点或分歧的 token 上限
+ITEM_TOKENS = 80
+
+
+# 加载 tiktoken 编码器失败后，间隔多少秒再重试（期间使用估算）
+ENCODING_RETRY_SECONDS = 600
+
+# 模型名 -> 已加载的 tiktoken 编码器
+_ENCODINGS: Dict[str, object] = {}
+# 模型名 -> 进行中的加载任务，并发的讨论共用同一次加载
+_LOADING: Dict[str, asyncio.Task] = {}
+# 模型名 -> 上次加载失败的时间
+_FAILED_AT: Dict[str, float] = {}
+
+
+def _load_encoding(model: str):
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"tiktoken 不可用，改用估算 token 数: {e}")
+        return None
+
+
+async def _load(model: str):
+    try:
+        encoding = await asyncio.to_thread(_load_encoding, model)
+    finally:
+        _LOADING.pop(model, None)
+    if encoding is None:
+        _FAILED_AT[model] = time.monotonic()
+    else:
+        _ENCODINGS[model] = encoding
+    return encoding
+
+
+async def load_encoding(model: str):
+    """在线程中加载 tiktoken 编码器，返回编码器或 None
+
+    首次加载可能要下载词表，不能在事件循环里同步进行；加载完成前
+    count_tokens 使用估算值。失败后 ENCODING_RETRY_SECONDS 秒内不再重试。
+    """
+    if model in _ENCODINGS:
+        return _ENCODINGS[model]
+    failed_at = _FAILED_AT.get(model)
+    if failed_at is not None and time.monotonic() - failed_at < ENCODING_RETRY_SECONDS:
+        return None
+    task = _LOADING.get(model)
+    # 上一个事件循环（如另一次 asyncio.run）遗留的任务不能复用
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = _LOADING[model] = asyncio.ensure_future(_load(model))
+    # 某个讨论被取消时不取消共用的加载
+    return await asyncio.shield(task)
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """计算文本的 token 数；编码器未加载时中文按每字一个、其余按每 4 个字符一个估算"""
+    encoding = _ENCODINGS.get(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    cjk = len(CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_tokens(text: str, budget: int, model: str = "gpt-4") -> str:
+    """截断文本使其不超过 budget 个 token"""
+    if count_tokens(text, model) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid] + "…", model) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "…"
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def compact_opinions(
+    results: List[Dict], budget: int, model: str = "gpt-4"
+) -> List[Dict]:
+    """各 Agent 观点只保留信号、置信度和推理，推理按人均预算截断"""
+    opinions = [
+        {
+            "agent": r.get("agent"),
+            "signal": r.get("signal"),
+            "confidence": r.get("confidence"),
+            "reasoning": str(r.get("reasoning") or ""),
+        }
+        for r in results
+    ]
+    if not opinions or count_tokens(_dumps(opinions), model) <= budget:
+        return opinions
+    overhead = count_tokens(_dumps([{**o, "reasoning": ""} for o in opinions]), model)
+    per_agent = max((budget - overhead) // len(opinions), 16)
+    return [
+        {**o, "reasoning": truncate_tokens(o["reasoning"], per_agent, model)}
+        for o in opinions
+    ]
+
+
+class DiscussionMemory:
+    """讨论主持人的跨轮记忆
+
+    每轮只保留主持人滚动更新的摘要、去重后的要点和最新一轮的分歧，
+    而不是累积各轮原始输出，因此提示词长度不随轮数增长。
+    渲染时按 token 预算裁剪：先丢最早的要点，再丢靠后的分歧，最后截断摘要。
+    """
+
+    def __init__(self, budget: int = 600, model: str = "gpt-4", max_points: int = 10):
+        self.budget = budget
+        self.model = model
+        self.max_points = max_points
+        self.summary = ""
+        self.key_points: List[str] = []
+        self.disagreements: List[str] = []
+        self.positions: List[Dict] = []  # 每轮的 (共识, 置信度)
+
+    def add_round(self, round_num: int, parsed: Dict, raw: Optional[str] = None):
+        """合并一轮主持人输出；无法解析时以原文开头作为摘要"""
+        self.summary = str(parsed.get("summary") or self.summary or (raw or "")[:500])
+        for point in parsed.get("key_points") or []:
+            point = truncate_tokens(str(point), ITEM_TOKENS, self.model)
+            if point in self.key_points:
+                self.key_points.remove(point)
+            self.key_points.append(point)
+        self.key_points = self.key_points[-self.max_points :]
+        # 分歧只反映当前状态，已化解的不再保留
+        self.disagreements = [
+            truncate_tokens(str(d), ITEM_TOKENS, self.model)
+            for d in (parsed.get("disagreements") or [])[: self.max_points]
+        ]
+        self.positions.append(
+            {
+                "round": round_num,
+                "consensus": parsed.get("consensus"),
+                "confidence": parsed.get("confidence"),
+            }
+        )
+
+    def _payload(self, key_points: List[str], disagreements: List[str], summary: str):
+        return {
+            "summary": summary,
+            "positions": self.positions[-3:],
+            "key_points": key_points,
+            "disagreements": disagreements,
+        }
+
+    def render(self) -> str:
+        """渲染为提示词中的历史讨论部分，保证不超过 token 预算"""
+        if not self.positions:
+            return "（首轮，无历史讨论）"
+        key_points, disagreements = list(self.key_points), list(self.disagreements)
+        summary = self.summary
+        while True:
+            text = _dumps(self._payload(key_points, disagreements, summary))
+            if count_tokens(text, self.model) <= self.budget:
+                return text
+            if key_points:
+                key_points.pop(0)
+            elif len(disagreements) > 1:
+                disagreements.pop()
+            else:
+                overhead = count_tokens(
+                    _dumps(self._payload([], disagreements, "")), self.model
+                )
+                summary = truncate_tokens(
+                    summary, max(self.budget - overhead, 16), self.model
+                )
+                return _dumps(self._payload([], disagreements, summary))
@@ -0,0 +1,354 @@
+import copy
+from collections import deque
+from typing import Dict, Optional, Tuple
+import numpy as np
+from ..candle_batch import CandleBatch
+
+DEFAULT_PARAMS = {
+    "sma": 20,
+    "ema_fast": 12,
+    "ema_slow": 26,
+    "macd_signal": 9,
+    "rsi": 14,
+    "bb": 20,
+    "bb_k": 2.0,
+    "atr": 14,
+    "vwap": 20,
+}
+
+# 分块递推 EMA 的块大小，块内 (1-alpha)^-k 的量级需留在 float64 范围内
+EWM_BLOCK = 128
+
+
+def ewm(x: np.ndarray, alpha: float, init: float = None) -> np.ndarray:
+    """y[t] = (1 - alpha) * y[t-1] + alpha * x[t]，y[-1] = init（默认 x[0]）
+
+    按块向量化：块内用 y[k] = d^(k+1) * y0 + alpha * d^k * cumsum(x[j] / d^j) 闭式计算，
+    块间只传递最后一个值。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if alpha >= 1:
+        # y[t] = x[t]；此时 decay 为 0，块内除以 d^j 会得到 inf/NaN
+        return x.copy()
+    y = np.empty_like(x)
+    if not len(x):
+        return y
+    prev = x[0] if init is None else init
+    decay = 1.0 - alpha
+    for start in range(0, len(x), EWM_BLOCK):
+        block = x[start : start + EWM_BLOCK]
+        powers = decay ** np.arange(len(block))
+        values = decay * powers * prev + alpha * powers * np.cumsum(block / powers)
+        y[start : start + len(block)] = values
+        prev = values[-1]
+    return y
+
+
+def rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """长度不足 window 的位置为 NaN"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        c = np.cumsum(np.insert(np.asarray(x, dtype=np.float64), 0, 0.0))
+        out[window - 1 :] = c[window:] - c[:-window]
+    return out
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    prev_close = np.concatenate([[close[0]], close[:-1]])
+    tr = np.maximum(high - low, np.abs(high - prev_close))
+    tr = np.maximum(tr, np.abs(low - prev_close))
+    tr[0] = high[0] - low[0]
+    return tr
+
+
+# 递推所需、但不作为指标输出的中间序列
+INTERNAL_SERIES = ["avg_gain", "avg_loss"]
+
+
+def compute_indicators(
+    candles: CandleBatch, params: Dict = None
+) -> Dict[str, np.ndarray]:
+    """对整段K线向量化计算全部指标序列，与 IndicatorState 的逐根递推结果一致"""
+    series = _series(candles, {**DEFAULT_PARAMS, **(params or {})})
+    return {k: v for k, v in series.items() if k not in INTERNAL_SERIES}
+
+
+def _series(candles: CandleBatch, p: Dict) -> Dict[str, np.ndarray]:
+    close, high, low = candles.close, candles.high, candles.low
+    volume = candles.volume
+
+    ema_fast = ewm(close, 2 / (p["ema_fast"] + 1))
+    ema_slow = ewm(close, 2 / (p["ema_slow"] + 1))
+    macd = ema_fast - ema_slow
+    macd_signal = ewm(macd, 2 / (p["macd_signal"] + 1))
+
+    delta = np.diff(close, prepend=close[0])
+    avg_gain = ewm(np.clip(delta, 0, None), 1 / p["rsi"], init=0.0)
+    avg_loss = ewm(np.clip(-delta, 0, None), 1 / p["rsi"], init=0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(
+            avg_loss == 0,
+            np.where(avg_gain == 0, 50.0, 100.0),
+            100 - 100 / (1 + avg_gain / avg_loss),
+        )
+
+    n = p["bb"]
+    bb_middle = rolling_sum(close, n) / n
+    bb_var = np.maximum(rolling_sum(close**2, n) / n - bb_middle**2, 0)
+    bb_std = np.sqrt(bb_var)
+
+    typical = (high + low + close) / 3
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vwap = rolling_sum(typical * volume, p["vwap"]) / rolling_sum(
+            volume, p["vwap"]
+        )
+
+    return {
+        "sma": rolling_sum(close, p["sma"]) / p["sma"],
+        "ema_fast": ema_fast,
+        "ema_slow": ema_slow,
+        "macd": macd,
+        "macd_signal": macd_signal,
+        "macd_hist": macd - macd_signal,
+        "rsi": rsi,
+        "bb_upper": bb_middle + p["bb_k"] * bb_std,
+        "bb_middle": bb_middle,
+        "bb_lower": bb_middle - p["bb_k"] * bb_std,
+        "atr": ewm(true_range(high, low, close), 1 / p["atr"]),
+        "obv": np.cumsum(np.sign(delta) * volume),
+        "vwap": vwap,
+        "avg_gain": avg_gain,
+        "avg_loss": avg_loss,
+    }
+
+
+class _Window:
+    """定长滑动窗口，维护窗口内的和"""
+
+    def __init__(self, size: int, values=()):
+        self.values = deque(values, maxlen=size)
+        self.total = float(sum(self.values))
+
+    def copy(self) -> "_Window":
+        return _Window(self.values.maxlen, self.values)
+
+    def push(self, value: float):
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) == self.values.maxlen
+
+
+class IndicatorState:
+    """单个 (symbol, timeframe) 的指标递推状态，每根新K线 O(1) 更新"""
+
+    WINDOWS = ["sma", "bb", "bb_sq", "pv", "vol"]
+
+    def __init__(self, params: Dict = None):
+        self.p = {**DEFAULT_PARAMS, **(params or {})}
+        self.last_bar: Optional[Tuple] = None  # (ts, open, high, low, close, volume)
+        self.prev: Optional["IndicatorState"] = None  # 应用最后一根K线之前的状态
+        self.ema_fast = self.ema_slow = self.macd_signal = None
+        self.avg_gain = self.avg_loss = 0.0
+        self.atr = None
+        self.obv = 0.0
+        self.sma = _Window(self.p["sma"])
+        self.bb = _Window(self.p["bb"])
+        self.bb_sq = _Window(self.p["bb"])
+        self.pv = _Window(self.p["vwap"])
+        self.vol = _Window(self.p["vwap"])
+
+    def _clone(self) -> "IndicatorState":
+        clone = copy.copy(self)
+        clone.prev = None
+        for name in self.WINDOWS:
+            setattr(clone, name, getattr(self, name).copy())
+        return clone
+
+    def push(
+        self,
+        ts: int,
+        open_: float,
+        high: float,
+        low: float,
+        close: float,
+        volume: float,
+    ):
+        self.prev = self._clone()
+        p = self.p
+        prev_close = self.last_bar[4] if self.last_bar else close
+
+        def step(prev, value, alpha):
+            return value if prev is None else prev + alpha * (value - prev)
+
+        self.ema_fast = step(self.ema_fast, close, 2 / (p["ema_fast"] + 1))
+        self.ema_slow = step(self.ema_slow, close, 2 / (p["ema_slow"] + 1))
+        macd = self.ema_fast - self.ema_slow
+        self.macd_signal = step(self.macd_signal, macd, 2 / (p["macd_signal"] + 1))
+
+        delta = close - prev_close
+        self.avg_gain += (max(delta, 0.0) - self.avg_gain) / p["rsi"]
+        self.avg_loss += (max(-delta, 0.0) - self.avg_loss) / p["rsi"]
+
+        tr = (
+            max(high - low, abs(high - prev_close), abs(low - prev_close))
+            if self.last_bar
+            else high - low
+        )
+        self.atr = step(self.atr, tr, 1 / p["atr"])
+        self.obv += float(np.sign(delta)) * volume
+
+        self.sma.push(close)
+        self.bb.push(close)
+        self.bb_sq.push(close * close)
+        self.pv.push((high + low + close) / 3 * volume)
+        self.vol.push(volume)
+        self.last_bar = (ts, open_, high, low, close, volume)
+
+    def rollback(self):
+        """撤销最后一根K线（未收盘K线被更新时先撤销再重新应用）"""
+        if self.prev is not None:
+            self.__dict__.update(self.prev.__dict__)
+            self.prev = None
+
+    def snapshot(self) -> Dict[str, float]:
+        p = self.p
+        nan = float("nan")
+        macd = self.ema_fast - self.ema_slow
+        if self.avg_loss == 0:
+            rsi = 50.0 if self.avg_gain == 0 else 100.0
+        else:
+            rsi = 100 - 100 / (1 + self.avg_gain / self.avg_loss)
+        bb_middle = self.bb.total / p["bb"] if self.bb.full else nan
+        bb_std = (
+            np.sqrt(max(self.bb_sq.total / p["bb"] - bb_middle**2, 0))
+            if self.bb.full
+            else nan
+        )
+        return {
+            "sma": self.sma.total / p["sma"] if self.sma.full else nan,
+            "ema_fast": self.ema_fast,
+            "ema_slow": self.ema_slow,
+            "macd": macd,
+            "macd_signal": self.macd_signal,
+            "macd_hist": macd - self.macd_signal,
+            "rsi": rsi,
+            "bb_upper": bb_middle + p["bb_k"] * bb_std,
+            "bb_middle": bb_middle,
+            "bb_lower": bb_middle - p["bb_k"] * bb_std,
+            "atr": self.atr,
+            "obv": float(self.obv),
+            "vwap": (
+                self.pv.total / self.vol.total
+                if self.vol.full and self.vol.total
+                else nan
+            ),
+        }
+
+    @classmethod
+    def seed(cls, candles: CandleBatch, params: Dict = None) -> "IndicatorState":
+        """用一段历史K线初始化状态
+
+        除最后一根外向量化计算后取末值，最后一根逐根递推，以便其更新时可以撤销。
+        """
+        state = cls(params)
+        head = candles.take(slice(0, len(candles) - 1))
+        if len(head):
+            p = state.p
+            series = _series(head, p)
+            for name in ["ema_fast", "ema_slow", "macd_signal", "avg_gain", "avg_loss"]:
+                setattr(state, name, float(series[name][-1]))
+            state.atr = float(series["atr"][-1])
+            state.obv = float(series["obv"][-1])
+
+            close = head.close
+            typical = (head.high + head.low + close) / 3
+            state.sma = _Window(p["sma"], close[-p["sma"] :].tolist())
+            state.bb = _Window(p["bb"], close[-p["bb"] :].tolist())
+            state.bb_sq = _Window(p["bb"], (close[-p["bb"] :] ** 2).tolist())
+            state.pv = _Window(
+                p["vwap"], (typical * head.volume)[-p["vwap"] :].tolist()
+            )
+            state.vol = _Window(p["vwap"], head.volume[-p["vwap"] :].tolist())
+            state.last_bar = (int(head.timestamp[-1]),) + tuple(
+                float(getattr(head, c)[-1])
+                for c in ["open", "high", "low", "close", "volume"]
+            )
+
+        i = len(candles) - 1
+        state.push(
+            int(candles.timestamp[i]),
+            float(candles.open[i]),
+            float(candles.high[i]),
+            float(candles.low[i]),
+            float(candles.close[i]),
+            float(candles.volume[i]),
+        )
+        return state
+
+
+class IndicatorEngine:
+    """按 (symbol, timeframe) 维护指标状态，供所有技术分析 Agent 共享
+
+    每次分析传入最近一段K线：与上次相比只新增了几根时逐根 O(1) 递推；
+    最后一根未收盘K线被更新时撤销后重新应用；衔接不上（首次、停机缺口）时整段重建。
+    """
+
+    def __init__(self, params: Dict = None):
+        self.params = params
+        self.states: Dict[Tuple[str, str], IndicatorState] = {}
+
+    def update(self, candles: CandleBatch) -> Dict[str, float]:
+        if not len(candles):
+            return {}
+        # 同一批中混有多个来源时，只取最后一根K线所属来源的序列
+        candles = candles.take(candles.source == candles.source[-1])
+        key = (candles.symbol[-1], candles.interval[-1])
+        state = self.states.get(key)
+
+        start = None
+        if state is not None and state.last_bar is not None:
+            matches = np.flatnonzero(candles.timestamp == state.last_bar[0])
+            if len(matches):
+                index = int(matches[0])
+                bar = tuple(
+                    float(getattr(candles, c)[index])
+                    for c in ["open", "high", "low", "close", "volume"]
+                )
+                if bar == tuple(state.last_bar[1:]):
+                    start = index + 1
+                elif state.prev is not None:
+                    state.rollback()
+                    start = index
+
+        if start is None:
+            state = self.states[key] = IndicatorState.seed(candles, self.params)
+        else:
+            for i in range(start, len(candles)):
+                state.push(
+                    int(candles.timestamp[i]),
+                    float(candles.open[i]),
+                    float(candles.high[i]),
+                    float(candles.low[i]),
+                    float(candles.close[i]),
+                    float(candles.volume[i]),
+                )
+        return self._with_changes(state.snapshot(), candles)
+
+    def _with_changes(self, values: Dict[str, float], candles: CandleBatch) -> Dict:
+        """附加最后一根K线的涨跌幅、量变和振幅"""
+        if len(candles) >= 2:
+            close, volume = candles.close, candles.volume
+            values["price_change"] = float((close[-1] - close[-2]) / close[-2] * 100)
+            if volume[-2]:
+                values["volume_change"] = float(
+                    (volume[-1] - volume[-2]) / volume[-2] * 100
+                )
+            values["high_low_range"] = float(
+                (candles.high[-1] - candles.low[-1]) / close[-1] * 100
+            )
+        return {k: round(float(v), 6) for k, v in values.items() if not np.isnan(v)}
@@ -0,0 +1,205 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import numpy as np
+from prometheus_client import Counter
+from ..config import get_config
+from ..data_collectors.resilience import TokenBucket
+
+LLM_CALL_EVENTS = Counter(
+    "llm_call_events_total",
+    "LLM 调用的超时、重试与对冲事件",
+    # event: retry / timeout / hedge（发出备用请求）/ hedge_win（备用请求先返回有效结果）
+    ["agent", "event"],
+)
+
+# 可重试的异常：网络、超时、限流和服务端错误。按类名匹配，不必导入各厂商 SDK
+TRANSIENT_ERRORS = {
+    "TimeoutError",
+    "APITimeoutError",
+    "APIConnectionError",
+    "RateLimitError",
+    "InternalServerError",
+    "ServiceUnavailable",
+    "ResourceExhausted",
+    "DeadlineExceeded",
+    "ConnectError",
+    "ReadTimeout",
+    "RemoteProtocolError",
+}
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+# 一次尝试的结果：(响应文本, 解析出的对象, 解析方式)
+Attempt = Tuple[str, Optional[Dict], str]
+
+
+class LLMDeadlineExceeded(asyncio.TimeoutError):
+    """Agent 的 LLM 调用在截止时间内没有得到响应"""
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if getattr(error, "status_code", None) in TRANSIENT_STATUS:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+def agent_deadline(agent: str) -> float:
+    """Agent 单次分析中 LLM 调用（含重试和对冲）的总时限，秒"""
+    return get_config(f"llm.deadlines.{agent}", get_config("llm.deadline", 60))
+
+
+class LatencyTracker:
+    """按 Agent 记录最近的成功调用耗时，用于计算对冲延迟"""
+
+    def __init__(self, window: int = 200):
+        self.samples: Dict[str, deque] = {}
+        self.window = window
+
+    def record(self, agent: str, seconds: float):
+        self.samples.setdefault(agent, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, agent: str) -> float:
+        """主请求耗时超过该值仍未返回时发出备用请求
+
+        样本足够时取 llm.hedge.percentile 分位数，否则用 llm.hedge.initial_delay。
+        """
+        samples = self.samples.get(agent, ())
+        if len(samples) < get_config("llm.hedge.min_samples", 20):
+            return get_config("llm.hedge.initial_delay", 20)
+        quantile = float(
+            np.quantile(list(samples), get_config("llm.hedge.percentile", 0.95))
+        )
+        return max(quantile, get_config("llm.hedge.min_delay", 2))
+
+
+latency_tracker = LatencyTracker()
+
+
+class LLMBudget:
+    """进程内所有 Agent、所有交易对共享的 LLM 调用预算
+
+    同时进行的请求不超过 max_concurrency 个；设置了 rate_per_minute 时，
+    每个请求还要从令牌桶取得一个令牌，最多积累 burst 个。重试和对冲请求各自计入，
+    等待预算的时间计入 Agent 的截止时间，退避等待期间不占用名额。
+    """
+
+    def __init__(
+        self, max_concurrency: int, rate_per_minute: float = None, burst: int = None
+    ):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.bucket = None
+        if rate_per_minute:
+            self.bucket = TokenBucket(rate_per_minute / 60, burst or max_concurrency)
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self.semaphore:
+            if self.bucket is not None:
+                await self.bucket.acquire()
+            yield
+
+
+@lru_cache()
+def get_llm_budget() -> LLMBudget:
+    return LLMBudget(
+        get_config("workflow.max_concurrency", 5),
+        get_config("workflow.llm_rate_per_minute"),
+        get_config("workflow.llm_burst"),
+    )
+
+
+async def _hedged(
+    agent: str,
+    run: Callable[[bool], Awaitable[Attempt]],
+    hedge: bool,
+) -> Attempt:
+    """先发主请求，超过对冲延迟仍未返回时再向备用模型发同样的请求，取先得到的有效结果
+
+    有效指解析出了所需字段；先返回的结果无效或出错时继续等待另一个。
+    """
+    started = time.monotonic()
+    primary = asyncio.ensure_future(run(False))
+    tasks = [primary]
+    try:
+        if hedge:
+            await asyncio.wait(tasks, timeout=latency_tracker.hedge_delay(agent))
+        if primary.done() or not hedge:
+            result = await primary
+            latency_tracker.record(agent, time.monotonic() - started)
+            return result
+
+        LLM_CALL_EVENTS.labels(agent, "hedge").inc()
+        backup = asyncio.ensure_future(run(True))
+        tasks.append(backup)
+        pending, fallback, error = set(tasks), None, None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                result = task.result()
+                if result[1] is None:
+                    fallback = fallback or result
+                    continue
+                if task is backup:
+                    LLM_CALL_EVENTS.labels(agent, "hedge_win").inc()
+                else:
+                    latency_tracker.record(agent, time.monotonic() - started)
+                return result
+        if fallback is not None:
+            return fallback
+        raise error
+    finally:
+        # 取得结果、出错或被截止时间取消时，都不再等待尚未完成的请求
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def call_with_policy(
+    agent: str,
+    run: Callable[[bool], Awaitable[Attempt]],
+    hedge: bool = False,
+) -> Attempt:
+    """在 Agent 的截止时间内调用 LLM
+
+    run(use_backup) 执行一次请求。瞬时错误按指数退避加抖动重试，最多 llm.retries 次，
+    等待时间不超过剩余时限；总耗时超过截止时间时抛出 LLMDeadlineExceeded。
+    """
+    deadline = agent_deadline(agent)
+    deadline_at = time.monotonic() + deadline
+    retries = get_config("llm.retries", 2)
+    backoff = get_config("llm.backoff", 1.0)
+
+    for attempt in range(retries + 1):
+        remaining = deadline_at - time.monotonic()
+        try:
+            return await asyncio.wait_for(_hedged(agent, run, hedge), remaining)
+        except asyncio.TimeoutError:
+            if time.monotonic() < deadline_at:
+                # 请求自身的超时，仍在时限内，可以重试
+                error = TimeoutError("LLM 请求超时")
+            else:
+                LLM_CALL_EVENTS.labels(agent, "timeout").inc()
+                raise LLMDeadlineExceeded(f"{agent} 超过 {deadline}s 截止时间")
+        except Exception as e:
+            error = e
+        if not is_transient(error) or attempt == retries:
+            raise error
+
+        delay = backoff * 2**attempt * random.uniform(0.5, 1.5)
+        if time.monotonic() + delay >= deadline_at:
+            LLM_CALL_EVENTS.labels(agent, "timeout").inc()
+            raise LLMDeadlineExceeded(f"{agent} 重试前已到 {deadline}s 截止时间")
+        LLM_CALL_EVENTS.labels(agent, "retry").inc()
+        print(f"{agent} LLM 调用失败，{delay:.1f}s 后重试: {error}")
+        await asyncio.sleep(delay)
@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Dict, List
+from langchain_core.messages import AIMessage, AIMessageChunk
+from .structured_output import chunk_text
+from ..config import get_config
+from ..services.llm_cache import make_key
+
+# 模型提供方式，由 LLM_PROVIDER 或 llm.provider 选择：
+#   live   直接调用 OpenAI / Gemini
+#   fake   本地生成确定性的 JSON 响应，延迟按配置的分布抽样，无需网络和密钥
+#   record 调用真实模型，并把每次响应写入 llm.fixtures_dir
+#   replay 只从 llm.fixtures_dir 读取录制的响应，没有录制时报错
+PROVIDER_MODES = ("live", "fake", "record", "replay")
+
+SIGNALS = ["BUY", "SELL", "HOLD"]
+
+
+class FixtureNotFound(LookupError):
+    """replay 模式下找不到与提示词对应的录制响应"""
+
+
+def provider_mode() -> str:
+    mode = os.getenv("LLM_PROVIDER", get_config("llm.provider", "live"))
+    if mode not in PROVIDER_MODES:
+        raise ValueError(f"未知的 LLM 提供方式: {mode}")
+    return mode
+
+
+def _fixtures_dir() -> str:
+    return os.getenv(
+        "LLM_FIXTURES_DIR", get_config("llm.fixtures_dir", "fixtures/llm")
+    )
+
+
+def _prompt_text(messages) -> str:
+    return "\n".join(f"{m.type}: {m.content}" for m in messages)
+
+
+def _chunks(text: str, size: int) -> List[str]:
+    return [text[i : i + size] for i in range(0, len(text), size)] or [""]
+
+
+class FakeChatModel:
+    """离线模型：响应和延迟都由 (种子, 模型, 提示词) 决定，相同输入每次结果相同
+
+    按提示词要求的 JSON 格式生成信号、讨论或反思结果；llm.fake.responses.<Agent>
+    中的字段会覆盖生成值。延迟从 llm.fake.latency.<provider> 的分布中抽样，
+    其中 ttft 比例的时间用于首个片段，其余均匀分摊到各流式片段。
+    """
+
+    def __init__(self, provider: str, model: str, temperature: float, agent: str = ""):
+        self.provider = provider
+        self.model_name = model
+        self.temperature = temperature
+        self.agent = agent
+        self.seed = get_config("llm.fake.seed", 0)
+
+    def _rng(self, messages) -> random.Random:
+        digest = hashlib.sha256(
+            f"{self.seed}|{self.model_name}|{_prompt_text(messages)}".encode()
+        ).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _latency(self, rng: random.Random) -> float:
+        spec = get_config(
+            f"llm.fake.latency.{self.provider}",
+            {"distribution": "lognormal", "median": 1.0, "sigma": 0.5},
+        )
+        distribution = spec.get("distribution", "lognormal")
+        if distribution == "fixed":
+            return float(spec.get("value", 1.0))
+        if distribution == "uniform":
+            return rng.uniform(spec.get("low", 0.5), spec.get("high", 2.0))
+        if distribution == "lognormal":
+            sigma = spec.get("sigma", 0.5)
+            return spec.get("median", 1.0) * rng.lognormvariate(0, sigma)
+        raise ValueError(f"未知的延迟分布: {distribution}")
+
+    def _respond(self, messages, rng: random.Random) -> str:
+        # 按系统提示中要求的返回格式决定生成哪种 JSON
+        system = "\n".join(str(m.content) for m in messages if m.type == "system")
+        confidence = round(rng.uniform(0.5, 0.95), 2)
+        filler = " ".join(
+            rng.choice(["趋势", "成交量", "支撑", "阻力", "情绪", "资金", "波动"])
+            for _ in range(get_config("llm.fake.reasoning_words", 40))
+        )
+        if '"signal"' in system:
+            value = {
+                "signal": rng.choice(SIGNALS),
+                "confidence": confidence,
+                "reasoning": filler,
+            }
+        elif '"consensus"' in system:
+            value = {
+                "consensus": rng.choice(SIGNALS),
+                "confidence": confidence,
+                "summary": filler[:150],
+                "key_points": [f"要点{i}" for i in range(rng.randint(1, 4))],
+                "disagreements": [f"分歧{i}" for i in range(rng.randint(0, 2))],
+            }
+        else:
+            value = {
+                "adjusted_confidence": confidence,
+                "weight_adjustments": {},
+                "insights": filler,
+            }
+        value.update(get_config(f"llm.fake.responses.{self.agent}", {}))
+        return json.dumps(value, ensure_ascii=False)
+
+    async def astream(self, messages):
+        rng = self._rng(messages)
+        text, latency = self._respond(messages, rng), self._latency(rng)
+        chunks = _chunks(text, get_config("llm.fake.chunk_chars", 16))
+        first = latency * get_config("llm.fake.ttft", 0.3)
+        await asyncio.sleep(first)
+        for chunk in chunks:
+            yield AIMessageChunk(content=chunk)
+            await asyncio.sleep((latency - first) / len(chunks))
+
+    async def ainvoke(self, messages) -> AIMessage:
+        rng = self._rng(messages)
+        text, latency = self._respond(messages, rng), self._latency(rng)
+        await asyncio.sleep(latency)
+        return AIMessage(content=text)
+
+
+def _fixture_path(model: str, temperature: float, messages) -> str:
+    return os.path.join(
+        _fixtures_dir(), f"{make_key(model, temperature, messages)}.json"
+    )
+
+
+class RecordingChatModel:
+    """调用真实模型，并按 (模型, 温度, 提示词) 把实际读到的响应和耗时写入录制目录
+
+    流式读取提前停止时只录制已读到的部分，回放时解析器会在同一位置停止，结果一致；
+    请求出错或被取消时不录制。
+    """
+
+    def __init__(self, llm, model: str, temperature: float):
+        self.llm = llm
+        self.model_name = model
+        self.temperature = temperature
+
+    def _save(self, messages, text: str, latency: float):
+        path = _fixture_path(self.model_name, self.temperature, messages)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model": self.model_name,
+                    "temperature": self.temperature,
+                    "messages": [(m.type, m.content) for m in messages],
+                    "response": text,
+                    "latency": round(latency, 3),
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+    async def astream(self, messages):
+        started, parts = time.monotonic(), []
+        stream = self.llm.astream(messages)
+        try:
+            async for chunk in stream:
+                parts.append(chunk_text(chunk.content))
+                yield chunk
+        except GeneratorExit:
+            # 解析器已读到所需字段而主动停止，录制已读到的部分
+            self._save(messages, "".join(parts), time.monotonic() - started)
+            raise
+        else:
+            self._save(messages, "".join(parts), time.monotonic() - started)
+        finally:
+            # 出错（如 429、5xx）或被取消（对冲落败、截止时间）时不录制，
+            # 否则回放时会读到截断的响应
+            await stream.aclose()
+
+    async def ainvoke(self, messages):
+        started = time.monotonic()
+        response = await self.llm.ainvoke(messages)
+        self._save(messages, chunk_text(response.content), time.monotonic() - started)
+        return response
+
+
+class ReplayChatModel:
+    """从录制目录读取响应；llm.replay.latency 为 true 时按录制时的耗时等待"""
+
+    def __init__(self, model: str, temperature: float):
+        self.model_name = model
+        self.temperature = temperature
+
+    async def _load(self, messages) -> Dict:
+        path = _fixture_path(self.model_name, self.temperature, messages)
+        if not os.path.exists(path):
+            raise FixtureNotFound(f"没有录制的响应: {path}")
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)
+        if get_config("llm.replay.latency", False):
+            await asyncio.sleep(fixture.get("latency", 0))
+        return fixture
+
+    async def astream(self, messages):
+        fixture = await self._load(messages)
+        size = get_config("llm.fake.chunk_chars", 16)
+        for chunk in _chunks(fixture["response"], size):
+            yield AIMessageChunk(content=chunk)
+
+    async def ainvoke(self, messages) -> AIMessage:
+        return AIMessage(content=(await self._load(messages))["response"])
+
+
+def _live_llm(provider: str, model: str, temperature: float):
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(model=model, temperature=temperature)
+    if provider == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(model=model, temperature=temperature)
+    raise ValueError(f"未知的模型提供商: {provider}")
+
+
+def create_llm(provider: str, model: str, temperature: float, agent: str = ""):
+    """按当前提供方式创建 Agent 使用的聊天模型
+
+    返回的对象都支持 astream / ainvoke，并带有 model_name 和 temperature，
+    因此 LLM 缓存的键与录制文件名在各种方式下一致。
+    """
+    mode = provider_mode()
+    if mode == "fake":
+        return FakeChatModel(provider, model, temperature, agent)
+    if mode == "replay":
+        return ReplayChatModel(model, temperature)
+    llm = _live_llm(provider, model, temperature)
+    if mode == "record":
+        return RecordingChatModel(llm, model, temperature)
+    return llm
+
+
+def backup_llm(provider: str, temperature: float, agent: str = ""):
+    """对冲用的备用模型：主模型来自 provider 时改用另一家的模型
+
+    llm.hedge.enabled 为 false 或未配置 llm.hedge.backup_models.<provider> 时返回 None。
+    """
+    model = get_config(f"llm.hedge.backup_models.{provider}")
+    if not model or not get_config("llm.hedge.enabled", True):
+        return None
+    other = "gemini" if provider == "openai" else "openai"
+    return create_llm(other, model, temperature, agent)
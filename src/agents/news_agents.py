@@ -1,14 +1,46 @@
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
 from .base_agent import BaseAgent
+from .llm_providers import backup_llm, create_llm
+from ..config import get_config
+from ..database.connection import get_async_db
+from ..services.embedding_service import (
+    get_embedding_backend,
+    news_text,
+    retrieve_similar_news,
+)
+from ..services.sentiment_service import aggregate_sentiment
 from typing import Dict, Any, List
+import json
+
+
+def _sentiment(data: Dict[str, Any]) -> str:
+    """工作流中已聚合好的情绪特征，单独调用 Agent 时现场聚合"""
+    sentiment = data.get("sentiment")
+    if sentiment is None:
+        sentiment = aggregate_sentiment(data.get("news", []))
+    return json.dumps(sentiment, ensure_ascii=False)
+
+
+def _headlines(news_list: List[Dict], limit: int = 10) -> str:
+    """最近的新闻标题，附入库时的情绪分数"""
+    lines = []
+    for n in news_list[:limit]:
+        score = n.get("sentiment_score")
+        prefix = f"[{score:+.2f}] " if score is not None else ""
+        lines.append(f"- {prefix}{n.get('title', '')}")
+    return "\n".join(lines)
+
+
+def _asset(data: Dict[str, Any]) -> str:
+    """交易对的基础币种，如 ETH/USDT -> ETH"""
+    return data.get("symbol", "BTC/USDT").split("/")[0]
 
 
 class NewsAgentOpenAI(BaseAgent):
     def __init__(self, weight: float = 0.4):
         super().__init__("NewsAgent-OpenAI", "gpt-4", weight)
-        self.llm = ChatOpenAI(model="gpt-4", temperature=0.3)
+        self.llm = create_llm("openai", "gpt-4", 0.3, self.name)
+        self.backup_llm = backup_llm("openai", 0.3, self.name)
 
     async def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
         news_list = data.get("news", [])
@@ -17,36 +49,43 @@ class NewsAgentOpenAI(BaseAgent):
             [
                 (
                     "system",
-                    """你是新闻情绪分析专家。分析比特币相关新闻的整体情绪和影响。
+                    """你是新闻情绪分析专家。分析近期加密货币新闻的整体情绪及其对 {asset} 的影响。
             返回JSON格式：{{"signal": "BUY/SELL/HOLD", "confidence": 0.75, "reasoning": "...", "sentiment": 0.6}}""",
                 ),
-                ("user", "新闻列表：\n{news_text}"),
+                (
+                    "user",
+                    "最近新闻（方括号内为情绪分数，-1 到 1）：\n{news_text}\n\n"
+                    "近期全部新闻按时间衰减聚合的情绪特征：\n{sentiment}",
+                ),
             ]
         )
 
-        news_text = "\n".join([f"- {n.get('title', '')}" for n in news_list[:10]])
-
-        chain = prompt | self.llm
-        response = await chain.ainvoke({"news_text": news_text})
+        content = await self.invoke_llm(
+            prompt,
+            {
+                "asset": _asset(data),
+                "news_text": _headlines(news_list),
+                "sentiment": _sentiment(data),
+            },
+            cap_field="reasoning",
+        )
 
-        result = self._parse_response(response.content)
+        result = self._parse_response(content)
         return self.format_output(
-            result["signal"], result["confidence"], result["reasoning"]
+            result["signal"], result["confidence"], result.get("reasoning", "")
         )
 
     def _parse_response(self, content: str) -> Dict:
-        import json
-
-        try:
-            return json.loads(content)
-        except:
-            return {"signal": "HOLD", "confidence": 0.5, "reasoning": content}
+        return self.parse_json(
+            content, {"signal": "HOLD", "confidence": 0.5, "reasoning": content}
+        )
 
 
 class NewsAgentGemini(BaseAgent):
     def __init__(self, weight: float = 0.4):
         super().__init__("NewsAgent-Gemini", "gemini-2.0-flash-exp", weight)
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-exp", temperature=0.3)
+        self.llm = create_llm("gemini", "gemini-2.0-flash-exp", 0.3, self.name)
+        self.backup_llm = backup_llm("gemini", 0.3, self.name)
 
     async def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
         news_list = data.get("news", [])
@@ -55,42 +94,86 @@ class NewsAgentGemini(BaseAgent):
             [
                 (
                     "system",
-                    """Analyze Bitcoin news sentiment and policy impact.
+                    """Analyze crypto news sentiment and policy impact on {asset}.
             Return JSON: {{"signal": "BUY/SELL/HOLD", "confidence": 0.75, "reasoning": "..."}}""",
                 ),
-                ("user", "News:\n{news_text}"),
+                (
+                    "user",
+                    "Recent news (sentiment score in brackets, -1 to 1):\n{news_text}"
+                    "\n\nTime-decayed sentiment features over all recent news:\n"
+                    "{sentiment}",
+                ),
             ]
         )
 
-        news_text = "\n".join([f"- {n.get('title', '')}" for n in news_list[:10]])
-
-        chain = prompt | self.llm
-        response = await chain.ainvoke({"news_text": news_text})
+        content = await self.invoke_llm(
+            prompt,
+            {
+                "asset": _asset(data),
+                "news_text": _headlines(news_list),
+                "sentiment": _sentiment(data),
+            },
+            cap_field="reasoning",
+        )
 
-        result = self._parse_response(response.content)
+        result = self._parse_response(content)
         return self.format_output(
-            result["signal"], result["confidence"], result["reasoning"]
+            result["signal"], result["confidence"], result.get("reasoning", "")
         )
 
     def _parse_response(self, content: str) -> Dict:
-        import json
-
-        try:
-            return json.loads(content)
-        except:
-            return {"signal": "HOLD", "confidence": 0.5, "reasoning": content}
+        return self.parse_json(
+            content, {"signal": "HOLD", "confidence": 0.5, "reasoning": content}
+        )
 
 
 class RAGAgent(BaseAgent):
+    """检索与当前新闻最相似的历史新闻，参考其后的价格走势给出信号"""
+
     def __init__(self, weight: float = 0.2):
         super().__init__("RAGAgent", "rag-retrieval", weight)
-        self.embeddings = OpenAIEmbeddings()
+        self.backend = get_embedding_backend()
 
-    async def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        # Simplified RAG - retrieve similar historical news
-        query = data.get("query", "Bitcoin market analysis")
+    async def embed_news(self, news_list: List[Dict]):
+        """最近新闻的检索向量；与交易对无关，工作流每个周期只计算一次"""
+        query = "\n".join(news_text(n) for n in news_list[:10])
+        return (await self.backend.embed([query]))[0]
 
-        # In production: query vector DB for similar historical contexts
-        return self.format_output(
-            "HOLD", 0.6, "Historical context suggests cautious approach"
+    async def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        news_list = data.get("news", [])
+        if not news_list:
+            return self.format_output("HOLD", 0.5, "没有可用于检索的新闻")
+
+        vector = data.get("news_vector")
+        if vector is None:
+            vector = await self.embed_news(news_list)
+        async with get_async_db() as db:
+            analogs = await retrieve_similar_news(db, vector, symbol=data.get("symbol"))
+
+        moves = [a for a in analogs if a["return"] is not None]
+        if not moves:
+            return self.format_output("HOLD", 0.5, "没有带后续行情的相似历史新闻")
+
+        # 按相似度加权的历史后续涨跌幅
+        weights = [max(a["similarity"], 0.0) for a in moves]
+        total = sum(weights) or len(moves)
+        expected = sum(w * a["return"] for w, a in zip(weights, moves)) / total
+
+        threshold = get_config("rag.return_threshold", 0.01)
+        if expected > threshold:
+            signal, agree = "BUY", [a["return"] > threshold for a in moves]
+        elif expected < -threshold:
+            signal, agree = "SELL", [a["return"] < -threshold for a in moves]
+        else:
+            signal, agree = "HOLD", [abs(a["return"]) <= threshold for a in moves]
+        confidence = round(0.4 + 0.5 * sum(agree) / len(moves), 4)
+
+        horizon = get_config("rag.horizon_hours", 24)
+        examples = "; ".join(
+            f"{a['title'][:60]} ({a['return']:+.2%})" for a in moves[:3]
+        )
+        reasoning = (
+            f"{len(moves)} 条相似历史新闻发布后 {horizon} 小时加权平均涨跌幅 "
+            f"{expected:+.2%}，{sum(agree)} 条与结论一致。例: {examples}"
         )
+        return self.format_output(signal, confidence, reasoning)
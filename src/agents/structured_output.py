@@ -0,0 +1,135 @@
+import json
+import re
+from typing import Dict, Optional, Sequence, Tuple
+from prometheus_client import Counter
+
+LLM_PARSE_RESULTS = Counter(
+    "llm_parse_results_total",
+    "LLM 结构化输出解析结果",
+    # result: json / extracted（从代码块或文字中提取）/ truncated（提前停止读取）/ failed
+    ["agent", "result"],
+)
+
+# 交易信号类 Agent 必须返回的字段
+SIGNAL_FIELDS = ("signal", "confidence")
+SIGNALS = {"BUY", "SELL", "HOLD"}
+
+FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+# 已经完整输出的标量值：字符串以引号闭合，数字后面已出现分隔符
+SCALAR_RE = r'"{}"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?=\s*[,}}])|true|false|null)'
+OPEN_STRING_RE = r'"{}"\s*:\s*"((?:[^"\\]|\\.)*)'
+
+
+def normalize_signal(value) -> Optional[str]:
+    """规范化模型给出的信号（如 "Buy"），不是 BUY/SELL/HOLD 之一时返回 None"""
+    signal = str(value or "").strip().upper()
+    return signal if signal in SIGNALS else None
+
+
+def normalize_confidence(value) -> Optional[float]:
+    """模型给出的置信度（可能是字符串）转为 [0, 1] 内的浮点数，无法转换时返回 None"""
+    try:
+        confidence = float(value)
+    except (TypeError, ValueError):
+        return None
+    if confidence != confidence:  # NaN
+        return None
+    return min(max(confidence, 0.0), 1.0)
+
+
+def chunk_text(content) -> str:
+    """流式响应块的文本；部分模型以内容片段列表返回"""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for part in content or []
+    )
+
+
+def extract_json(text: str) -> Tuple[Optional[Dict], str]:
+    """从 LLM 输出中提取 JSON 对象，返回 (对象, 解析方式)
+
+    依次尝试整体解析、```json 代码块、正文中第一个可解析的 {...}，都失败时返回 (None, "failed")。
+    """
+    text = (text or "").strip()
+    try:
+        value = json.loads(text)
+        if isinstance(value, dict):
+            return value, "json"
+    except ValueError:
+        pass
+
+    decoder = json.JSONDecoder()
+    candidates = [m.strip() for m in FENCE_RE.findall(text)] + [text]
+    for candidate in candidates:
+        for match in re.finditer(r"\{", candidate):
+            try:
+                value, _ = decoder.raw_decode(candidate, match.start())
+            except ValueError:
+                continue
+            if isinstance(value, dict):
+                return value, "extracted"
+    return None, "failed"
+
+
+def _decode_partial(raw: str) -> str:
+    """解码未闭合的 JSON 字符串片段，去掉末尾不完整的转义"""
+    raw = re.sub(r"\\(u[0-9a-fA-F]{0,3})?$", "", raw)
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return raw
+
+
+class StreamingJSONParser:
+    """逐块接收流式输出并增量识别 JSON 字段
+
+    fields 中的字段都已完整、且 cap_field 已读到 cap 个字符时 feed 返回 True，
+    调用方即可停止读取；finish 用已读到的内容组装结果，cap_field 截断在 cap 处。
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[str] = SIGNAL_FIELDS,
+        cap_field: str = None,
+        cap: int = None,
+    ):
+        self.fields = tuple(fields)
+        self.cap_field = cap_field
+        self.cap = cap
+        self.text = ""
+        self.stopped = False
+
+    def _scalars(self) -> Dict:
+        values = {}
+        for field in self.fields:
+            match = re.search(SCALAR_RE.format(re.escape(field)), self.text)
+            if match:
+                values[field] = json.loads(match.group(1))
+        return values
+
+    def _partial(self) -> Optional[str]:
+        match = re.search(OPEN_STRING_RE.format(re.escape(self.cap_field)), self.text)
+        return _decode_partial(match.group(1)) if match else None
+
+    def feed(self, chunk: str) -> bool:
+        self.text += chunk
+        if not self.cap_field or not self.cap:
+            return False
+        partial = self._partial()
+        if partial is None or len(partial) < self.cap:
+            return False
+        self.stopped = len(self._scalars()) == len(self.fields)
+        return self.stopped
+
+    def finish(self) -> Tuple[Optional[Dict], str]:
+        value, status = extract_json(self.text)
+        if value is not None and all(f in value for f in self.fields):
+            return value, status
+        if self.stopped:
+            return {
+                **self._scalars(),
+                self.cap_field: self._partial()[: self.cap],
+            }, "truncated"
+        return None, "failed"
@@ -1,24 +1,44 @@
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
 from .base_agent import BaseAgent
+from .indicators import IndicatorEngine
+from .llm_providers import backup_llm, create_llm
+from ..candle_batch import CandleBatch
 from typing import Dict, Any
-import pandas as pd
+import json
+
+
+def _indicators(data: Dict[str, Any], candles: CandleBatch) -> Dict:
+    """优先使用工作流中共享引擎算好的指标，单独调用 Agent 时现场计算"""
+    if "indicators" in data:
+        return data["indicators"]
+    return IndicatorEngine().update(candles)
+
+
+def _symbol(data: Dict[str, Any], candles: CandleBatch) -> str:
+    if data.get("symbol"):
+        return data["symbol"]
+    return candles.symbol[-1] if len(candles) else "BTC/USDT"
+
+
+def _market(data: Dict[str, Any]) -> str:
+    """工作流快照中该交易对相对基准资产和观察列表的表现"""
+    return json.dumps(data.get("market", {}), ensure_ascii=False)
 
 
 class TechAgentOpenAI(BaseAgent):
     def __init__(self, weight: float = 0.5):
         super().__init__("TechAgent-OpenAI", "gpt-4", weight)
-        self.llm = ChatOpenAI(model="gpt-4", temperature=0.3)
+        self.llm = create_llm("openai", "gpt-4", 0.3, self.name)
+        self.backup_llm = backup_llm("openai", 0.3, self.name)
 
     async def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        price_df = pd.DataFrame(data.get("prices", []))
+        candles = data.get("prices") or CandleBatch.empty()
 
         prompt = ChatPromptTemplate.from_messages(
             [
                 (
                     "system",
-                    """你是一位专业的比特币技术分析师。基于提供的价格数据和技术指标，
+                    """你是一位专业的加密货币技术分析师。基于提供的 {symbol} 价格数据、技术指标和市场背景，
             分析当前市场趋势并给出交易建议（BUY/SELL/HOLD）。
             
             请提供：
@@ -28,83 +48,80 @@ class TechAgentOpenAI(BaseAgent):
             
             以JSON格式返回：{{"signal": "BUY/SELL/HOLD", "confidence": 0.85, "reasoning": "..."}}""",
                 ),
-                ("user", "价格数据：\n{price_data}\n\n技术指标：\n{indicators}"),
+                (
+                    "user",
+                    "价格数据：\n{price_data}\n\n技术指标：\n{indicators}\n\n"
+                    "市场背景（相对基准资产和观察列表）：\n{market}",
+                ),
             ]
         )
 
-        indicators = self._calculate_indicators(price_df)
-
-        chain = prompt | self.llm
-        response = await chain.ainvoke(
-            {"price_data": price_df.tail(10).to_string(), "indicators": str(indicators)}
+        indicators = _indicators(data, candles)
+
+        content = await self.invoke_llm(
+            prompt,
+            {
+                "symbol": _symbol(data, candles),
+                "price_data": candles.tail(10).to_frame().to_string(),
+                "indicators": str(indicators),
+                "market": _market(data),
+            },
+            cap_field="reasoning",
         )
 
         # Parse response
-        result = self._parse_response(response.content)
+        result = self._parse_response(content)
         return self.format_output(
-            result["signal"], result["confidence"], result["reasoning"]
+            result["signal"], result["confidence"], result.get("reasoning", "")
         )
 
-    def _calculate_indicators(self, df: pd.DataFrame) -> Dict:
-        if df.empty or len(df) < 2:
-            return {}
-
-        # Simple indicators
-        latest = df.iloc[-1]
-        prev = df.iloc[-2]
-
-        return {
-            "price_change": float(
-                (latest["close"] - prev["close"]) / prev["close"] * 100
-            ),
-            "volume_change": float(
-                (latest["volume"] - prev["volume"]) / prev["volume"] * 100
-            ),
-            "high_low_range": float(
-                (latest["high"] - latest["low"]) / latest["close"] * 100
-            ),
-        }
-
     def _parse_response(self, content: str) -> Dict:
-        import json
-
-        try:
-            return json.loads(content)
-        except:
-            return {"signal": "HOLD", "confidence": 0.5, "reasoning": content}
+        return self.parse_json(
+            content, {"signal": "HOLD", "confidence": 0.5, "reasoning": content}
+        )
 
 
 class TechAgentGemini(BaseAgent):
     def __init__(self, weight: float = 0.5):
         super().__init__("TechAgent-Gemini", "gemini-2.0-flash-exp", weight)
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-exp", temperature=0.3)
+        self.llm = create_llm("gemini", "gemini-2.0-flash-exp", 0.3, self.name)
+        self.backup_llm = backup_llm("gemini", 0.3, self.name)
 
     async def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        price_df = pd.DataFrame(data.get("prices", []))
+        candles = data.get("prices") or CandleBatch.empty()
 
         prompt = ChatPromptTemplate.from_messages(
             [
                 (
                     "system",
-                    """You are a Bitcoin technical analyst. Analyze price trends and patterns.
+                    """You are a crypto technical analyst covering {symbol}. Analyze price trends and patterns.
             Return JSON: {{"signal": "BUY/SELL/HOLD", "confidence": 0.85, "reasoning": "..."}}""",
                 ),
-                ("user", "Price data:\n{price_data}"),
+                (
+                    "user",
+                    "Price data:\n{price_data}\n\nIndicators:\n{indicators}\n\n"
+                    "Market context (vs. benchmark and watchlist):\n{market}",
+                ),
             ]
         )
 
-        chain = prompt | self.llm
-        response = await chain.ainvoke({"price_data": price_df.tail(10).to_string()})
+        content = await self.invoke_llm(
+            prompt,
+            {
+                "symbol": _symbol(data, candles),
+                "price_data": candles.tail(10).to_frame().to_string(),
+                "indicators": str(_indicators(data, candles)),
+                "market": _market(data),
+            },
+            cap_field="reasoning",
+        )
 
-        result = self._parse_response(response.content)
+        result = self._parse_response(content)
         return self.format_output(
-            result["signal"], result["confidence"], result["reasoning"]
+            result["signal"], result["confidence"], result.get("reasoning", "")
         )
 
     def _parse_response(self, content: str) -> Dict:
-        import json
-
-        try:
-            return json.loads(content)
-        except:
-            return {"signal": "HOLD", "confidence": 0.5, "reasoning": content}
+        return self.parse_json(
+            content, {"signal": "HOLD", "confidence": 0.5, "reasoning": content}
+        )
@@ -0,0 +1,175 @@
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Sequence
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume"]
+LABEL_COLUMNS = ["source", "symbol", "interval"]
+
+# 统一周期名 -> 毫秒
+INTERVAL_MS = {
+    "1m": 60_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "1h": 3_600_000,
+    "4h": 14_400_000,
+    "1d": 86_400_000,
+}
+
+
+@dataclass
+class CandleBatch:
+    """列式K线批次
+
+    时间戳为 int64 毫秒 (UTC)，OHLCV 为 float64，来源/交易对/周期为 object 数组。
+    采集、落库和各技术分析 Agent 之间直接传递该类型，避免逐行构造 dict 和 Decimal。
+    放在包顶层，供采集层和数据库层共同使用。
+
+    注意 float64 只能精确保留约 15 位有效数字：交易所返回的十进制字符串超过
+    15 位时（如大额成交量带 8 位小数），写入 DECIMAL(18,8) 的是舍入后的值，
+    末位可能与交易所不一致。分析只用到价格的相对变化，这一误差可以忽略。
+    """
+
+    timestamp: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    source: np.ndarray
+    symbol: np.ndarray
+    interval: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    @classmethod
+    def empty(cls) -> "CandleBatch":
+        return cls(
+            timestamp=np.empty(0, dtype=np.int64),
+            **{c: np.empty(0, dtype=np.float64) for c in PRICE_COLUMNS},
+            **{c: np.empty(0, dtype=object) for c in LABEL_COLUMNS},
+        )
+
+    @classmethod
+    def from_rows(
+        cls, rows: Sequence[Sequence], source: str, symbol: str, interval: str
+    ) -> "CandleBatch":
+        """从交易所原始K线数组构造，前 6 列依次为 ts/open/high/low/close/volume
+
+        OKX 与 Binance REST 返回的格式都满足这一约定。
+        """
+        if not rows:
+            return cls.empty()
+        table = np.asarray([row[:6] for row in rows], dtype=object)
+        n = len(table)
+        return cls(
+            timestamp=table[:, 0].astype(np.int64),
+            **{
+                c: table[:, i + 1].astype(np.float64)
+                for i, c in enumerate(PRICE_COLUMNS)
+            },
+            source=np.full(n, source, dtype=object),
+            symbol=np.full(n, symbol, dtype=object),
+            interval=np.full(n, interval, dtype=object),
+        )
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> "CandleBatch":
+        """从 dict 列表构造，timestamp 可以是 datetime 或毫秒整数"""
+        records = list(records)
+        if not records:
+            return cls.empty()
+        return cls(
+            timestamp=np.array(
+                [_to_ms(r["timestamp"]) for r in records], dtype=np.int64
+            ),
+            **{
+                c: np.array([r[c] for r in records], dtype=np.float64)
+                for c in PRICE_COLUMNS
+            },
+            source=np.array([r["source"] for r in records], dtype=object),
+            symbol=np.array([r["symbol"] for r in records], dtype=object),
+            interval=np.array(
+                [r.get("interval", "1h") for r in records], dtype=object
+            ),
+        )
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray]) -> "CandleBatch":
+        """从按列的数组构造（如 database.readers 的查询结果），不逐行转换"""
+        if not len(columns.get("timestamp", ())):
+            return cls.empty()
+        return cls(
+            timestamp=np.asarray(columns["timestamp"], dtype=np.int64),
+            **{c: np.asarray(columns[c], dtype=np.float64) for c in PRICE_COLUMNS},
+            **{c: np.asarray(columns[c], dtype=object) for c in LABEL_COLUMNS},
+        )
+
+    @classmethod
+    def concat(cls, batches: Iterable["CandleBatch"]) -> "CandleBatch":
+        batches = [b for b in batches if b is not None and len(b)]
+        if not batches:
+            return cls.empty()
+        return cls(
+            **{
+                f.name: np.concatenate([getattr(b, f.name) for b in batches])
+                for f in fields(cls)
+            }
+        )
+
+    def take(self, index) -> "CandleBatch":
+        """按布尔掩码或下标数组选取行"""
+        return CandleBatch(
+            **{f.name: getattr(self, f.name)[index] for f in fields(self)}
+        )
+
+    def tail(self, n: int) -> "CandleBatch":
+        return self.take(slice(max(len(self) - n, 0), None))
+
+    def sort(self) -> "CandleBatch":
+        return self.take(np.argsort(self.timestamp, kind="stable"))
+
+    def deduplicate(self) -> "CandleBatch":
+        """按 (symbol, source, interval, timestamp) 去重，保留最后出现的一行"""
+        if len(self) < 2:
+            return self
+        keys = pd.MultiIndex.from_arrays(
+            [self.symbol, self.source, self.interval, self.timestamp]
+        )
+        return self.take(~keys.duplicated(keep="last"))
+
+    @property
+    def datetimes(self) -> List[datetime]:
+        return [
+            datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
+            for ts in self.timestamp.tolist()
+        ]
+
+    def to_records(self) -> List[Dict]:
+        """转为写库用的行，仅在这里生成 datetime 对象"""
+        columns = {
+            c: getattr(self, c).tolist() for c in PRICE_COLUMNS + LABEL_COLUMNS
+        }
+        return [
+            {"timestamp": ts, **{c: columns[c][i] for c in columns}}
+            for i, ts in enumerate(self.datetimes)
+        ]
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "timestamp": pd.to_datetime(self.timestamp, unit="ms", utc=True),
+                "source": self.source,
+                **{c: getattr(self, c) for c in PRICE_COLUMNS},
+            }
+        )
+
+
+def _to_ms(ts) -> int:
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.astimezone()
+        return int(ts.timestamp() * 1000)
+    return int(ts)
@@ -0,0 +1,28 @@
+import os
+from functools import lru_cache
+from typing import Any
+import yaml
+
+CONFIG_PATH = os.getenv(
+    "CONFIG_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.yaml"),
+)
+
+
+@lru_cache(maxsize=1)
+def load_config() -> dict:
+    """读取 config.yaml，文件不存在时返回空配置"""
+    if not os.path.exists(CONFIG_PATH):
+        return {}
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def get_config(path: str, default: Any = None) -> Any:
+    """按点号路径读取配置项，如 get_config("decision.discussion_rounds", 3)"""
+    node = load_config()
+    for key in path.split("."):
+        if not isinstance(node, dict) or key not in node:
+            return default
+        node = node[key]
+    return node
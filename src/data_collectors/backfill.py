@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+from .price_collector import PriceCollector, OKX_PAGE_LIMIT, BINANCE_PAGE_LIMIT
+from sqlalchemy import select
+from ..database.connection import get_async_db
+from ..database.models import Price
+from ..database.writers import upsert_prices
+from ..database.schema import ensure_partitions
+from ..config import get_config
+from .candle_merge import normalize_candles
+from ..candle_batch import INTERVAL_MS
+
+
+def to_ms(ts: datetime) -> int:
+    return int(ts.timestamp() * 1000)
+
+
+def from_ms(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+
+class BackfillEngine:
+    """历史K线回补
+
+    对每个 (source, symbol, interval) 先对比 prices 表找出缺失区间，
+    再把缺失区间切分成交易所单页大小的窗口，在信号量限制下并发拉取。
+    每页拉取后立即落库，中断后重新运行只会补齐剩余缺口，因此天然可续跑。
+    """
+
+    def __init__(self, price_collector: PriceCollector = None, concurrency: int = None):
+        self.collector = price_collector or PriceCollector()
+        self.concurrency = concurrency or int(
+            os.getenv("BACKFILL_CONCURRENCY", get_config("backfill.concurrency", 8))
+        )
+        self.fetchers = {
+            "okx": (self.collector.fetch_okx_candles, OKX_PAGE_LIMIT),
+            "binance": (self.collector.fetch_binance_candles, BINANCE_PAGE_LIMIT),
+        }
+
+    async def run(
+        self,
+        symbols: List[str],
+        intervals: List[str],
+        start: datetime,
+        end: datetime = None,
+        sources: List[str] = None,
+    ) -> Dict[str, int]:
+        """回补 [start, end) 区间内所有缺失的已收盘K线"""
+        end = end or datetime.now()
+        sources = sources or list(self.fetchers)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        # 回补区间可能早于调度器预建的月分区
+        async with get_async_db() as db:
+            await db.run_sync(ensure_partitions, "prices", start, end)
+
+        tasks = []
+        for source in sources:
+            fetch, page_limit = self.fetchers[source]
+            for symbol in symbols:
+                for interval in intervals:
+                    step = INTERVAL_MS[interval]
+                    # 对齐到周期边界，end 向下取整以排除尚未收盘的K线
+                    start_ms = to_ms(start) // step * step
+                    end_ms = to_ms(end) // step * step
+                    gaps = await self.find_missing_ranges(
+                        source, symbol, interval, start_ms, end_ms
+                    )
+                    for page_start, page_end in self._split_pages(
+                        gaps, step * page_limit
+                    ):
+                        tasks.append(
+                            self._fetch_page(
+                                semaphore,
+                                fetch,
+                                symbol,
+                                interval,
+                                page_start,
+                                page_end,
+                            )
+                        )
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        stats = {"pages": len(tasks), "candles": 0, "failed": 0}
+        for result in results:
+            if isinstance(result, Exception):
+                stats["failed"] += 1
+                print(f"回补分页失败: {result}")
+            else:
+                stats["candles"] += result
+        return stats
+
+    async def find_missing_ranges(
+        self, source: str, symbol: str, interval: str, start_ms: int, end_ms: int
+    ) -> List[Tuple[int, int]]:
+        """返回 prices 表中缺失的 [start, end) 毫秒区间列表"""
+        step = INTERVAL_MS[interval]
+        async with get_async_db() as db:
+            rows = await db.scalars(
+                select(Price.timestamp).where(
+                    Price.source == source,
+                    Price.symbol == symbol,
+                    Price.interval == interval,
+                    Price.timestamp >= from_ms(start_ms),
+                    Price.timestamp < from_ms(end_ms),
+                )
+            )
+            existing = {to_ms(ts) for ts in rows}
+
+        gaps = []
+        gap_start = None
+        for ts in range(start_ms, end_ms, step):
+            if ts in existing:
+                if gap_start is not None:
+                    gaps.append((gap_start, ts))
+                    gap_start = None
+            elif gap_start is None:
+                gap_start = ts
+        if gap_start is not None:
+            gaps.append((gap_start, end_ms))
+        return gaps
+
+    def _split_pages(
+        self, gaps: List[Tuple[int, int]], page_span: int
+    ) -> List[Tuple[int, int]]:
+        pages = []
+        for gap_start, gap_end in gaps:
+            for page_start in range(gap_start, gap_end, page_span):
+                pages.append((page_start, min(page_start + page_span, gap_end)))
+        return pages
+
+    async def _fetch_page(
+        self,
+        semaphore: asyncio.Semaphore,
+        fetch,
+        symbol: str,
+        interval: str,
+        start_ms: int,
+        end_ms: int,
+    ) -> int:
+        async with semaphore:
+            candles = await fetch(symbol, interval, start_ms, end_ms)
+
+        in_range = (candles.timestamp >= start_ms) & (candles.timestamp < end_ms)
+        candles = normalize_candles(candles.take(in_range))
+        if len(candles):
+            async with get_async_db() as db:
+                await db.run_sync(
+                    upsert_prices,
+                    candles,
+                    consolidate=get_config("prices.consolidate", False),
+                )
+        return len(candles)
+
+
+async def _main(args: argparse.Namespace):
+    engine = BackfillEngine(concurrency=args.concurrency)
+    start = (
+        datetime.fromisoformat(args.start)
+        if args.start
+        else datetime.now() - timedelta(days=args.days)
+    )
+    end = datetime.fromisoformat(args.end) if args.end else None
+    try:
+        stats = await engine.run(
+            args.symbols, args.intervals, start, end, sources=args.sources
+        )
+        print(f"回补完成: {stats}")
+    finally:
+        await engine.collector.http_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="回补历史K线到 prices 表")
+    parser.add_argument(
+        "--symbols", nargs="+", default=get_config("data_sources.symbols", ["BTC/USDT"])
+    )
+    parser.add_argument(
+        "--intervals", nargs="+", default=get_config("backfill.intervals", ["1h"])
+    )
+    parser.add_argument(
+        "--sources", nargs="+", default=get_config("data_sources.price", None)
+    )
+    parser.add_argument(
+        "--days", type=int, default=get_config("backfill.lookback_days", 30)
+    )
+    parser.add_argument("--start", help="ISO 时间，优先于 --days")
+    parser.add_argument("--end", help="ISO 时间，默认当前时间")
+    parser.add_argument("--concurrency", type=int, default=None)
+    asyncio.run(_main(parser.parse_args()))
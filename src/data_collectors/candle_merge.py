@@ -0,0 +1,32 @@
+from dataclasses import replace
+from ..candle_batch import CandleBatch
+
+# 识别 BTCUSDT 这类无分隔符代码时使用的计价币种，长的优先匹配
+QUOTE_CURRENCIES = ["USDT", "USDC", "FDUSD", "BUSD", "USD", "BTC", "ETH"]
+
+
+def normalize_symbol(symbol: str) -> str:
+    """统一交易对格式：BTC-USDT / BTCUSDT / btc/usdt -> BTC/USDT"""
+    symbol = symbol.upper().replace("-", "/").replace("_", "/")
+    if "/" in symbol:
+        return symbol
+    for quote in QUOTE_CURRENCIES:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return f"{symbol[:-len(quote)]}/{quote}"
+    return symbol
+
+
+def normalize_candles(candles: CandleBatch) -> CandleBatch:
+    """规范化交易对，并按 (symbol, source, interval, timestamp) 去重
+
+    时间戳在 CandleBatch 中已统一为 UTC 毫秒。
+    同一批次内同一根K线出现多次时（例如未收盘K线被重复推送），保留最后一次。
+    """
+    if not len(candles):
+        return candles
+    symbols = candles.symbol.copy()
+    for raw in set(symbols.tolist()):
+        normalized = normalize_symbol(raw)
+        if raw != normalized:
+            symbols[symbols == raw] = normalized
+    return replace(candles, symbol=symbols).deduplicate()
@@ -0,0 +1,155 @@
+import aiohttp
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+from .resilience import TokenBucket, CircuitBreaker
+
+# 各上游的请求配额。rate/capacity 的单位为请求数，Binance 为请求权重
+HOST_LIMITS = {
+    "api.binance.com": {
+        "rate": 80,
+        "capacity": 1200,
+        "timeout": 10,
+        # 响应头 X-MBX-USED-WEIGHT-1M 报告当前分钟已用权重
+        "usage_header": "X-MBX-USED-WEIGHT-1M",
+        "window_limit": 6000,
+        "window": 60,
+    },
+    "www.okx.com": {"rate": 9, "capacity": 18, "timeout": 10},
+    "cryptopanic.com": {"rate": 2, "capacity": 5, "timeout": 15},
+}
+DEFAULT_HOST_LIMIT = {"rate": 5, "capacity": 10}
+
+# 视为上游故障、计入熔断的状态码
+RETRYABLE_STATUSES = {418, 429, 500, 502, 503, 504}
+
+
+class HTTPClientManager:
+    """采集器共享的长连接 HTTP 客户端
+
+    整个进程只维护一个 aiohttp.ClientSession，按 host 复用连接池，
+    避免每次采集都重新进行 DNS 解析、TCP 和 TLS 握手。
+    通过 request() 发出的请求会经过按 host 划分的限流和熔断。
+    """
+
+    def __init__(
+        self,
+        limit: int = None,
+        limit_per_host: int = None,
+        dns_ttl: int = None,
+        keepalive_timeout: float = None,
+        timeout: float = None,
+    ):
+        self.limit = limit or int(os.getenv("HTTP_POOL_LIMIT", 100))
+        self.limit_per_host = limit_per_host or int(
+            os.getenv("HTTP_POOL_LIMIT_PER_HOST", 10)
+        )
+        self.dns_ttl = dns_ttl or int(os.getenv("HTTP_DNS_TTL", 300))
+        self.keepalive_timeout = keepalive_timeout or float(
+            os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60)
+        )
+        self.timeout = timeout or float(os.getenv("HTTP_TIMEOUT", 15))
+        self.failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+        self.recovery_timeout = float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", 30))
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._limiters: Dict[str, TokenBucket] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """获取共享会话，首次调用时在当前事件循环中创建"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": "BTC-Smart-Agent/1.0"},
+            )
+        return self._session
+
+    @asynccontextmanager
+    async def request(
+        self, method: str, url: str, cost: float = 1, **kwargs
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """经过限流与熔断的请求
+
+        cost 为本次请求消耗的令牌数（Binance 按接口权重计）。
+        429/418/5xx、超时和连接错误计为失败；熔断打开时直接抛出 CircuitOpenError。
+        """
+        host = urlsplit(url).hostname
+        config = HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)
+        breaker = self._breaker(host)
+        await self._limiter(host).acquire(cost)
+
+        kwargs.setdefault(
+            "timeout", aiohttp.ClientTimeout(total=config.get("timeout", self.timeout))
+        )
+        session = await self.get_session()
+        # 半开状态下 before_request 会占用唯一的探测名额，其后到 try 之间不能有 await，
+        # 否则在此被取消（截止时间、对冲）时名额不会释放，该 host 将一直被拒绝
+        breaker.before_request()
+        try:
+            async with session.request(method, url, **kwargs) as resp:
+                self._observe_limits(host, config, resp)
+                if resp.status in RETRYABLE_STATUSES:
+                    raise aiohttp.ClientResponseError(
+                        resp.request_info,
+                        resp.history,
+                        status=resp.status,
+                        message=resp.reason,
+                        headers=resp.headers,
+                    )
+                yield resp
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            breaker.record_failure()
+            raise
+        else:
+            breaker.record_success()
+        finally:
+            breaker.release()
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def circuit_states(self) -> Dict[str, str]:
+        return {host: breaker.state for host, breaker in self._breakers.items()}
+
+    def _observe_limits(self, host: str, config: Dict, resp: aiohttp.ClientResponse):
+        limiter = self._limiter(host)
+        usage_header = config.get("usage_header")
+        if usage_header and resp.headers.get(usage_header):
+            limiter.sync_usage(
+                float(resp.headers[usage_header]),
+                config["window_limit"],
+                config["window"],
+            )
+        if resp.status in (418, 429):
+            retry_after = resp.headers.get("Retry-After")
+            limiter.pause(float(retry_after) if retry_after else 1.0)
+
+    def _limiter(self, host: str) -> TokenBucket:
+        if host not in self._limiters:
+            config = HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)
+            self._limiters[host] = TokenBucket(config["rate"], config["capacity"])
+        return self._limiters[host]
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(
+                host, self.failure_threshold, self.recovery_timeout
+            )
+        return self._breakers[host]
+
+    async def close(self):
+        """关闭会话并释放连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
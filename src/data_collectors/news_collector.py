@@ -1,15 +1,68 @@
 import aiohttp
-from datetime import datetime
-from typing import Dict, List
+import asyncio
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, List, Optional
 import os
+from sqlalchemy import func, select
+from .http_client import HTTPClientManager
+from .news_dedup import NewsDeduplicator
+from ..database.connection import get_async_db
+from ..database.models import News
+from ..config import get_config
+
+# RSS/Atom 源，可在 config.yaml 的 news_feeds 中覆盖或新增
+DEFAULT_FEEDS = {
+    "coindesk": "https://www.coindesk.com/arc/outboundfeeds/rss/",
+    "reuters": "https://www.reutersagency.com/feed/?best-topics=business-finance&post_type=best",
+}
+
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _parse_feed_date(value: str) -> Optional[datetime]:
+    """解析 RSS (RFC 822) 或 Atom (ISO 8601) 时间"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        ts = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts
 
 
 class NewsCollector:
-    def __init__(self):
+    def __init__(self, http_client: HTTPClientManager = None):
         self.cryptopanic_key = os.getenv("CRYPTOPANIC_API_KEY")
         self.cryptopanic_base = "https://cryptopanic.com/api/v1"
+        self.http_client = http_client or HTTPClientManager()
+        self.feeds = {**DEFAULT_FEEDS, **get_config("news_feeds", {})}
+        self.max_pages = int(os.getenv("CRYPTOPANIC_MAX_PAGES", 5))
+        self.deduplicator = NewsDeduplicator(
+            max_size=int(os.getenv("NEWS_DEDUP_INDEX_SIZE", 20000))
+        )
+        # 每个来源的增量游标：latest_published_at / latest_id / etag / last_modified
+        self.cursors: Dict[str, Dict] = {}
+        # 本轮采集得到、尚未确认写库的游标
+        self._pending_cursors: Dict[str, Dict] = {}
+        self._index_loaded = False
 
     async def fetch_cryptopanic_news(self, currencies: str = "BTC") -> List[Dict]:
+        """增量拉取 CryptoPanic，遇到已采集过的新闻即停止翻页"""
+        cursor = self.cursors.get("cryptopanic", {})
+        pending = dict(cursor)
         url = f"{self.cryptopanic_base}/posts/"
         params = {
             "auth_token": self.cryptopanic_key,
@@ -19,52 +72,204 @@ class NewsCollector:
         }
 
         news_list = []
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as resp:
+        for page in range(self.max_pages):
+            headers = self._conditional_headers(cursor) if page == 0 else {}
+            async with self.http_client.get(
+                url, params=params, headers=headers
+            ) as resp:
+                if resp.status == 304:
+                    break
                 data = await resp.json()
-                if "results" in data:
-                    for item in data["results"]:
-                        news_list.append(
-                            {
-                                "source": "cryptopanic",
-                                "published_at": datetime.fromisoformat(
-                                    item["published_at"].replace("Z", "+00:00")
-                                ),
-                                "title": item["title"],
-                                "url": item["url"],
-                                "content": item.get("body", ""),
-                                "keywords": [currencies],
-                            }
-                        )
+                if page == 0:
+                    self._remember_validators(pending, resp)
+
+            reached_seen = False
+            for item in data.get("results", []):
+                published_at = datetime.fromisoformat(
+                    item["published_at"].replace("Z", "+00:00")
+                )
+                if self._is_seen(cursor, published_at, item.get("id")):
+                    reached_seen = True
+                    break
+                news_list.append(
+                    {
+                        "source": "cryptopanic",
+                        "published_at": published_at,
+                        "title": item["title"],
+                        "url": item["url"],
+                        "content": item.get("body", ""),
+                        "keywords": [currencies],
+                    }
+                )
+                self._advance(pending, published_at, item.get("id"))
+
+            # next 链接已包含全部查询参数
+            url, params = data.get("next"), None
+            if reached_seen or not url:
+                break
+
+        self._pending_cursors["cryptopanic"] = pending
         return news_list
 
-    async def fetch_coindesk_rss(self) -> List[Dict]:
-        # Simplified RSS parsing
-        url = "https://www.coindesk.com/arc/outboundfeeds/rss/"
+    async def fetch_feed(self, source: str, url: str) -> List[Dict]:
+        """增量拉取 RSS/Atom 源，边下载边解析，遇到已采集过的条目即停止读取"""
+        cursor = self.cursors.get(source, {})
+        pending = dict(cursor)
         news_list = []
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                # In production, use feedparser library
-                text = await resp.text()
-                # Basic parsing placeholder
+        headers = self._conditional_headers(cursor)
+        async with self.http_client.get(url, headers=headers) as resp:
+            if resp.status == 304:
+                return []
+            resp.raise_for_status()
+            self._remember_validators(pending, resp)
+
+            # 订阅源按时间倒序排列，提前 break 时剩余内容不再下载
+            async for entry in self._iter_feed_entries(resp):
+                published_at = entry["published_at"]
+                if published_at is None:
+                    continue
+                if self._is_seen(cursor, published_at):
+                    break
                 news_list.append(
                     {
-                        "source": "coindesk",
-                        "published_at": datetime.now(),
-                        "title": "CoinDesk News",
-                        "url": url,
-                        "content": "",
+                        "source": source,
+                        "published_at": published_at,
+                        "title": entry["title"],
+                        "url": entry["url"],
+                        "content": entry["content"],
                         "keywords": ["BTC"],
                     }
                 )
+                self._advance(pending, published_at)
+
+        self._pending_cursors[source] = pending
         return news_list
 
+    async def fetch_coindesk_rss(self) -> List[Dict]:
+        return await self.fetch_feed("coindesk", self.feeds["coindesk"])
+
+    async def fetch_reuters_rss(self) -> List[Dict]:
+        return await self.fetch_feed("reuters", self.feeds["reuters"])
+
+    async def _iter_feed_entries(
+        self, resp: aiohttp.ClientResponse
+    ) -> AsyncIterator[Dict]:
+        parser = ET.XMLPullParser(events=("end",))
+        async for chunk in resp.content.iter_chunked(16384):
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                if _local_name(elem.tag) in ("item", "entry"):
+                    yield self._parse_feed_entry(elem)
+                    # 释放已处理条目的子节点，内存占用与文档大小无关
+                    elem.clear()
+        parser.close()
+
+    def _parse_feed_entry(self, elem: ET.Element) -> Dict:
+        fields = {}
+        link = ""
+        for child in elem:
+            name = _local_name(child.tag)
+            if name == "link":
+                # RSS 的链接在文本中，Atom 的链接在 href 属性中
+                if not link or child.get("rel", "alternate") == "alternate":
+                    link = child.get("href") or (child.text or "").strip()
+            elif name not in fields:
+                fields[name] = (child.text or "").strip()
+
+        published = (
+            fields.get("pubDate")
+            or fields.get("published")
+            or fields.get("updated")
+            or fields.get("date")
+        )
+        content = (
+            fields.get("description") or fields.get("summary") or fields.get("content")
+        )
+        return {
+            "title": fields.get("title", ""),
+            "url": link,
+            "published_at": _parse_feed_date(published),
+            "content": HTML_TAG_RE.sub("", content or "").strip(),
+        }
+
+    def _conditional_headers(self, cursor: Dict) -> Dict:
+        headers = {}
+        if cursor.get("etag"):
+            headers["If-None-Match"] = cursor["etag"]
+        if cursor.get("last_modified"):
+            headers["If-Modified-Since"] = cursor["last_modified"]
+        return headers
+
+    def _remember_validators(self, cursor: Dict, resp: aiohttp.ClientResponse):
+        if resp.headers.get("ETag"):
+            cursor["etag"] = resp.headers["ETag"]
+        if resp.headers.get("Last-Modified"):
+            cursor["last_modified"] = resp.headers["Last-Modified"]
+
+    def _is_seen(self, cursor: Dict, published_at: datetime, item_id=None) -> bool:
+        if item_id is not None and cursor.get("latest_id") is not None:
+            if item_id <= cursor["latest_id"]:
+                return True
+        latest = cursor.get("latest_published_at")
+        return latest is not None and published_at <= latest
+
+    def _advance(self, cursor: Dict, published_at: datetime, item_id=None):
+        latest = cursor.get("latest_published_at")
+        if latest is None or published_at > latest:
+            cursor["latest_published_at"] = published_at
+        if item_id is not None and item_id > (cursor.get("latest_id") or 0):
+            cursor["latest_id"] = item_id
+
     async def collect_all(self) -> List[Dict]:
-        tasks = [self.fetch_cryptopanic_news(), self.fetch_coindesk_rss()]
+        await self._warm_up()
+
+        tasks = []
+        for source in get_config("data_sources.news", ["cryptopanic", "coindesk"]):
+            if source == "cryptopanic":
+                tasks.append(self.fetch_cryptopanic_news())
+            elif source in self.feeds:
+                tasks.append(self.fetch_feed(source, self.feeds[source]))
+
         results = await asyncio.gather(*tasks, return_exceptions=True)
         all_news = []
         for result in results:
             if isinstance(result, list):
                 all_news.extend(result)
-        return all_news
+            else:
+                print(f"新闻源采集失败: {result!r}")
+
+        return self.deduplicator.filter(all_news)
+
+    def commit(self, news_list: List[Dict]):
+        """写库成功后确认本轮的指纹与游标，失败时下一轮会重新拉取"""
+        self.deduplicator.remember(news_list)
+        self.cursors.update(self._pending_cursors)
+        self._pending_cursors = {}
+
+    async def _warm_up(self):
+        """进程启动后首次采集时，从库中恢复去重索引和各来源的最新发布时间"""
+        if self._index_loaded:
+            return
+        async with get_async_db() as db:
+            rows = (
+                await db.execute(
+                    select(News.fingerprint, News.canonical_url)
+                    .order_by(News.published_at.desc())
+                    .limit(self.deduplicator.max_size)
+                )
+            ).all()
+            latest = (
+                await db.execute(
+                    select(News.source, func.max(News.published_at)).group_by(
+                        News.source
+                    )
+                )
+            ).all()
+        # 旧版为没有可用特征的标题存了指纹 0，不参与近重复判定，只恢复 URL
+        self.deduplicator.remember(
+            {"fingerprint": f or None, "canonical_url": u} for f, u in reversed(rows)
+        )
+        for source, published_at in latest:
+            self.cursors.setdefault(source, {})["latest_published_at"] = published_at
+        self._index_loaded = True
@@ -0,0 +1,188 @@
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 只影响统计、不影响内容的查询参数
+TRACKING_PARAMS = {"fbclid", "gclid", "ref", "ref_src", "source", "mc_cid", "mc_eid"}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]")
+
+FINGERPRINT_BITS = 64
+BAND_BITS = 16
+
+
+def canonicalize_url(url: str) -> str:
+    """规范化新闻链接：统一协议和域名大小写，去掉 www、跟踪参数、锚点和结尾斜杠"""
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def simhash(text: str) -> Optional[int]:
+    """64 位 SimHash，特征为单词（中文按字）及相邻二元组
+
+    没有任何特征（空文本，或只有标点、表情）时返回 None：
+    这类文本的指纹都会是 0，彼此距离为 0，不能用于近重复判定。
+    """
+    tokens = TOKEN_RE.findall((text or "").lower())
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if not features:
+        return None
+
+    vector = [0] * FINGERPRINT_BITS
+    for feature in features:
+        h = int.from_bytes(
+            hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big"
+        )
+        for bit in range(FINGERPRINT_BITS):
+            vector[bit] += 1 if h >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(vector):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def to_signed(fingerprint: int) -> int:
+    """转为有符号 64 位整数以存入 BIGINT 列"""
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def to_unsigned(fingerprint: int) -> int:
+    return fingerprint + (1 << 64) if fingerprint < 0 else fingerprint
+
+
+class NewsDeduplicator:
+    """新闻近重复检测
+
+    先按规范化 URL 精确去重，再按标题 SimHash 的汉明距离判定近重复；
+    标题和正文都没有可用特征的新闻没有指纹，只按 URL 去重。
+    指纹按 16 位分段建立倒排索引：距离不超过 3 的两个指纹至少有一段完全相同，
+    因此只需比较共享某一段的候选项。索引按插入顺序淘汰，容量有上限。
+    """
+
+    def __init__(self, max_size: int = 20000, max_distance: int = 3):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self._fingerprints: "OrderedDict[int, None]" = OrderedDict()
+        self._urls: "OrderedDict[str, None]" = OrderedDict()
+        self._bands: Dict[tuple, set] = {}
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def fingerprint(self, news: Dict) -> Optional[int]:
+        # 各来源的正文长短不一（摘要/全文），标题最稳定；标题没有可用特征时用正文
+        fingerprint = simhash(news.get("title"))
+        if fingerprint is None:
+            fingerprint = simhash(news.get("content"))
+        return fingerprint
+
+    def is_duplicate(self, fingerprint: Optional[int], canonical_url: str = "") -> bool:
+        if canonical_url and canonical_url in self._urls:
+            return True
+        return fingerprint is not None and self._find_similar(fingerprint) is not None
+
+    def filter(self, news_list: List[Dict]) -> List[Dict]:
+        """返回去重后的新闻，并为每条补充 canonical_url 与 fingerprint 字段
+
+        不会修改索引；调用方在写库成功后再调用 remember()，
+        避免写库失败的新闻在下一轮被误判为重复。
+        """
+        unique: List[Dict] = []
+        batch = NewsDeduplicator(self.max_size, self.max_distance)
+        positions: Dict = {}  # 批次内指纹/URL -> unique 中的下标
+
+        for news in news_list:
+            news = dict(news)
+            canonical_url = canonicalize_url(news.get("url", ""))
+            fingerprint = self.fingerprint(news)
+            news["canonical_url"] = canonical_url
+            news["fingerprint"] = (
+                to_signed(fingerprint) if fingerprint is not None else None
+            )
+
+            if self.is_duplicate(fingerprint, canonical_url):
+                continue
+
+            # 同一批次内的重复（常见于多来源转载）：把关键词合并到先出现的一条
+            match = None
+            if fingerprint is not None:
+                match = batch._find_similar(fingerprint)
+            if match is None and canonical_url in positions:
+                match = canonical_url
+            if match is not None:
+                kept = unique[positions[match]]
+                kept["keywords"] = sorted(
+                    set(kept.get("keywords") or []) | set(news.get("keywords") or [])
+                )
+                continue
+
+            batch.add(fingerprint, canonical_url)
+            if fingerprint is not None:
+                positions[fingerprint] = len(unique)
+            if canonical_url:
+                positions[canonical_url] = len(unique)
+            unique.append(news)
+        return unique
+
+    def remember(self, news_list: Iterable[Dict]):
+        for news in news_list:
+            fingerprint = news.get("fingerprint")
+            if fingerprint is not None:
+                fingerprint = to_unsigned(fingerprint)
+            self.add(fingerprint, news.get("canonical_url") or "")
+
+    def add(self, fingerprint: Optional[int], canonical_url: str = ""):
+        if canonical_url:
+            self._urls[canonical_url] = None
+            self._urls.move_to_end(canonical_url)
+            while len(self._urls) > self.max_size:
+                self._urls.popitem(last=False)
+
+        if fingerprint is None:
+            return
+
+        if fingerprint in self._fingerprints:
+            self._fingerprints.move_to_end(fingerprint)
+            return
+        self._fingerprints[fingerprint] = None
+        for band in self._band_keys(fingerprint):
+            self._bands.setdefault(band, set()).add(fingerprint)
+        while len(self._fingerprints) > self.max_size:
+            evicted, _ = self._fingerprints.popitem(last=False)
+            for band in self._band_keys(evicted):
+                bucket = self._bands.get(band)
+                if bucket is not None:
+                    bucket.discard(evicted)
+                    if not bucket:
+                        del self._bands[band]
+
+    def _find_similar(self, fingerprint: int) -> Optional[int]:
+        for band in self._band_keys(fingerprint):
+            for candidate in self._bands.get(band, ()):
+                if hamming_distance(candidate, fingerprint) <= self.max_distance:
+                    return candidate
+        return None
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << BAND_BITS) - 1
+        for i in range(FINGERPRINT_BITS // BAND_BITS):
+            yield (i, fingerprint >> (i * BAND_BITS) & mask)
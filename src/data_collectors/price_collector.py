@@ -1,59 +1,170 @@
-import aiohttp
 import asyncio
-from datetime import datetime
-from decimal import Decimal
+from datetime import datetime, timezone
 from typing import Dict, List
 import os
+from .http_client import HTTPClientManager
+from ..config import get_config
+from .candle_merge import normalize_symbol
+from ..candle_batch import CandleBatch
+
+# 统一周期名 -> 交易所周期参数
+# OKX 的 4H/1D 默认按香港时间切分，使用 utc 后缀与 Binance 对齐
+OKX_BARS = {
+    "1m": "1m",
+    "5m": "5m",
+    "15m": "15m",
+    "1h": "1H",
+    "4h": "4Hutc",
+    "1d": "1Dutc",
+}
+BINANCE_INTERVALS = {
+    "1m": "1m",
+    "5m": "5m",
+    "15m": "15m",
+    "1h": "1h",
+    "4h": "4h",
+    "1d": "1d",
+}
+
+# 单页最大K线数量
+OKX_PAGE_LIMIT = 100
+BINANCE_PAGE_LIMIT = 1000
+
+
+def binance_klines_weight(limit: int) -> int:
+    """Binance /api/v3/klines 的请求权重随 limit 增加"""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+def to_okx_symbol(symbol: str) -> str:
+    return symbol.replace("/", "-")
+
+
+def to_binance_symbol(symbol: str) -> str:
+    return symbol.replace("/", "").replace("-", "")
+
+
+def parse_okx_candle(candle: List, symbol: str, interval: str) -> Dict:
+    return {
+        "source": "okx",
+        "symbol": symbol,
+        "interval": interval,
+        "timestamp": datetime.fromtimestamp(int(candle[0]) / 1000, tz=timezone.utc),
+        "open": float(candle[1]),
+        "high": float(candle[2]),
+        "low": float(candle[3]),
+        "close": float(candle[4]),
+        "volume": float(candle[5]),
+    }
+
+
+def parse_binance_candle(candle: List, symbol: str, interval: str) -> Dict:
+    return {
+        "source": "binance",
+        "symbol": symbol,
+        "interval": interval,
+        "timestamp": datetime.fromtimestamp(candle[0] / 1000, tz=timezone.utc),
+        "open": float(candle[1]),
+        "high": float(candle[2]),
+        "low": float(candle[3]),
+        "close": float(candle[4]),
+        "volume": float(candle[5]),
+    }
 
 
 class PriceCollector:
-    def __init__(self):
+    def __init__(self, http_client: HTTPClientManager = None):
         self.okx_base = "https://www.okx.com"
         self.binance_base = "https://api.binance.com"
+        self.http_client = http_client or HTTPClientManager()
 
-    async def fetch_okx_price(self, symbol: str = "BTC-USDT") -> Dict:
+    async def fetch_okx_price(self, symbol: str) -> CandleBatch:
+        """最新一根1小时K线，symbol 为统一格式，如 ETH/USDT"""
         url = f"{self.okx_base}/api/v5/market/candles"
-        params = {"instId": symbol, "bar": "1H", "limit": "1"}
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as resp:
-                data = await resp.json()
-                if data["code"] == "0" and data["data"]:
-                    candle = data["data"][0]
-                    return {
-                        "source": "okx",
-                        "symbol": symbol.replace("-", "/"),
-                        "timestamp": datetime.fromtimestamp(int(candle[0]) / 1000),
-                        "open": Decimal(candle[1]),
-                        "high": Decimal(candle[2]),
-                        "low": Decimal(candle[3]),
-                        "close": Decimal(candle[4]),
-                        "volume": Decimal(candle[5]),
-                    }
-        return None
-
-    async def fetch_binance_price(self, symbol: str = "BTCUSDT") -> Dict:
+        params = {"instId": to_okx_symbol(symbol), "bar": "1H", "limit": "1"}
+
+        async with self.http_client.get(url, params=params) as resp:
+            data = await resp.json()
+            if data["code"] == "0" and data["data"]:
+                return CandleBatch.from_rows(
+                    data["data"][:1], "okx", normalize_symbol(symbol), "1h"
+                )
+        return CandleBatch.empty()
+
+    async def fetch_binance_price(self, symbol: str) -> CandleBatch:
         url = f"{self.binance_base}/api/v3/klines"
-        params = {"symbol": symbol, "interval": "1h", "limit": 1}
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as resp:
-                data = await resp.json()
-                if data:
-                    candle = data[0]
-                    return {
-                        "source": "binance",
-                        "symbol": "BTC/USDT",
-                        "timestamp": datetime.fromtimestamp(candle[0] / 1000),
-                        "open": Decimal(candle[1]),
-                        "high": Decimal(candle[2]),
-                        "low": Decimal(candle[3]),
-                        "close": Decimal(candle[4]),
-                        "volume": Decimal(candle[5]),
-                    }
-        return None
-
-    async def collect_all(self) -> List[Dict]:
-        tasks = [self.fetch_okx_price(), self.fetch_binance_price()]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        return [r for r in results if r and not isinstance(r, Exception)]
+        params = {"symbol": to_binance_symbol(symbol), "interval": "1h", "limit": 1}
+
+        async with self.http_client.get(url, params=params) as resp:
+            data = await resp.json()
+            if isinstance(data, list) and data:
+                return CandleBatch.from_rows(
+                    data[:1], "binance", normalize_symbol(symbol), "1h"
+                )
+        return CandleBatch.empty()
+
+    async def fetch_okx_candles(
+        self, symbol: str, interval: str, start_ms: int, end_ms: int
+    ) -> CandleBatch:
+        """获取 [start_ms, end_ms) 区间内的一页 OKX K线
+
+        history-candles 与 candles 返回格式相同，但可以回溯全部历史；
+        after/before 为开区间，按时间倒序返回。
+        """
+        url = f"{self.okx_base}/api/v5/market/history-candles"
+        params = {
+            "instId": to_okx_symbol(symbol),
+            "bar": OKX_BARS[interval],
+            "after": str(end_ms),
+            "before": str(start_ms - 1),
+            "limit": str(OKX_PAGE_LIMIT),
+        }
+
+        async with self.http_client.get(url, params=params) as resp:
+            data = await resp.json()
+            if data.get("code") != "0":
+                raise RuntimeError(f"OKX candles error: {data.get('msg')}")
+            return CandleBatch.from_rows(data["data"], "okx", symbol, interval).sort()
+
+    async def fetch_binance_candles(
+        self, symbol: str, interval: str, start_ms: int, end_ms: int
+    ) -> CandleBatch:
+        """获取 [start_ms, end_ms) 区间内的一页 Binance K线"""
+        url = f"{self.binance_base}/api/v3/klines"
+        params = {
+            "symbol": to_binance_symbol(symbol),
+            "interval": BINANCE_INTERVALS[interval],
+            "startTime": start_ms,
+            "endTime": end_ms - 1,
+            "limit": BINANCE_PAGE_LIMIT,
+        }
+
+        cost = binance_klines_weight(BINANCE_PAGE_LIMIT)
+        async with self.http_client.get(url, params=params, cost=cost) as resp:
+            data = await resp.json()
+            if isinstance(data, dict):
+                raise RuntimeError(f"Binance klines error: {data.get('msg')}")
+            return CandleBatch.from_rows(data, "binance", symbol, interval)
+
+    async def collect_all(self, symbols: List[str] = None) -> CandleBatch:
+        """从各交易所采集观察列表中所有交易对的最新K线，默认为 data_sources.symbols"""
+        symbols = symbols or get_config("data_sources.symbols", ["BTC/USDT"])
+        fetchers = {"okx": self.fetch_okx_price, "binance": self.fetch_binance_price}
+        sources = [
+            s for s in get_config("data_sources.price", list(fetchers)) if s in fetchers
+        ]
+        jobs = [(source, symbol) for symbol in symbols for source in sources]
+        results = await asyncio.gather(
+            *(fetchers[source](symbol) for source, symbol in jobs),
+            return_exceptions=True,
+        )
+        for (source, symbol), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                print(f"{source} {symbol} 价格采集失败: {result!r}")
+        return CandleBatch.concat(r for r in results if isinstance(r, CandleBatch))
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间拒绝请求"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"{host} 熔断中，{retry_in:.0f}s 后重试")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class TokenBucket:
+    """自适应令牌桶
+
+    按 rate 匀速补充令牌，最多积累 capacity 个。
+    上游返回限额用量或 429 时，通过 sync_usage()/pause() 收紧配额。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.blocked_until = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, cost: float = 1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                await asyncio.sleep((cost - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """暂停发放令牌，如收到 429 的 Retry-After"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def sync_usage(self, used: float, limit: float, window: float):
+        """根据上游报告的窗口内已用配额校正本地令牌数"""
+        remaining = limit - used
+        if remaining <= 0:
+            # 等到当前窗口结束
+            self.pause(window - time.time() % window)
+        else:
+            self.tokens = min(self.tokens, remaining)
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却后进入半开状态，只放行一个探测请求"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, host: str, failure_threshold: int = 5, recovery_timeout: float = 30):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    def before_request(self):
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.recovery_timeout:
+                raise CircuitOpenError(self.host, self.recovery_timeout - elapsed)
+            self.state = self.HALF_OPEN
+
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                raise CircuitOpenError(self.host, self.recovery_timeout)
+            self._probing = True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                print(f"{self.host} 熔断器打开 (连续失败 {self.failures} 次)")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """请求既未判定成功也未判定失败时（如调用方自身异常），释放探测名额"""
+        self._probing = False
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Dict, List, Tuple
+import websockets
+from .price_collector import (
+    OKX_BARS,
+    parse_okx_candle,
+    parse_binance_candle,
+    to_okx_symbol,
+    to_binance_symbol,
+)
+from ..database.connection import get_async_db
+from ..database.writers import upsert_prices
+from .candle_merge import normalize_candles
+from ..candle_batch import CandleBatch
+from ..config import get_config
+
+CandleKey = Tuple[str, str, str]  # (source, symbol, interval)
+
+
+async def write_prices(candles: List[Dict]):
+    """默认落库方式：把已收盘K线写入 prices 表"""
+    async with get_async_db() as db:
+        await db.run_sync(
+            upsert_prices,
+            normalize_candles(CandleBatch.from_records(candles)),
+            consolidate=get_config("prices.consolidate", False),
+        )
+
+
+class PriceStreamIngester:
+    """OKX / Binance K线 WebSocket 实时行情
+
+    内存中维护每个 (source, symbol, interval) 的当前K线，
+    收盘K线进入缓冲区，按批量大小或时间间隔微批写库。
+    连接断开后指数退避重连并重新订阅。
+    """
+
+    def __init__(
+        self,
+        symbols: List[str] = None,
+        intervals: List[str] = None,
+        sources: List[str] = None,
+        sink: Callable[[List[Dict]], Awaitable[None]] = None,
+        okx_url: str = None,
+        binance_url: str = None,
+        batch_size: int = None,
+        flush_interval: float = None,
+        max_backoff: float = 60,
+        max_buffer: int = None,
+    ):
+        self.symbols = symbols or get_config("data_sources.symbols", ["BTC/USDT"])
+        self.intervals = intervals or get_config("streaming.intervals", ["1h"])
+        self.sources = sources or get_config("data_sources.price", ["okx", "binance"])
+        self.sink = sink or write_prices
+        # 地址可替换为本地模拟服务器，便于测试
+        self.urls = {
+            "okx": okx_url
+            or os.getenv("OKX_WS_URL", "wss://ws.okx.com:8443/ws/v5/business"),
+            "binance": binance_url
+            or os.getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443/ws"),
+        }
+        self.batch_size = batch_size or get_config("streaming.batch_size", 50)
+        self.flush_interval = flush_interval or get_config(
+            "streaming.flush_interval", 5
+        )
+        self.max_backoff = max_backoff
+        self.max_buffer = max_buffer or get_config("streaming.max_buffer", 100000)
+
+        self.current_candles: Dict[CandleKey, Dict] = {}
+        self._buffer: List[Dict] = []
+        self._tasks: List[asyncio.Task] = []
+        self._running = False
+
+        # 反查表：交易所频道/代码 -> 统一周期/交易对
+        self._okx_channels = {f"candle{OKX_BARS[i]}": i for i in self.intervals}
+        self._binance_symbols = {to_binance_symbol(s): s for s in self.symbols}
+
+    async def start(self):
+        """在当前事件循环中启动各交易所连接与定时刷盘"""
+        self._running = True
+        self._tasks = [
+            asyncio.create_task(self._run_forever(source)) for source in self.sources
+        ]
+        self._tasks.append(asyncio.create_task(self._flush_loop()))
+        print(f"实时行情已启动: {self.sources} {self.symbols} {self.intervals}")
+
+    async def stop(self):
+        """停止所有连接，并把缓冲区剩余K线写库"""
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+
+    def get_current_candle(self, source: str, symbol: str, interval: str) -> Dict:
+        """获取内存中最新的（可能未收盘的）K线"""
+        return self.current_candles.get((source, symbol, interval))
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await self.sink(batch)
+        except Exception as e:
+            # 写库失败时放回缓冲区，等待下一次刷盘；数据库长时间不可用时
+            # 只保留最新的 max_buffer 根，丢弃的旧K线可由 backfill 补回
+            self._buffer = batch + self._buffer
+            dropped = len(self._buffer) - self.max_buffer
+            if dropped > 0:
+                self._buffer = self._buffer[dropped:]
+                print(f"行情缓冲区已满，丢弃最早的 {dropped} 根K线")
+            print(f"行情写库失败: {e}")
+
+    async def _flush_loop(self):
+        while self._running:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _run_forever(self, source: str):
+        backoff = 1
+        while self._running:
+            try:
+                async with websockets.connect(
+                    self.urls[source], ping_interval=20, ping_timeout=20
+                ) as ws:
+                    await ws.send(json.dumps(self._subscribe_message(source)))
+                    backoff = 1
+                    async for raw in ws:
+                        await self._handle_message(source, raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"{source} 行情连接断开: {e}")
+
+            if self._running:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _subscribe_message(self, source: str) -> Dict:
+        if source == "okx":
+            return {
+                "op": "subscribe",
+                "args": [
+                    {"channel": f"candle{OKX_BARS[i]}", "instId": to_okx_symbol(s)}
+                    for s in self.symbols
+                    for i in self.intervals
+                ],
+            }
+        return {
+            "method": "SUBSCRIBE",
+            "params": [
+                f"{to_binance_symbol(s).lower()}@kline_{i}"
+                for s in self.symbols
+                for i in self.intervals
+            ],
+            "id": 1,
+        }
+
+    async def _handle_message(self, source: str, raw: str):
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            return  # 心跳 pong 等非 JSON 消息
+
+        if source == "okx":
+            arg = msg.get("arg", {})
+            # 订阅确认等事件消息没有 data 字段
+            if "data" not in msg or arg.get("channel") not in self._okx_channels:
+                return
+            interval = self._okx_channels[arg["channel"]]
+            symbol = arg["instId"].replace("-", "/")
+            for row in msg["data"]:
+                candle = parse_okx_candle(row, symbol, interval)
+                await self._update(candle, closed=row[8] == "1")
+        else:
+            kline = msg.get("data", msg).get("k")
+            if not kline or kline["s"] not in self._binance_symbols:
+                return
+            row = [kline["t"], kline["o"], kline["h"], kline["l"], kline["c"], kline["v"]]
+            candle = parse_binance_candle(
+                row, self._binance_symbols[kline["s"]], kline["i"]
+            )
+            await self._update(candle, closed=kline["x"])
+
+    async def _update(self, candle: Dict, closed: bool):
+        key = (candle["source"], candle["symbol"], candle["interval"])
+        self.current_candles[key] = candle
+        if closed:
+            self._buffer.append(candle)
+            if len(self._buffer) >= self.batch_size:
+                await self.flush()
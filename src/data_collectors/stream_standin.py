@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import json
+from typing import Dict, List
+import websockets
+from .price_collector import OKX_BARS, to_binance_symbol, to_okx_symbol
+from .stream_collector import PriceStreamIngester
+from ..candle_batch import INTERVAL_MS
+
+# 模拟K线的起始时间（毫秒）
+START_MS = 1_700_000_000_000 // 3_600_000 * 3_600_000
+
+
+def okx_frame(
+    symbol: str, interval: str, ts: int, close: float, closed: bool
+) -> Dict:
+    """OKX candle 频道推送格式，第 9 列为是否收盘"""
+    return {
+        "arg": {
+            "channel": f"candle{OKX_BARS[interval]}",
+            "instId": to_okx_symbol(symbol),
+        },
+        "data": [
+            [
+                str(ts),
+                str(close - 1),
+                str(close + 2),
+                str(close - 2),
+                str(close),
+                "10",
+                "10",
+                "10",
+                "1" if closed else "0",
+            ]
+        ],
+    }
+
+
+def binance_frame(
+    symbol: str, interval: str, ts: int, close: float, closed: bool
+) -> Dict:
+    """Binance kline 推送格式，k.x 为是否收盘"""
+    code = to_binance_symbol(symbol)
+    return {
+        "e": "kline",
+        "s": code,
+        "k": {
+            "t": ts,
+            "s": code,
+            "i": interval,
+            "o": str(close - 1),
+            "h": str(close + 2),
+            "l": str(close - 2),
+            "c": str(close),
+            "v": "10",
+            "x": closed,
+        },
+    }
+
+
+class StandInExchange:
+    """本地模拟的交易所 K线 WebSocket
+
+    收到订阅消息后，按顺序为每个交易对推送 candles 根K线（每根先推一次未收盘更新，
+    再推收盘）。第一次连接推送 drop_after 根后主动断开，检验重连和断点续推。
+    """
+
+    def __init__(
+        self,
+        source: str,
+        symbols: List[str],
+        interval: str,
+        candles: int,
+        drop_after: int,
+    ):
+        self.source = source
+        self.symbols = symbols
+        self.interval = interval
+        self.candles = candles
+        self.drop_after = drop_after
+        self.connections = 0
+        self.sent = 0
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"ws://{host}:{port}"
+
+    async def start(self):
+        self.server = await websockets.serve(self._handle, "127.0.0.1", 0)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, ws):
+        self.connections += 1
+        await ws.recv()  # 订阅消息
+        frame = okx_frame if self.source == "okx" else binance_frame
+        while self.sent < self.candles:
+            ts = START_MS + self.sent * INTERVAL_MS[self.interval]
+            close = 100.0 + self.sent
+            for symbol in self.symbols:
+                for closed in (False, True):
+                    await ws.send(
+                        json.dumps(frame(symbol, self.interval, ts, close, closed))
+                    )
+            self.sent += 1
+            if self.connections == 1 and self.sent == self.drop_after:
+                return  # 断开连接
+        # 推送完成后保持连接，直到客户端停止
+        await ws.wait_closed()
+
+
+async def check_stream(
+    candles: int = 20, batch_size: int = 8, timeout: float = 30
+) -> bool:
+    """启动模拟交易所和 PriceStreamIngester，检验微批写入与断线重连"""
+    symbols, interval = ["BTC/USDT", "ETH/USDT"], "1h"
+    exchanges = {
+        source: StandInExchange(source, symbols, interval, candles, candles // 2)
+        for source in ["okx", "binance"]
+    }
+    for exchange in exchanges.values():
+        await exchange.start()
+
+    batches = []
+
+    async def sink(rows: List[Dict]):
+        batches.append(rows)
+
+    ingester = PriceStreamIngester(
+        symbols=symbols,
+        intervals=[interval],
+        sources=list(exchanges),
+        sink=sink,
+        okx_url=exchanges["okx"].url,
+        binance_url=exchanges["binance"].url,
+        batch_size=batch_size,
+        flush_interval=0.2,
+        max_backoff=1,
+    )
+    expected = candles * len(symbols) * len(exchanges)
+    await ingester.start()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while sum(map(len, batches)) < expected and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+    await ingester.stop()
+    for exchange in exchanges.values():
+        await exchange.stop()
+
+    rows = [row for batch in batches for row in batch]
+    keys = {(r["source"], r["symbol"], r["timestamp"]) for r in rows}
+    checks = {
+        "收盘K线全部写入": len(keys) == expected,
+        "未重复写入": len(rows) == len(keys),
+        "按批量分批写入": len(batches) > 1 and max(map(len, batches)) <= batch_size,
+        "断线后重连": all(e.connections >= 2 for e in exchanges.values()),
+    }
+    print(
+        f"收到 {len(rows)}/{expected} 根收盘K线，{len(batches)} 批，"
+        f"连接次数 {({s: e.connections for s, e in exchanges.items()})}"
+    )
+    return _report(checks)
+
+
+async def check_buffer_cap(max_buffer: int = 5) -> bool:
+    """写库持续失败时，缓冲区只保留最新的 max_buffer 根K线"""
+
+    async def failing_sink(rows: List[Dict]):
+        raise ConnectionError("数据库不可用")
+
+    ingester = PriceStreamIngester(
+        symbols=["BTC/USDT"],
+        intervals=["1h"],
+        sources=["binance"],
+        sink=failing_sink,
+        batch_size=2,
+        max_buffer=max_buffer,
+    )
+    for i in range(max_buffer * 3):
+        frame = binance_frame(
+            "BTC/USDT", "1h", START_MS + i * INTERVAL_MS["1h"], 100.0 + i, True
+        )
+        await ingester._handle_message("binance", json.dumps(frame))
+    buffer = ingester._buffer
+    return _report(
+        {
+            "缓冲区不超过上限": len(buffer) == max_buffer,
+            "保留最新的K线": buffer[-1]["close"] == 100.0 + max_buffer * 3 - 1,
+        }
+    )
+
+
+def _report(checks: Dict[str, bool]) -> bool:
+    for name, ok in checks.items():
+        print(f"  [{'OK' if ok else 'FAIL'}] {name}")
+    return all(checks.values())
+
+
+async def _main(args: argparse.Namespace) -> bool:
+    ok = await check_stream(args.candles, args.batch_size)
+    return await check_buffer_cap() and ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="用本地模拟的交易所 WebSocket 检验实时行情采集"
+    )
+    parser.add_argument("--candles", type=int, default=20, help="每个交易对推送的K线数")
+    parser.add_argument("--batch-size", type=int, default=8)
+    raise SystemExit(0 if asyncio.run(_main(parser.parse_args())) else 1)
@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
-from contextlib import contextmanager
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from contextlib import contextmanager, asynccontextmanager
+from typing import AsyncIterator
 import os
 from dotenv import load_dotenv
 
@@ -8,9 +10,25 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://localhost:5432/btc_agent")
 
+
+def _to_async_url(url: str) -> str:
+    """postgresql:// 或 postgresql+psycopg2:// -> postgresql+asyncpg://"""
+    scheme, rest = url.split("://", 1)
+    return f"postgresql+asyncpg://{rest}" if scheme.startswith("postgresql") else url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _to_async_url(DATABASE_URL)
+
+# 同步引擎：供命令行脚本和建表使用
 engine = create_engine(DATABASE_URL, pool_size=10, max_overflow=20)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎：供调度任务和 API 使用，不阻塞事件循环
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=10, max_overflow=20)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
 
 @contextmanager
 def get_db() -> Session:
@@ -23,3 +41,20 @@ def get_db() -> Session:
         raise
     finally:
         db.close()
+
+
+@asynccontextmanager
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """异步版 get_db
+
+    同步写入函数（如 writers.upsert_prices）可通过 await db.run_sync(func, ...) 复用。
+    """
+    db = AsyncSessionLocal()
+    try:
+        yield db
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        await db.close()
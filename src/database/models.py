@@ -1,6 +1,7 @@
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
     String,
     DECIMAL,
     TIMESTAMP,
@@ -8,22 +9,29 @@ from sqlalchemy import (
     ForeignKey,
     ARRAY,
     CheckConstraint,
+    UniqueConstraint,
+    Index,
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from pgvector.sqlalchemy import Vector
 
 Base = declarative_base()
 
 
+# prices / news 按月范围分区，分区的创建与归档见 schema.py。
+# PostgreSQL 要求分区表的主键和唯一约束包含分区键，因此主键为 (id, 时间列)。
+
+
 class Price(Base):
     __tablename__ = "prices"
 
-    id = Column(Integer, primary_key=True)
-    timestamp = Column(TIMESTAMP, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(TIMESTAMP(timezone=True), primary_key=True)
     source = Column(String(50), nullable=False)
-    symbol = Column(String(20), nullable=False, default="BTC/USDT")
+    symbol = Column(String(20), nullable=False)
+    interval = Column(String(10), nullable=False, default="1h", server_default="1h")
     open = Column(DECIMAL(18, 8))
     high = Column(DECIMAL(18, 8))
     close = Column(DECIMAL(18, 8))
@@ -31,27 +39,100 @@ class Price(Base):
     volume = Column(DECIMAL(18, 8))
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    __table_args__ = (
+        UniqueConstraint(
+            "symbol", "source", "interval", "timestamp", name="uq_prices_candle"
+        ),
+        # 覆盖索引：读取最近N根K线时可仅扫描索引
+        Index(
+            "idx_prices_symbol_source_ts",
+            "symbol",
+            "source",
+            "interval",
+            "timestamp",
+            postgresql_include=["open", "high", "low", "close", "volume"],
+        ),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+
+class PriceRollup(Base):
+    """由基础周期K线逐级聚合的高周期K线 (5m -> 1h -> 4h -> 1d)，见 rollups.py"""
+
+    __tablename__ = "price_rollups"
+
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String(20), nullable=False)
+    source = Column(String(50), nullable=False)
+    timeframe = Column(String(10), nullable=False)
+    bucket = Column(TIMESTAMP(timezone=True), nullable=False)  # 周期起始时间
+    open = Column(DECIMAL(18, 8))
+    high = Column(DECIMAL(18, 8))
+    low = Column(DECIMAL(18, 8))
+    close = Column(DECIMAL(18, 8))
+    volume = Column(DECIMAL(18, 8))
+    bar_count = Column(Integer, nullable=False)  # 参与聚合的下级K线数，不足说明周期未走完或有缺口
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # 同时服务于增量更新的冲突判断和“最近N根”的倒序读取
+        UniqueConstraint(
+            "symbol", "source", "timeframe", "bucket", name="uq_price_rollups_bar"
+        ),
+    )
+
 
 class News(Base):
     __tablename__ = "news"
 
-    id = Column(Integer, primary_key=True)
-    published_at = Column(TIMESTAMP, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    published_at = Column(TIMESTAMP(timezone=True), primary_key=True)
     source = Column(String(100), nullable=False)
     title = Column(Text, nullable=False)
     content = Column(Text)
     url = Column(Text)
+    canonical_url = Column(Text)
+    fingerprint = Column(BigInteger)  # 标题 SimHash
     sentiment_score = Column(DECIMAL(5, 4))
     keywords = Column(ARRAY(Text))
     embedding = Column(Vector(1536))
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    __table_args__ = (
+        Index("idx_news_published", "published_at"),
+        Index("idx_news_canonical_url", "canonical_url"),
+        Index("idx_news_fingerprint", "fingerprint"),
+        # 余弦距离的 HNSW 索引，RAG 检索 top-k 相似新闻
+        Index(
+            "idx_news_embedding",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+        # 待向量化的新闻
+        Index(
+            "idx_news_unembedded",
+            "published_at",
+            postgresql_where=text("embedding IS NULL"),
+        ),
+        # 待补情绪分数的历史新闻
+        Index(
+            "idx_news_unscored",
+            "published_at",
+            postgresql_where=text("sentiment_score IS NULL"),
+        ),
+        {"postgresql_partition_by": "RANGE (published_at)"},
+    )
+
 
 class Signal(Base):
     __tablename__ = "signals"
 
     id = Column(Integer, primary_key=True)
     timestamp = Column(TIMESTAMP, nullable=False)
+    # 早期版本只分析 BTC/USDT，升级前的信号此列为空
+    symbol = Column(String(20))
     signal_type = Column(String(20), nullable=False)
     confidence = Column(DECIMAL(5, 4), nullable=False)
     price = Column(DECIMAL(18, 8))
@@ -62,7 +143,11 @@ class Signal(Base):
     status = Column(String(20), default="PENDING")
     created_at = Column(TIMESTAMP, server_default=func.now())
 
-    __table_args__ = (CheckConstraint("signal_type IN ('BUY', 'SELL', 'HOLD')"),)
+    __table_args__ = (
+        CheckConstraint("signal_type IN ('BUY', 'SELL', 'HOLD')"),
+        Index("idx_signals_timestamp", "timestamp"),
+        Index("idx_signals_symbol_timestamp", "symbol", "timestamp"),
+    )
 
 
 class Feedback(Base):
@@ -97,10 +182,29 @@ class AgentDiscussion(Base):
     __tablename__ = "agent_discussions"
 
     id = Column(Integer, primary_key=True)
+    # 讨论轮次在完成时即写入，此时信号尚未生成；保存信号后按 run_id 补上 signal_id
     signal_id = Column(Integer, ForeignKey("signals.id"))
+    run_id = Column(String(64))
     round = Column(Integer, nullable=False)
     agent_name = Column(String(100), nullable=False)
     position = Column(String(20))
     argument = Column(Text)
     confidence = Column(DECIMAL(5, 4))
     created_at = Column(TIMESTAMP, server_default=func.now())
+
+    __table_args__ = (Index("idx_agent_discussions_run_id", "run_id"),)
+
+
+class WorkflowCheckpoint(Base):
+    """工作流各节点的输出，按运行 ID 保存，失败后重新触发时从已完成的节点之后继续"""
+
+    __tablename__ = "workflow_checkpoints"
+
+    run_id = Column(String(64), primary_key=True)
+    symbol = Column(String(20), nullable=False)
+    # 节点名 -> 该节点写入 AgentState 的字段
+    nodes = Column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+    __table_args__ = (Index("idx_workflow_checkpoints_expires_at", "expires_at"),)
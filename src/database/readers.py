@@ -0,0 +1,186 @@
+from datetime import datetime
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from sqlalchemy import BigInteger, Float, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import News, Price, PriceRollup, Signal
+from .rollups import rollup_chain
+from .writers import CONSOLIDATED_SOURCE
+from ..config import get_config
+from ..candle_batch import CandleBatch
+
+# 分析读取路径：只查询需要的列，不构造 ORM 对象，结果直接落到 NumPy 数组。
+# 类型转换（DECIMAL -> float8，时间 -> 毫秒整数）在 SQL 中完成，驱动直接返回原生类型。
+
+STREAM_CHUNK_SIZE = 10000
+
+
+def _to_array(values) -> np.ndarray:
+    array = np.asarray(values)
+    # 字符串列保持 object，与 CandleBatch 的标签列一致
+    return array.astype(object) if array.dtype.kind in "US" else array
+
+
+async def read_columns(
+    db: AsyncSession,
+    stmt,
+    stream: bool = False,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Dict[str, np.ndarray]:
+    """执行 Core 查询并按列返回 NumPy 数组
+
+    stream=True 时使用服务端游标按块拉取，每块转成数组后即释放行对象，
+    适合长时间范围的大结果集。
+    """
+    if stream:
+        result = await db.stream(stmt.execution_options(yield_per=chunk_size))
+        keys = list(result.keys())
+        chunks = [
+            [_to_array(column) for column in zip(*part)]
+            async for part in result.partitions(chunk_size)
+        ]
+        if not chunks:
+            return {key: np.empty(0) for key in keys}
+        return {
+            key: np.concatenate([chunk[i] for chunk in chunks])
+            for i, key in enumerate(keys)
+        }
+
+    result = await db.execute(stmt)
+    keys = list(result.keys())
+    rows = result.all()
+    if not rows:
+        return {key: np.empty(0) for key in keys}
+    return {key: _to_array(column) for key, column in zip(keys, zip(*rows))}
+
+
+async def read_frame(db: AsyncSession, stmt, stream: bool = False) -> pd.DataFrame:
+    return pd.DataFrame(await read_columns(db, stmt, stream=stream))
+
+
+async def read_records(db: AsyncSession, stmt) -> List[Dict]:
+    """小结果集按行返回 dict（如新闻列表），同样不经过 ORM"""
+    return [dict(row) for row in (await db.execute(stmt)).mappings()]
+
+
+def default_source() -> str:
+    """分析读取的单一K线来源
+
+    启用 prices.consolidate 时为合并K线，否则为 data_sources.price 中的第一个交易所；
+    不同交易所的K线混在一个序列中会使指标失真。
+    """
+    if get_config("prices.consolidate", False):
+        return CONSOLIDATED_SOURCE
+    return get_config("data_sources.price", ["okx"])[0]
+
+
+def candles_query(
+    symbol: str,
+    timeframe: str,
+    limit: int = None,
+    source: str = None,
+    start: datetime = None,
+    end: datetime = None,
+    rollup: bool = None,
+):
+    """K线投影查询，列与 CandleBatch 一一对应
+
+    聚合周期读 price_rollups，其余周期直接读 prices 中交易所原生的K线；
+    rollup 为 False 时聚合周期也读原生K线。
+    给出 limit 时按唯一索引倒序取最近 limit 根，代价 O(limit)；否则按时间升序取 [start, end] 范围。
+    """
+    if rollup is None:
+        rollup = timeframe in rollup_chain()[1:]
+    if rollup:
+        table = PriceRollup.__table__
+        ts, level = table.c.bucket, table.c.timeframe
+    else:
+        table = Price.__table__
+        ts, level = table.c.timestamp, table.c.interval
+
+    query = select(
+        cast(func.extract("epoch", ts) * 1000, BigInteger).label("timestamp"),
+        *[
+            cast(table.c[c], Float).label(c)
+            for c in ["open", "high", "low", "close", "volume"]
+        ],
+        table.c.source,
+        table.c.symbol,
+        level.label("interval"),
+    ).where(table.c.symbol == symbol, level == timeframe)
+    if source:
+        query = query.where(table.c.source == source)
+    # start/end 也可以是列表达式（如 LATERAL 子查询中外层的时间列）
+    if start is not None:
+        query = query.where(ts >= start)
+    if end is not None:
+        query = query.where(ts <= end)
+    if limit:
+        return query.order_by(ts.desc()).limit(limit)
+    return query.order_by(ts.asc())
+
+
+async def fetch_candles(
+    db: AsyncSession,
+    symbol: str,
+    timeframe: str,
+    limit: int = None,
+    source: str = None,
+    start: datetime = None,
+    end: datetime = None,
+    stream: bool = False,
+) -> CandleBatch:
+    """按时间升序返回K线批次，limit 为最近N根，或 start/end 指定的范围
+
+    未指定 source 时只读 default_source()。聚合周期由基础周期（通常只有实时行情写入）
+    逐级生成，实时行情未启用或中断时聚合表可能为空，此时退回交易所原生K线。
+    """
+    source = source or default_source()
+    columns = await read_columns(
+        db, candles_query(symbol, timeframe, limit, source, start, end), stream=stream
+    )
+    if not len(columns["timestamp"]) and timeframe in rollup_chain()[1:]:
+        columns = await read_columns(
+            db,
+            candles_query(symbol, timeframe, limit, source, start, end, rollup=False),
+            stream=stream,
+        )
+    if limit:
+        columns = {key: values[::-1] for key, values in columns.items()}
+    return CandleBatch.from_columns(columns)
+
+
+def news_query(limit: int = 50):
+    return (
+        select(
+            News.published_at,
+            News.source,
+            News.title,
+            News.content,
+            News.url,
+            cast(News.sentiment_score, Float).label("sentiment_score"),
+            News.keywords,
+        )
+        .order_by(News.published_at.desc())
+        .limit(limit)
+    )
+
+
+async def fetch_recent_news(db: AsyncSession, limit: int = 50) -> List[Dict]:
+    return await read_records(db, news_query(limit))
+
+
+async def fetch_latest_signals(
+    db: AsyncSession, limit: int = 10, symbol: str = None
+) -> List[Dict]:
+    query = select(
+        Signal.timestamp,
+        Signal.symbol,
+        Signal.signal_type,
+        cast(Signal.confidence, Float).label("confidence"),
+        Signal.reasoning,
+    )
+    if symbol:
+        query = query.where(Signal.symbol == symbol)
+    return await read_records(db, query.order_by(Signal.timestamp.desc()).limit(limit))
@@ -0,0 +1,166 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+from sqlalchemy import func, literal, literal_column, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, insert
+from sqlalchemy.orm import Session
+from .models import Price, PriceRollup
+from ..config import get_config
+from ..candle_batch import INTERVAL_MS, CandleBatch
+
+ROLLUP_FIELDS = ["open", "high", "low", "close", "volume", "bar_count"]
+
+
+def rollup_chain() -> List[str]:
+    """[基础周期, 高周期...]，每一级由上一级聚合而来；未配置时返回空列表"""
+    base = get_config("rollups.base_interval", None)
+    timeframes = get_config("rollups.timeframes", [])
+    if not base or not timeframes:
+        return []
+    chain = [base] + sorted(timeframes, key=INTERVAL_MS.get)
+    for lower, upper in zip(chain, chain[1:]):
+        if INTERVAL_MS[upper] % INTERVAL_MS[lower]:
+            raise ValueError(f"{upper} 不是 {lower} 的整数倍，无法逐级聚合")
+    return chain
+
+
+def _from_ms(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+
+def _affected_ranges(
+    candles: CandleBatch, base: str, extra_sources: List[str]
+) -> Dict[Tuple[str, str], Tuple[int, int]]:
+    """每个 (symbol, source) 本批涉及的基础周期时间范围 [lo, hi)，毫秒"""
+    batch = candles.take(candles.interval == base)
+    ranges = {}
+    for symbol, source, ts in zip(
+        batch.symbol.tolist(), batch.source.tolist(), batch.timestamp.tolist()
+    ):
+        for key in [(symbol, source)] + [(symbol, s) for s in extra_sources]:
+            lo, hi = ranges.get(key, (ts, ts))
+            ranges[key] = (min(lo, ts), max(hi, ts + INTERVAL_MS[base]))
+    return ranges
+
+
+def _rollup(
+    db: Session,
+    lower: str,
+    timeframe: str,
+    symbol: str,
+    source: str,
+    lo: int,
+    hi: int,
+    from_prices: bool,
+):
+    """用下一级K线重算 [lo, hi) 内 timeframe 周期的聚合K线
+
+    from_prices 为 True 时下一级是 prices 中的基础周期K线，否则是 price_rollups 中的上一级聚合。
+    """
+    if from_prices:
+        table = Price.__table__
+        ts = table.c.timestamp
+        level = table.c.interval == lower
+        count = func.count()
+    else:
+        table = PriceRollup.__table__
+        ts = table.c.bucket
+        level = table.c.timeframe == lower
+        count = func.sum(table.c.bar_count)
+
+    # 周期和起点以字面量写入，保证 SELECT 与 GROUP BY 中的表达式完全一致
+    bucket = func.date_bin(
+        literal_column(f"INTERVAL '{INTERVAL_MS[timeframe] // 1000} seconds'"),
+        ts,
+        literal_column("TIMESTAMPTZ 'epoch'"),
+    )
+    aggregated = (
+        select(
+            table.c.symbol,
+            table.c.source,
+            literal(timeframe).label("timeframe"),
+            bucket.label("bucket"),
+            array_agg(aggregate_order_by(table.c.open, ts.asc()))[1],
+            func.max(table.c.high),
+            func.min(table.c.low),
+            array_agg(aggregate_order_by(table.c.close, ts.desc()))[1],
+            func.sum(table.c.volume),
+            count,
+        )
+        .where(
+            level,
+            table.c.symbol == symbol,
+            table.c.source == source,
+            ts >= _from_ms(lo),
+            ts < _from_ms(hi),
+        )
+        .group_by(table.c.symbol, table.c.source, bucket)
+    )
+
+    stmt = insert(PriceRollup).from_select(
+        ["symbol", "source", "timeframe", "bucket"] + ROLLUP_FIELDS, aggregated
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_price_rollups_bar",
+        set_={
+            **{field: stmt.excluded[field] for field in ROLLUP_FIELDS},
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt)
+
+
+def update_rollups(
+    db: Session, candles: CandleBatch, extra_sources: List[str] = ()
+) -> int:
+    """新的基础周期K线落库后，逐级重算受影响的高周期K线
+
+    只重算本批K线所在的周期桶，未走完的周期会随后续K线不断被覆盖。
+    extra_sources 用于跨交易所合并K线这类由同批数据派生、不在批次中的来源。
+    返回重算的 (symbol, source, timeframe) 数量。
+    """
+    chain = rollup_chain()
+    if not chain or not len(candles):
+        return 0
+    return _update_ranges(
+        db, chain, _affected_ranges(candles, chain[0], list(extra_sources))
+    )
+
+
+def rebuild_rollups(db: Session, start: datetime, end: datetime = None) -> int:
+    """按库中已有的基础周期K线重建 [start, end) 内的全部聚合K线
+
+    用于首次启用聚合或修改周期配置后，补上此前已落库数据的高周期K线。
+    """
+    chain = rollup_chain()
+    if not chain:
+        return 0
+    end = end or datetime.now(timezone.utc)
+    prices = Price.__table__
+    pairs = db.execute(
+        select(prices.c.symbol, prices.c.source)
+        .where(prices.c.interval == chain[0], prices.c.timestamp >= start)
+        .distinct()
+    ).all()
+    lo, hi = int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+    return _update_ranges(
+        db, chain, {(symbol, source): (lo, hi) for symbol, source in pairs}
+    )
+
+
+def _update_ranges(
+    db: Session, chain: List[str], ranges: Dict[Tuple[str, str], Tuple[int, int]]
+) -> int:
+    updated = 0
+    for lower, timeframe in zip(chain, chain[1:]):
+        step = INTERVAL_MS[timeframe]
+        # 扩展到完整的周期桶，上一级重算的范围正好覆盖下一级受影响的桶
+        ranges = {
+            key: (lo // step * step, -(-hi // step) * step)
+            for key, (lo, hi) in ranges.items()
+        }
+        for (symbol, source), (lo, hi) in ranges.items():
+            _rollup(
+                db, lower, timeframe, symbol, source, lo, hi, lower == chain[0]
+            )
+            updated += 1
+    return updated
@@ -0,0 +1,261 @@
+from datetime import datetime, timezone
+from typing import Dict, List
+from sqlalchemy import UniqueConstraint, inspect, literal, text
+from sqlalchemy.engine import Connection
+from .models import Base
+from ..config import get_config
+
+# 按月范围分区的表 -> 分区键
+PARTITIONED_TABLES = {"prices": "timestamp", "news": "published_at"}
+
+
+def _utc(dt: datetime) -> datetime:
+    """无时区的时间按本地时间处理，与 datetime.timestamp() 一致"""
+    return dt.astimezone(timezone.utc)
+
+
+def _month_start(dt: datetime) -> datetime:
+    return _utc(dt).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_months(dt: datetime, months: int) -> datetime:
+    index = dt.year * 12 + dt.month - 1 + months
+    return dt.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def _is_partitioned(conn: Connection, table: str) -> bool:
+    return bool(
+        conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p "
+                "JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+            ),
+            {"table": table},
+        ).scalar()
+    )
+
+
+def list_partitions(conn: Connection, table: str) -> List[str]:
+    """列出当前挂载在分区表下的子分区"""
+    rows = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table AND pg_table_is_visible(p.oid) "
+            "ORDER BY c.relname"
+        ),
+        {"table": table},
+    )
+    return [name for (name,) in rows]
+
+
+def ensure_partitions(
+    conn: Connection, table: str, start: datetime, end: datetime
+) -> List[str]:
+    """创建覆盖 [start, end] 的月分区，已存在的跳过，返回新建的分区名"""
+    created = []
+    existing = set(list_partitions(conn, table))
+    month = _month_start(start)
+    while month <= _utc(end):
+        name = partition_name(table, month)
+        if name not in existing:
+            upper = _add_months(month, 1)
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+                )
+            )
+            created.append(name)
+        month = _add_months(month, 1)
+    return created
+
+
+def detach_partitions(conn: Connection, table: str, before: datetime) -> List[str]:
+    """把整月早于 before 的分区从主表摘下
+
+    摘下的分区保留为普通表，可单独归档或删除，不再参与查询和索引维护。
+    """
+    cutoff = _month_start(before)
+    detached = []
+    prefix = f"{table}_p"
+    for name in list_partitions(conn, table):
+        suffix = name[len(prefix) :]
+        if not name.startswith(prefix) or not suffix.isdigit():
+            continue
+        month = datetime.strptime(suffix, "%Y%m").replace(tzinfo=timezone.utc)
+        if _add_months(month, 1) <= cutoff:
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            detached.append(name)
+    return detached
+
+
+def maintain_partitions(conn: Connection, now: datetime = None) -> Dict[str, Dict]:
+    """提前创建未来的月分区，并摘下超出保留期的旧分区
+
+    由调度器每天执行一次；启动时 init_schema 也会调用。
+    """
+    now = now or datetime.now(timezone.utc)
+    ahead = get_config("storage.partition_months_ahead", 2)
+    result = {}
+    for table in PARTITIONED_TABLES:
+        created = ensure_partitions(conn, table, now, _add_months(_month_start(now), ahead))
+        retention = get_config(f"storage.retention_months.{table}", None)
+        detached = (
+            detach_partitions(conn, table, _add_months(_month_start(now), -retention))
+            if retention
+            else []
+        )
+        result[table] = {"created": created, "detached": detached}
+    return result
+
+
+def _legacy_timezone() -> str:
+    """旧版无时区时间所在的时区，用于 AT TIME ZONE
+
+    默认为本机当前的 UTC 偏移（ISO 符号，东区为正）；主机改过时区或
+    旧数据跨夏令时切换时，用 storage.legacy_timezone 指定 IANA 时区名。
+    """
+    name = get_config("storage.legacy_timezone", None)
+    if name:
+        return "'" + name.replace("'", "''") + "'"
+    offset = datetime.now().astimezone().utcoffset()
+    minutes = int(offset.total_seconds() // 60)
+    sign = "-" if minutes < 0 else "+"
+    return f"INTERVAL '{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}'"
+
+
+def _migrate_to_partitioned(conn: Connection, table: str):
+    """把旧版未分区的表迁移为分区表
+
+    旧表连同索引、序列改名保留，按月建好分区后去重复制，再删除旧表。
+    """
+    legacy = f"{table}_legacy"
+    quote = conn.dialect.identifier_preparer.quote
+    column = quote(PARTITIONED_TABLES[table])
+    print(f"迁移 {table} 为按月分区表")
+
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    # 索引和序列名在同一 schema 内必须唯一，新表建表前先给旧表的让路
+    indexes = conn.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :table"),
+        {"table": legacy},
+    ).all()
+    for (index,) in indexes:
+        conn.execute(text(f"ALTER INDEX {index} RENAME TO {index}_legacy"))
+    sequence = conn.execute(
+        text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": legacy}
+    ).scalar()
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {table}_id_seq_legacy"))
+
+    target = Base.metadata.tables[table]
+    target.create(conn)
+
+    # 旧表可能缺少后来新增的列：有服务端默认值或可空的列不复制，
+    # 非空且只有 Python 端默认值的列按默认值写入常量。
+    # 旧版用 datetime.fromtimestamp 写入无时区的本机本地时间，按本机时区转换
+    legacy_types = {c["name"]: c["type"] for c in inspect(conn).get_columns(legacy)}
+    legacy_zone = _legacy_timezone()
+    names, values = [], []
+    for c in target.columns:
+        if c.name not in legacy_types:
+            if c.nullable or c.server_default is not None:
+                continue
+            if c.default is None or not c.default.is_scalar:
+                raise RuntimeError(f"无法迁移 {table}：旧表缺少非空列 {c.name}")
+            value = literal(c.default.arg, c.type).compile(
+                dialect=conn.dialect, compile_kwargs={"literal_binds": True}
+            )
+            names.append(quote(c.name))
+            values.append(str(value))
+            continue
+        value = quote(c.name)
+        if getattr(c.type, "timezone", False) and not getattr(
+            legacy_types[c.name], "timezone", True
+        ):
+            value = f"{value} AT TIME ZONE {legacy_zone}"
+        names.append(quote(c.name))
+        values.append(value)
+    key = dict(zip(names, values))[column]
+
+    lower, upper = conn.execute(
+        text(f"SELECT min({key}), max({key}) FROM {legacy}")
+    ).one()
+    if lower is not None:
+        ensure_partitions(conn, table, lower, upper)
+
+    # 旧版 create_all 建的表没有唯一约束，可能已有重复轮询写入的K线。
+    # 按新表的唯一键去重，保留最后写入（id 最大）的一行
+    unique = next(
+        (c for c in target.constraints if isinstance(c, UniqueConstraint)), None
+    )
+    select_sql = f"SELECT {', '.join(values)} FROM {legacy}"
+    # 旧表没有的键列（如 interval）在所有行上取同一个默认值，不参与去重
+    keys = ", ".join(
+        quote(c.name) for c in getattr(unique, "columns", []) if c.name in legacy_types
+    )
+    if keys:
+        select_sql = (
+            f"SELECT DISTINCT ON ({keys}) {', '.join(values)} FROM {legacy} "
+            f"ORDER BY {keys}, id DESC"
+        )
+    # 其余冲突（如主键重复）直接跳过，不让迁移中止启动
+    conn.execute(
+        text(
+            f"INSERT INTO {table} ({', '.join(names)}) {select_sql} "
+            "ON CONFLICT DO NOTHING"
+        )
+    )
+    conn.execute(
+        text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT COALESCE(max(id), 0) + 1 FROM {table}), false)"
+        )
+    )
+    conn.execute(text(f"DROP TABLE {legacy}"))
+
+
+def _add_missing_columns(conn: Connection, table):
+    """为已有表补上新增的可空列，如 signals.symbol"""
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing or not column.nullable:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.execute(
+            text(
+                f"ALTER TABLE {table.name} "
+                f"ADD COLUMN IF NOT EXISTS {column.name} {column_type}"
+            )
+        )
+
+
+def init_schema(conn: Connection):
+    """建表、补齐索引并维护分区，可在每次启动时重复执行
+
+    取代启动时的 Base.metadata.create_all：分区表需要单独建分区，
+    旧版未分区的 prices / news 会被迁移，已有表上缺失的可空列和索引也会补建。
+    """
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+
+    existing = set(inspect(conn).get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            table.create(conn)
+        elif table.name in PARTITIONED_TABLES and not _is_partitioned(
+            conn, table.name
+        ):
+            _migrate_to_partitioned(conn, table.name)
+        else:
+            _add_missing_columns(conn, table)
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+    maintain_partitions(conn)
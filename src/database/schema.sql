@@ -1,44 +1,76 @@
 -- Enable pgvector extension
 CREATE EXTENSION IF NOT EXISTS vector;
 
--- Prices table
+-- 应用启动时由 src/database/schema.py 的 init_schema 建表并维护分区，
+-- 本文件仅供手工初始化参考。prices / news 按月范围分区，月分区在启动时创建。
+
+-- Prices table (partitioned by month)
 CREATE TABLE IF NOT EXISTS prices (
-    id SERIAL PRIMARY KEY,
-    timestamp TIMESTAMP NOT NULL,
+    id SERIAL,
+    timestamp TIMESTAMPTZ NOT NULL,
     source VARCHAR(50) NOT NULL,
-    symbol VARCHAR(20) NOT NULL DEFAULT 'BTC/USDT',
+    symbol VARCHAR(20) NOT NULL,
+    interval VARCHAR(10) NOT NULL DEFAULT '1h',
     open DECIMAL(18, 8),
     high DECIMAL(18, 8),
     low DECIMAL(18, 8),
     close DECIMAL(18, 8),
     volume DECIMAL(18, 8),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE(timestamp, source, symbol)
-);
+    PRIMARY KEY (id, timestamp),
+    CONSTRAINT uq_prices_candle UNIQUE(symbol, source, interval, timestamp)
+) PARTITION BY RANGE (timestamp);
 
-CREATE INDEX idx_prices_timestamp ON prices(timestamp DESC);
+CREATE INDEX idx_prices_symbol_source_ts ON prices(symbol, source, interval, timestamp)
+    INCLUDE (open, high, low, close, volume);
 
--- News table
-CREATE TABLE IF NOT EXISTS news (
+-- Higher-timeframe candles aggregated from the base interval (5m -> 1h -> 4h -> 1d)
+CREATE TABLE IF NOT EXISTS price_rollups (
     id SERIAL PRIMARY KEY,
-    published_at TIMESTAMP NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    source VARCHAR(50) NOT NULL,
+    timeframe VARCHAR(10) NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    open DECIMAL(18, 8),
+    high DECIMAL(18, 8),
+    low DECIMAL(18, 8),
+    close DECIMAL(18, 8),
+    volume DECIMAL(18, 8),
+    bar_count INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_price_rollups_bar UNIQUE(symbol, source, timeframe, bucket)
+);
+
+-- News table (partitioned by month)
+CREATE TABLE IF NOT EXISTS news (
+    id SERIAL,
+    published_at TIMESTAMPTZ NOT NULL,
     source VARCHAR(100) NOT NULL,
     title TEXT NOT NULL,
     content TEXT,
     url TEXT,
+    canonical_url TEXT,
+    fingerprint BIGINT,
     sentiment_score DECIMAL(5, 4),
     keywords TEXT[],
     embedding vector(1536),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, published_at)
+) PARTITION BY RANGE (published_at);
 
-CREATE INDEX idx_news_published ON news(published_at DESC);
-CREATE INDEX idx_news_embedding ON news USING ivfflat (embedding vector_cosine_ops);
+CREATE INDEX idx_news_published ON news(published_at);
+CREATE INDEX idx_news_canonical_url ON news(canonical_url);
+CREATE INDEX idx_news_fingerprint ON news(fingerprint);
+CREATE INDEX idx_news_embedding ON news USING hnsw (embedding vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+CREATE INDEX idx_news_unembedded ON news(published_at) WHERE embedding IS NULL;
+CREATE INDEX idx_news_unscored ON news(published_at) WHERE sentiment_score IS NULL;
 
 -- Signals table
 CREATE TABLE IF NOT EXISTS signals (
     id SERIAL PRIMARY KEY,
     timestamp TIMESTAMP NOT NULL,
+    symbol VARCHAR(20),
     signal_type VARCHAR(20) NOT NULL CHECK (signal_type IN ('BUY', 'SELL', 'HOLD')),
     confidence DECIMAL(5, 4) NOT NULL,
     price DECIMAL(18, 8),
@@ -51,6 +83,7 @@ CREATE TABLE IF NOT EXISTS signals (
 );
 
 CREATE INDEX idx_signals_timestamp ON signals(timestamp DESC);
+CREATE INDEX idx_signals_symbol_timestamp ON signals(symbol, timestamp);
 
 -- Feedback table
 CREATE TABLE IF NOT EXISTS feedback (
@@ -83,6 +116,7 @@ CREATE TABLE IF NOT EXISTS models_eval (
 CREATE TABLE IF NOT EXISTS agent_discussions (
     id SERIAL PRIMARY KEY,
     signal_id INTEGER REFERENCES signals(id),
+    run_id VARCHAR(64),
     round INTEGER NOT NULL,
     agent_name VARCHAR(100) NOT NULL,
     position VARCHAR(20),
@@ -90,3 +124,16 @@ CREATE TABLE IF NOT EXISTS agent_discussions (
     confidence DECIMAL(5, 4),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+
+CREATE INDEX idx_agent_discussions_run_id ON agent_discussions(run_id);
+
+-- Workflow checkpoints: per-node outputs keyed by run ID
+CREATE TABLE IF NOT EXISTS workflow_checkpoints (
+    run_id VARCHAR(64) PRIMARY KEY,
+    symbol VARCHAR(20) NOT NULL,
+    nodes JSONB NOT NULL DEFAULT '{}'::jsonb,
+    expires_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_workflow_checkpoints_expires_at ON workflow_checkpoints(expires_at);
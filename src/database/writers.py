@@ -0,0 +1,238 @@
+import csv
+import io
+import os
+from typing import Dict, Iterable, List, Sequence
+from sqlalchemy import column, func, literal, select, table, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+from .models import Price, News, AgentDiscussion
+from .rollups import update_rollups
+from ..candle_batch import CandleBatch
+
+PRICE_FIELDS = ["open", "high", "low", "close", "volume"]
+PRICE_COLUMNS = ["symbol", "source", "interval", "timestamp"] + PRICE_FIELDS
+CONSOLIDATED_SOURCE = "consolidated"
+
+# 多行 INSERT 每批行数（受 PostgreSQL 单条语句 65535 个参数限制）
+BULK_BATCH_SIZE = 1000
+# 超过该行数时改用 COPY 写入
+COPY_THRESHOLD = int(os.getenv("BULK_COPY_THRESHOLD", 5000))
+
+
+def _chunks(rows: Sequence, size: int) -> Iterable[Sequence]:
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
+
+def _on_conflict(stmt, constraint: str, update_fields: List[str] = None):
+    if not update_fields:
+        return stmt.on_conflict_do_nothing(constraint=constraint)
+    return stmt.on_conflict_do_update(
+        constraint=constraint,
+        set_={field: stmt.excluded[field] for field in update_fields},
+    )
+
+
+def bulk_insert(
+    db: Session,
+    model,
+    rows: List[Dict],
+    constraint: str = None,
+    update_fields: List[str] = None,
+    batch_size: int = BULK_BATCH_SIZE,
+) -> int:
+    """多行 INSERT ... VALUES 批量写入，每批一次往返
+
+    指定 constraint 时冲突行执行 DO UPDATE（给出 update_fields）或 DO NOTHING。
+    """
+    for chunk in _chunks(rows, batch_size):
+        stmt = insert(model).values(list(chunk))
+        if constraint:
+            stmt = _on_conflict(stmt, constraint, update_fields)
+        db.execute(stmt)
+    return len(rows)
+
+
+def copy_insert(
+    db: Session,
+    model,
+    rows: List[Dict],
+    columns: List[str],
+    constraint: str = None,
+    update_fields: List[str] = None,
+) -> int:
+    """COPY 到临时表，再用一条 INSERT ... SELECT 合并到目标表
+
+    COPY 本身不支持冲突处理，经临时表中转后仍可 ON CONFLICT。
+    仅适用于标量列（不含数组、向量列）。
+    同时支持 psycopg2 会话和经 AsyncSession.run_sync 调用的 asyncpg 会话。
+    """
+    if not rows:
+        return 0
+
+    target = model.__table__.name
+    staging = f"_staging_{target}"
+    column_list = ", ".join(columns)
+    db.execute(
+        text(
+            f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+            f"SELECT {column_list} FROM {target} WITH NO DATA"
+        )
+    )
+
+    driver = db.connection().connection.driver_connection
+    if hasattr(driver, "copy_records_to_table"):
+        # asyncpg：二进制 COPY，run_sync 的 greenlet 中等待协程完成
+        await_only(
+            driver.copy_records_to_table(
+                staging,
+                records=[tuple(row[c] for c in columns) for row in rows],
+                columns=columns,
+            )
+        )
+    else:
+        buffer = io.StringIO()
+        # 非数值列加引号，以区分空字符串与 NULL（未加引号的空值）
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        for row in rows:
+            writer.writerow([row[c] for c in columns])
+        buffer.seek(0)
+
+        cursor = driver.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        finally:
+            cursor.close()
+
+    source = select(*[column(c) for c in columns]).select_from(table(staging))
+    stmt = insert(model).from_select(columns, source)
+    if constraint:
+        stmt = _on_conflict(stmt, constraint, update_fields)
+    db.execute(stmt)
+    db.execute(text(f"DROP TABLE {staging}"))
+    return len(rows)
+
+
+def upsert_prices(
+    db: Session, candles: CandleBatch, consolidate: bool = False
+) -> int:
+    """按 (symbol, source, interval, timestamp) 幂等写入K线
+
+    未收盘K线被重复采集时更新已有行而不是新增一行。
+    大批量（如回补）走 COPY，小批量走多行 INSERT。
+    consolidate=True 时，同时根据库中各交易所的K线重算一根跨交易所合并K线。
+    写入基础周期K线后会逐级更新受影响的高周期聚合K线。
+    """
+    if not len(candles):
+        return 0
+
+    rows = candles.to_records()
+    if len(rows) >= COPY_THRESHOLD:
+        copy_insert(db, Price, rows, PRICE_COLUMNS, "uq_prices_candle", PRICE_FIELDS)
+    else:
+        bulk_insert(db, Price, rows, "uq_prices_candle", PRICE_FIELDS)
+
+    if consolidate:
+        keys = list({(r["symbol"], r["interval"], r["timestamp"]) for r in rows})
+        for chunk in _chunks(keys, BULK_BATCH_SIZE):
+            _upsert_consolidated(db, list(chunk))
+
+    update_rollups(db, candles, [CONSOLIDATED_SOURCE] if consolidate else [])
+    return len(rows)
+
+
+def insert_news(db: Session, news_list: List[Dict]) -> int:
+    return bulk_insert(db, News, news_list)
+
+
+def _round_row(signal_id: int, record: Dict, run_id: str = None) -> Dict:
+    return {
+        "signal_id": signal_id,
+        "run_id": run_id,
+        "round": record["round"],
+        "agent_name": record.get("agent", "DiscussionAgent"),
+        "position": record.get("position"),
+        "argument": record.get("argument"),
+        "confidence": record.get("confidence"),
+    }
+
+
+def insert_discussion_round(db: Session, run_id: str, record: Dict) -> int:
+    """讨论每完成一轮即写入，信号保存前 signal_id 为空"""
+    return bulk_insert(db, AgentDiscussion, [_round_row(None, record, run_id)])
+
+
+def insert_agent_discussions(
+    db: Session,
+    signal_id: int,
+    opinions: List[Dict],
+    rounds: List[Dict],
+    run_id: str = None,
+) -> int:
+    """记录一次分析的讨论过程
+
+    第 0 轮为各分析 Agent 的初始观点，之后每轮为讨论主持人的阶段性共识。
+    已由 insert_discussion_round 写入的轮次（stored 为真）不再重复插入，
+    只按 run_id 关联到本信号。
+    """
+    if run_id:
+        db.execute(
+            update(AgentDiscussion)
+            .where(
+                AgentDiscussion.run_id == run_id,
+                AgentDiscussion.signal_id.is_(None),
+            )
+            .values(signal_id=signal_id)
+        )
+    rows = [
+        {
+            "signal_id": signal_id,
+            "run_id": run_id,
+            "round": 0,
+            "agent_name": opinion.get("agent", "unknown"),
+            "position": opinion.get("signal"),
+            "argument": opinion.get("reasoning"),
+            "confidence": opinion.get("confidence"),
+        }
+        for opinion in opinions
+    ]
+    rows += [_round_row(signal_id, r, run_id) for r in rounds if not r.get("stored")]
+    return bulk_insert(db, AgentDiscussion, rows)
+
+
+def _upsert_consolidated(db: Session, keys: List[tuple]):
+    """合并K线：开盘/收盘价按成交量加权，最高/最低取极值，成交量求和"""
+    prices = Price.__table__
+
+    def volume_weighted(col):
+        return func.coalesce(
+            func.sum(col * prices.c.volume)
+            / func.nullif(func.sum(prices.c.volume), 0),
+            func.avg(col),
+        )
+
+    merged = (
+        select(
+            prices.c.symbol,
+            literal(CONSOLIDATED_SOURCE).label("source"),
+            prices.c.interval,
+            prices.c.timestamp,
+            volume_weighted(prices.c.open),
+            func.max(prices.c.high),
+            func.min(prices.c.low),
+            volume_weighted(prices.c.close),
+            func.sum(prices.c.volume),
+        )
+        .where(
+            prices.c.source != CONSOLIDATED_SOURCE,
+            tuple_(prices.c.symbol, prices.c.interval, prices.c.timestamp).in_(keys),
+        )
+        .group_by(prices.c.symbol, prices.c.interval, prices.c.timestamp)
+    )
+
+    stmt = insert(Price).from_select(PRICE_COLUMNS, merged)
+    db.execute(_on_conflict(stmt, "uq_prices_candle", PRICE_FIELDS))
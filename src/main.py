@@ -1,8 +1,10 @@
 import asyncio
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from .scheduler.tasks import TaskScheduler
-from .database.connection import engine
-from .database.models import Base
+from .database.connection import async_engine
+from .database.schema import init_schema
+from .services.llm_cache import get_llm_cache
 import uvicorn
 
 app = FastAPI(title="BTC Smart Agent System", version="1.0.0")
@@ -13,8 +15,9 @@ scheduler = TaskScheduler()
 @app.on_event("startup")
 async def startup_event():
     """启动时初始化"""
-    # 创建数据库表
-    Base.metadata.create_all(bind=engine)
+    # 建表、迁移并创建分区
+    async with async_engine.begin() as conn:
+        await conn.run_sync(init_schema)
 
     # 启动调度器
     scheduler.start()
@@ -26,6 +29,10 @@ async def startup_event():
 async def shutdown_event():
     """关闭时清理"""
     scheduler.stop()
+    await scheduler.close()
+    await async_engine.dispose()
+    if get_llm_cache() is not None:
+        await get_llm_cache().close()
     print("👋 系统已关闭")
 
 
@@ -40,7 +47,16 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "circuits": scheduler.http_client.circuit_states(),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 指标（LLM 缓存命中率等）"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.post("/analyze/manual")
@@ -50,25 +66,33 @@ async def manual_analysis():
     return {"message": "分析已触发"}
 
 
+@app.post("/backfill")
+async def backfill(days: int = None):
+    """手动触发历史K线回补"""
+    stats = await scheduler.backfill_prices(days)
+    return {"message": "回补完成", "stats": stats}
+
+
 @app.get("/signals/latest")
-async def get_latest_signals():
-    """获取最新信号"""
-    from .database.connection import get_db
-    from .database.models import Signal
-
-    with get_db() as db:
-        signals = db.query(Signal).order_by(Signal.timestamp.desc()).limit(10).all()
-        return {
-            "signals": [
-                {
-                    "timestamp": s.timestamp.isoformat(),
-                    "signal": s.signal_type,
-                    "confidence": float(s.confidence),
-                    "reasoning": s.reasoning,
-                }
-                for s in signals
-            ]
-        }
+async def get_latest_signals(symbol: str = None):
+    """获取最新信号，可按交易对筛选"""
+    from .database.connection import get_async_db
+    from .database.readers import fetch_latest_signals
+
+    async with get_async_db() as db:
+        signals = await fetch_latest_signals(db, limit=10, symbol=symbol)
+    return {
+        "signals": [
+            {
+                "timestamp": s["timestamp"].isoformat(),
+                "symbol": s["symbol"],
+                "signal": s["signal_type"],
+                "confidence": s["confidence"],
+                "reasoning": s["reasoning"],
+            }
+            for s in signals
+        ]
+    }
 
 
 if __name__ == "__main__":
@@ -2,30 +2,57 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from ..data_collectors.price_collector import PriceCollector
 from ..data_collectors.news_collector import NewsCollector
-from ..workflow.graph import BTCAgentWorkflow
+from ..data_collectors.http_client import HTTPClientManager
+from ..data_collectors.backfill import BackfillEngine
+from ..data_collectors.stream_collector import PriceStreamIngester
+from ..workflow.graph import AgentWorkflow
 from ..services.notification_service import NotificationService
-from ..database.connection import get_db
-from ..database.models import Price, News, Signal
-from datetime import datetime
+from ..services.embedding_service import embed_pending_news
+from ..services.sentiment_service import score_news, score_pending_news
+from ..database.connection import get_async_db, async_engine
+from ..database.schema import maintain_partitions
+from ..database.rollups import rebuild_rollups
+from ..database.readers import fetch_candles, fetch_recent_news
+from ..database.models import Signal
+from ..database.writers import (
+    upsert_prices,
+    insert_news,
+    insert_agent_discussions,
+)
+from ..data_collectors.candle_merge import normalize_candles
+from ..config import get_config
+from sqlalchemy import select
+from datetime import datetime, timedelta
+from typing import Dict, List
 import asyncio
 
 
 class TaskScheduler:
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
-        self.price_collector = PriceCollector()
-        self.news_collector = NewsCollector()
-        self.workflow = BTCAgentWorkflow()
+        # 所有采集器共享同一个连接池
+        self.http_client = HTTPClientManager()
+        self.price_collector = PriceCollector(self.http_client)
+        self.news_collector = NewsCollector(self.http_client)
+        self.backfill_engine = BackfillEngine(self.price_collector)
+        self.stream_ingester = (
+            PriceStreamIngester() if get_config("streaming.enabled", False) else None
+        )
+        self.workflow = AgentWorkflow()
         self.notifier = NotificationService()
 
     def start(self):
         """启动所有定时任务"""
-        # 每5分钟更新价格
-        self.scheduler.add_job(
-            self.collect_prices,
-            CronTrigger.from_crontab("*/5 * * * *"),
-            id="price_update",
-        )
+        if self.stream_ingester:
+            # 实时行情推送，无需轮询
+            asyncio.ensure_future(self.stream_ingester.start())
+        else:
+            # 每5分钟更新价格
+            self.scheduler.add_job(
+                self.collect_prices,
+                CronTrigger.from_crontab("*/5 * * * *"),
+                id="price_update",
+            )
 
         # 每15分钟更新新闻
         self.scheduler.add_job(
@@ -46,108 +73,210 @@ class TaskScheduler:
             id="evaluation",
         )
 
+        # 每天预建未来的月分区并摘下过期分区
+        self.scheduler.add_job(
+            self.maintain_partitions,
+            CronTrigger.from_crontab("30 0 * * *"),
+            id="partition_maintenance",
+        )
+
+        # 启动时补齐停机期间缺失的K线（一次性任务）
+        if get_config("backfill.on_startup", False):
+            self.scheduler.add_job(self.backfill_prices, id="backfill_startup")
+
         self.scheduler.start()
         print("调度器已启动")
 
     async def collect_prices(self):
         """采集价格数据"""
         try:
-            prices = await self.price_collector.collect_all()
+            prices = normalize_candles(await self.price_collector.collect_all())
 
-            with get_db() as db:
-                for price_data in prices:
-                    price = Price(**price_data)
-                    db.add(price)
+            # 未收盘K线每次轮询都会返回，按唯一键覆盖而不是重复插入
+            async with get_async_db() as db:
+                await db.run_sync(
+                    upsert_prices,
+                    prices,
+                    consolidate=get_config("prices.consolidate", False),
+                )
 
             print(f"采集了 {len(prices)} 条价格数据")
         except Exception as e:
             print(f"价格采集失败: {e}")
 
+    async def backfill_prices(self, days: int = None):
+        """回补历史K线，只拉取 prices 表中缺失的区间"""
+        try:
+            days = days or get_config("backfill.lookback_days", 30)
+            start = datetime.now() - timedelta(days=days)
+            stats = await self.backfill_engine.run(
+                symbols=get_config("data_sources.symbols", ["BTC/USDT"]),
+                intervals=get_config("backfill.intervals", ["1h"]),
+                start=start,
+                sources=get_config("data_sources.price", None),
+            )
+            print(f"回补了 {stats['candles']} 条K线 ({stats['failed']} 页失败)")
+
+            # 回补只写入缺口，已有K线的高周期聚合在这里统一补齐
+            async with get_async_db() as db:
+                await db.run_sync(rebuild_rollups, start.astimezone())
+            return stats
+        except Exception as e:
+            print(f"K线回补失败: {e}")
+
     async def collect_news(self):
         """采集新闻数据"""
         try:
             news_list = await self.news_collector.collect_all()
+            # 入库时打一次情绪分，分析时不再逐条交给 LLM 重复判断
+            score_news(news_list)
+
+            async with get_async_db() as db:
+                await db.run_sync(insert_news, news_list)
 
-            with get_db() as db:
-                for news_data in news_list:
-                    news = News(**news_data)
-                    db.add(news)
+            # 写库成功后再确认指纹和增量游标，失败的新闻下一轮仍可重试
+            self.news_collector.commit(news_list)
 
             print(f"采集了 {len(news_list)} 条新闻")
         except Exception as e:
             print(f"新闻采集失败: {e}")
 
-    async def run_analysis(self):
-        """执行完整分析流程"""
         try:
-            # 获取最新数据
-            with get_db() as db:
-                prices = (
-                    db.query(Price).order_by(Price.timestamp.desc()).limit(100).all()
-                )
-                news = db.query(News).order_by(News.published_at.desc()).limit(50).all()
-
-            prices_data = [self._price_to_dict(p) for p in prices]
-            news_data = [self._news_to_dict(n) for n in news]
-
-            # 运行工作流
-            signal = await self.workflow.run(prices_data, news_data)
-
-            # 保存信号
-            with get_db() as db:
-                signal_record = Signal(
-                    timestamp=datetime.now(),
-                    signal_type=signal["signal"],
-                    confidence=signal["confidence"],
-                    reasoning=signal["reasoning"],
-                    agents_consensus=signal,
-                )
-                db.add(signal_record)
-                db.flush()
+            # 补齐历史新闻（如升级前入库的）的情绪分数
+            scored = await score_pending_news()
+            if scored:
+                print(f"补充了 {scored} 条新闻的情绪分数")
+        except Exception as e:
+            print(f"新闻情绪打分失败: {e}")
+
+        try:
+            # 向量化本轮及此前失败遗留的新闻
+            embedded = await embed_pending_news()
+            if embedded:
+                print(f"生成了 {embedded} 条新闻向量")
+        except Exception as e:
+            print(f"新闻向量化失败: {e}")
 
-                # 发送通知
-                await self.notifier.send_signal_notification(signal)
+    async def run_analysis(self, symbols: List[str] = None, attempt: int = 0):
+        """分析观察列表中的所有交易对
 
-            print(f"分析完成: {signal['signal']} (置信度: {signal['confidence']:.2%})")
+        新闻和各交易对K线每个周期只读取一次；新闻情绪、跨资产上下文在快照中
+        计算一次后由所有交易对共享，各交易对在并发上限内同时分析。
+        失败的交易对在 workflow.retry_delay 秒后重试（最多 workflow.max_retries 次），
+        从检查点中已完成的节点之后继续。
+        """
+        watchlist = get_config("data_sources.symbols", ["BTC/USDT"])
+        symbols = symbols or watchlist
+        try:
+            if self.workflow.checkpoints is not None:
+                purged = await self.workflow.checkpoints.purge_expired()
+                if purged:
+                    print(f"清理了 {purged} 个过期检查点")
+        except Exception as e:
+            print(f"检查点清理失败: {e}")
+
+        try:
+            async with get_async_db() as db:
+                candles = {}
+                # 跨资产上下文需要整个观察列表的K线，重试时也全部读取
+                for symbol in watchlist:
+                    candles[symbol] = await fetch_candles(
+                        db,
+                        symbol=symbol,
+                        timeframe=get_config("analysis.timeframe", "1h"),
+                        limit=get_config("analysis.bars", 100),
+                    )
+                news_data = await fetch_recent_news(
+                    db, limit=get_config("analysis.news_limit", 300)
+                )
+
+            signals = await self.workflow.run_many(
+                candles, news_data, on_signal=self._save_signal, symbols=symbols
+            )
+            print(f"分析完成: {len(signals)}/{len(symbols)} 个交易对")
         except Exception as e:
             print(f"分析失败: {e}")
+            signals = {}
+
+        failed = [s for s in symbols if s not in signals]
+        delay = get_config("workflow.retry_delay", 300)
+        retry = failed and delay and attempt < get_config("workflow.max_retries", 2)
+        if retry and self.scheduler.running:
+            self.scheduler.add_job(
+                self.run_analysis,
+                "date",
+                run_date=datetime.now() + timedelta(seconds=delay),
+                kwargs={"symbols": failed, "attempt": attempt + 1},
+                id="analysis_retry",
+                replace_existing=True,
+            )
+            print(f"{len(failed)} 个交易对将在 {delay}s 后重试: {failed}")
+
+    async def _save_signal(self, symbol: str, signal: Dict):
+        """保存单个交易对的信号和讨论记录并发送通知"""
+        async with get_async_db() as db:
+            signal_record = Signal(
+                timestamp=datetime.now(),
+                symbol=symbol,
+                signal_type=signal["signal"],
+                confidence=signal["confidence"],
+                price=signal.get("price"),
+                reasoning=signal["reasoning"],
+                agents_consensus=signal,
+            )
+            db.add(signal_record)
+            await db.flush()
+
+            await db.run_sync(
+                insert_agent_discussions,
+                signal_record.id,
+                signal.get("opinions", []),
+                signal.get("rounds", []),
+                signal.get("run_id"),
+            )
+
+            # 发送通知
+            await self.notifier.send_signal_notification(signal)
+
+        print(
+            f"{symbol}: {signal['signal']} (置信度: {signal['confidence']:.2%}, "
+            f"讨论轮数: {signal.get('rounds_used', 0)})"
+        )
 
     async def evaluate_performance(self):
         """评估历史表现"""
         try:
-            with get_db() as db:
+            async with get_async_db() as db:
                 # 获取待评估的信号
-                signals = db.query(Signal).filter(Signal.status == "PENDING").all()
+                signals = (
+                    await db.scalars(select(Signal).where(Signal.status == "PENDING"))
+                ).all()
 
                 # 这里应该实现回测逻辑
                 print(f"评估了 {len(signals)} 个信号")
         except Exception as e:
             print(f"评估失败: {e}")
 
-    def _price_to_dict(self, price: Price) -> dict:
-        return {
-            "timestamp": price.timestamp,
-            "source": price.source,
-            "open": float(price.open),
-            "high": float(price.high),
-            "low": float(price.low),
-            "close": float(price.close),
-            "volume": float(price.volume),
-        }
-
-    def _news_to_dict(self, news: News) -> dict:
-        return {
-            "published_at": news.published_at,
-            "source": news.source,
-            "title": news.title,
-            "content": news.content,
-            "url": news.url,
-            "sentiment_score": (
-                float(news.sentiment_score) if news.sentiment_score else None
-            ),
-        }
+    async def maintain_partitions(self):
+        """维护 prices / news 的月分区"""
+        try:
+            async with async_engine.begin() as conn:
+                result = await conn.run_sync(maintain_partitions)
+            for table, changes in result.items():
+                if changes["created"] or changes["detached"]:
+                    print(
+                        f"{table} 分区: 新建 {changes['created']}, 摘下 {changes['detached']}"
+                    )
+        except Exception as e:
+            print(f"分区维护失败: {e}")
 
     def stop(self):
         """停止调度器"""
         self.scheduler.shutdown()
         print("调度器已停止")
+
+    async def close(self):
+        """关闭实时行情并释放采集器共享的网络连接"""
+        if self.stream_ingester:
+            await self.stream_ingester.stop()
+        await self.http_client.close()
@@ -0,0 +1,291 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import func, select, text, true, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import get_config
+from ..data_collectors.news_dedup import TOKEN_RE
+from ..database.connection import get_async_db
+from ..database.models import News
+from ..database.readers import candles_query, default_source
+from ..database.rollups import rollup_chain
+
+# 与 news.embedding 列的维度一致
+EMBEDDING_DIM = 1536
+
+
+def news_text(news: Dict) -> str:
+    """用于向量化的新闻文本：标题加正文开头"""
+    title = news.get("title") or ""
+    content = (news.get("content") or "")[:500]
+    return f"{title}\n{content}".strip()
+
+
+def _pad(vectors: np.ndarray) -> np.ndarray:
+    """低维模型的向量补零到列维度，补零不改变余弦距离"""
+    if vectors.shape[1] > EMBEDDING_DIM:
+        raise ValueError(f"向量维度 {vectors.shape[1]} 超过 {EMBEDDING_DIM}")
+    return np.pad(vectors, ((0, 0), (0, EMBEDDING_DIM - vectors.shape[1])))
+
+
+class EmbeddingBackend(ABC):
+    """文本向量化后端，返回 (len(texts), EMBEDDING_DIM) 的 float32 数组"""
+
+    name = "base"
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        pass
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    name = "openai"
+
+    def __init__(self, model: str = None):
+        from langchain_openai import OpenAIEmbeddings
+
+        self.client = OpenAIEmbeddings(
+            model=model or os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+        )
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(await self.client.aembed_documents(texts), dtype=np.float32)
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """本地特征哈希向量，无需网络和模型文件
+
+    特征为单词（中文按字）及相邻二元组，哈希到固定维度并带符号累加后归一化。
+    语义能力弱于模型向量，但结果确定、速度快，适合离线运行和基准测试。
+    """
+
+    name = "hashing"
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        # 逐特征哈希是纯 Python 计算，放到线程中执行，不阻塞事件循环
+        return await asyncio.to_thread(self._embed, texts)
+
+    @staticmethod
+    def _embed(texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for row, text_ in enumerate(texts):
+            tokens = TOKEN_RE.findall(text_.lower())
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                h = int.from_bytes(
+                    hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big"
+                )
+                vectors[row, h % EMBEDDING_DIM] += 1.0 if h >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """本地 sentence-transformers 模型（可选依赖）"""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model: str = None):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(
+            model or os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+        )
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = await asyncio.to_thread(
+            self.model.encode, texts, normalize_embeddings=True
+        )
+        return _pad(np.asarray(vectors, dtype=np.float32))
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (
+        OpenAIEmbeddingBackend,
+        HashingEmbeddingBackend,
+        SentenceTransformerBackend,
+    )
+}
+
+
+@lru_cache()
+def get_embedding_backend(name: str = None) -> EmbeddingBackend:
+    """按 EMBEDDING_BACKEND 或 rag.embedding_backend 选择后端，进程内共享一个实例
+
+    同一个库中的向量必须来自同一后端，切换后端后需清空 news.embedding 重新生成。
+    """
+    name = name or os.getenv(
+        "EMBEDDING_BACKEND", get_config("rag.embedding_backend", "openai")
+    )
+    if name not in BACKENDS:
+        raise ValueError(f"未知的向量化后端: {name}")
+    return BACKENDS[name]()
+
+
+async def embed_pending_news(
+    backend: EmbeddingBackend = None, batch_size: int = None, limit: int = 1000
+) -> int:
+    """为尚无向量的新闻批量生成向量，已有向量的跳过
+
+    先取出待处理新闻再分批调用后端，调用期间不占用数据库事务；
+    每批单独提交，中途失败时已完成的批次不会重做。
+    """
+    backend = backend or get_embedding_backend()
+    batch_size = batch_size or get_config("rag.embed_batch_size", 64)
+
+    async with get_async_db() as db:
+        rows = (
+            await db.execute(
+                select(News.id, News.published_at, News.title, News.content)
+                .where(News.embedding.is_(None))
+                .order_by(News.published_at.desc())
+                .limit(limit)
+            )
+        ).all()
+
+    for i in range(0, len(rows), batch_size):
+        chunk = rows[i : i + batch_size]
+        vectors = await backend.embed([news_text(row._asdict()) for row in chunk])
+        async with get_async_db() as db:
+            await db.execute(
+                update(News),
+                [
+                    {
+                        "id": row.id,
+                        "published_at": row.published_at,
+                        "embedding": vector,
+                    }
+                    for row, vector in zip(chunk, vectors)
+                ],
+            )
+    return len(rows)
+
+
+def _close_at(symbol: str, timeframe: str, source: str, at, side: str) -> Tuple:
+    """at（含）之前最近一根K线的时间戳和收盘价，通过 LATERAL 对每条新闻各求一次
+
+    返回 (LATERAL 子查询列表, 时间戳列, 收盘价列)。聚合周期同时查 price_rollups
+    和交易所原生K线并优先取前者，与 fetch_candles 在聚合表缺数据时的回退一致。
+    """
+    rollups = [None, False] if timeframe in rollup_chain()[1:] else [None]
+    laterals = [
+        candles_query(symbol, timeframe, 1, source, end=at, rollup=rollup).lateral()
+        for rollup in rollups
+    ]
+    return (
+        laterals,
+        func.coalesce(*[c.c.timestamp for c in laterals]).label(f"{side}_ts"),
+        func.coalesce(*[c.c.close for c in laterals]).label(f"{side}_close"),
+    )
+
+
+def _following_return(row) -> Optional[float]:
+    """新闻发布后 horizon 内的涨跌幅，K线不足时返回 None"""
+    if row.before_ts is None or row.after_ts is None or row.after_ts <= row.before_ts:
+        return None
+    return float(row.after_close / row.before_close - 1)
+
+
+async def retrieve_similar_news(
+    db: AsyncSession,
+    vector: np.ndarray,
+    k: int = None,
+    horizon_hours: int = None,
+    symbol: str = None,
+    source: str = None,
+) -> List[Dict]:
+    """检索与 vector 最相似的历史新闻及其后的价格变化
+
+    只检索发布已超过 horizon 的新闻，保证其后的涨跌幅已经确定。
+    news.embedding 上的 HNSW 索引使检索在百万行量级仍为毫秒级，
+    ef_search 越大召回越高、耗时越长。每条新闻前后的K线通过 LATERAL
+    连接在同一个查询中取出，每根都走 prices 的唯一索引。
+    """
+    k = k or get_config("rag.top_k", 8)
+    horizon = timedelta(hours=horizon_hours or get_config("rag.horizon_hours", 24))
+    symbol = symbol or get_config("data_sources.symbols", ["BTC/USDT"])[0]
+    source = source or default_source()
+    timeframe = get_config("analysis.timeframe", "1h")
+
+    await db.execute(
+        text(f"SET LOCAL hnsw.ef_search = {int(get_config('rag.ef_search', 40))}")
+    )
+    distance = News.embedding.cosine_distance(vector)
+    hits = (
+        select(News.published_at, News.title, distance.label("distance"))
+        .where(
+            News.embedding.is_not(None),
+            News.published_at < datetime.now(timezone.utc) - horizon,
+        )
+        .order_by(distance)
+        .limit(k)
+        .subquery()
+    )
+    before, before_ts, before_close = _close_at(
+        symbol, timeframe, source, hits.c.published_at, "before"
+    )
+    after, after_ts, after_close = _close_at(
+        symbol, timeframe, source, hits.c.published_at + horizon, "after"
+    )
+    query = select(
+        hits.c.published_at,
+        hits.c.title,
+        hits.c.distance,
+        before_ts,
+        before_close,
+        after_ts,
+        after_close,
+    ).select_from(hits)
+    for candle in before + after:
+        query = query.outerjoin(candle, true())
+    rows = (await db.execute(query.order_by(hits.c.distance))).all()
+
+    return [
+        {
+            "published_at": row.published_at,
+            "title": row.title,
+            "similarity": 1 - float(row.distance),
+            "return": _following_return(row),
+        }
+        for row in rows
+    ]
+
+
+async def _main(args: argparse.Namespace):
+    backend = get_embedding_backend(args.backend)
+    if args.benchmark:
+        texts = [
+            f"Bitcoin ETF inflows hit record, day {i}" for i in range(args.benchmark)
+        ]
+        started = time.perf_counter()
+        await backend.embed(texts)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{backend.name}: {len(texts)} 条用时 {elapsed:.3f}s "
+            f"({len(texts) / elapsed:.0f} 条/秒)"
+        )
+        return
+    total = 0
+    while True:
+        count = await embed_pending_news(backend, limit=args.limit)
+        total += count
+        if count < args.limit:
+            break
+    print(f"生成了 {total} 条新闻向量")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为历史新闻生成向量")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None)
+    parser.add_argument("--limit", type=int, default=1000, help="每轮处理的新闻数")
+    parser.add_argument(
+        "--benchmark", type=int, default=0, help="只测试后端向量化 N 条文本的速度"
+    )
+    asyncio.run(_main(parser.parse_args()))
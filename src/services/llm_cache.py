@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Awaitable, Callable, List, Optional, Tuple
+from prometheus_client import Counter
+from ..config import get_config
+
+LLM_CACHE_REQUESTS = Counter(
+    "llm_cache_requests_total",
+    "LLM 响应缓存查询次数",
+    ["agent", "result"],  # result: local_hit / redis_hit / miss
+)
+
+REDIS_KEY_PREFIX = "llm-cache:"
+
+
+def make_key(model: str, temperature: Optional[float], messages: List) -> str:
+    """按 (模型, 温度, 渲染后的提示词) 计算内容地址"""
+    payload = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "messages": [(m.type, m.content) for m in messages],
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    """LLM 响应缓存
+
+    进程内 LRU 为第一层，配置 REDIS_URL 时以 Redis 为第二层，供多进程和重启后共享。
+    两层使用相同的 TTL。Redis 不可用时只记录日志并退化为进程内缓存，不影响 LLM 调用。
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: int = 3600, redis_url: str = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as redis
+
+            self._redis = redis.from_url(redis_url)
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: str):
+        self._local[key] = (time.monotonic() + self.ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    async def get(self, key: str, agent: str = "") -> Optional[str]:
+        value = self._get_local(key)
+        if value is not None:
+            LLM_CACHE_REQUESTS.labels(agent, "local_hit").inc()
+            return value
+
+        if self._redis is not None:
+            try:
+                cached = await self._redis.get(REDIS_KEY_PREFIX + key)
+            except Exception as e:
+                print(f"LLM 缓存读取 Redis 失败: {e}")
+                cached = None
+            if cached is not None:
+                value = cached.decode()
+                self._set_local(key, value)
+                LLM_CACHE_REQUESTS.labels(agent, "redis_hit").inc()
+                return value
+
+        LLM_CACHE_REQUESTS.labels(agent, "miss").inc()
+        return None
+
+    async def set(self, key: str, value: str):
+        self._set_local(key, value)
+        if self._redis is not None:
+            try:
+                await self._redis.set(REDIS_KEY_PREFIX + key, value, ex=self.ttl)
+            except Exception as e:
+                print(f"LLM 缓存写入 Redis 失败: {e}")
+
+    async def get_or_call(
+        self,
+        key: str,
+        call: Callable[[], Awaitable[Tuple[str, bool]]],
+        agent: str = "",
+    ) -> str:
+        """未命中时执行 call，它返回 (响应, 是否可缓存)
+
+        无法解析的响应不缓存，否则一次失败的生成会在整个有效期内被反复复用。
+        """
+        value = await self.get(key, agent)
+        if value is None:
+            value, cacheable = await call()
+            if cacheable:
+                await self.set(key, value)
+        return value
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.close()
+
+
+@lru_cache()
+def get_llm_cache() -> Optional[LLMCache]:
+    """进程内共享的缓存实例，llm_cache.enabled 为 false 时返回 None"""
+    if not get_config("llm_cache.enabled", True):
+        return None
+    use_redis = get_config("llm_cache.redis", True)
+    return LLMCache(
+        max_size=get_config("llm_cache.max_size", 1024),
+        ttl=get_config("llm_cache.ttl", 3600),
+        redis_url=os.getenv("REDIS_URL") if use_redis else None,
+    )
@@ -26,14 +26,16 @@ class NotificationService:
 
     async def _send_auto_notification(self, signal: Dict[str, Any]) -> bool:
         """发送自动交易信号通知"""
+        symbol = signal.get("symbol", "BTC/USDT")
         subject = (
-            f"🚨 BTC交易信号：{signal['signal']} (置信度: {signal['confidence']:.2%})"
+            f"🚨 {symbol} 交易信号：{signal['signal']} "
+            f"(置信度: {signal['confidence']:.2%})"
         )
 
         html_content = f"""
         <html>
         <body>
-            <h2>比特币交易信号 - 自动通知</h2>
+            <h2>{symbol} 交易信号 - 自动通知</h2>
             <p><strong>时间：</strong>{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
             <p><strong>信号：</strong><span style="color: {'green' if signal['signal'] == 'BUY' else 'red' if signal['signal'] == 'SELL' else 'gray'}; font-size: 20px;">{signal['signal']}</span></p>
             <p><strong>置信度：</strong>{signal['confidence']:.2%}</p>
@@ -52,14 +54,16 @@ class NotificationService:
 
     async def _send_review_notification(self, signal: Dict[str, Any]) -> bool:
         """发送需要人工审核的通知"""
+        symbol = signal.get("symbol", "BTC/USDT")
         subject = (
-            f"⚠️ BTC信号待审核：{signal['signal']} (置信度: {signal['confidence']:.2%})"
+            f"⚠️ {symbol} 信号待审核：{signal['signal']} "
+            f"(置信度: {signal['confidence']:.2%})"
         )
 
         html_content = f"""
         <html>
         <body>
-            <h2>比特币交易信号 - 需要人工审核</h2>
+            <h2>{symbol} 交易信号 - 需要人工审核</h2>
             <p style="color: orange;"><strong>⚠️ 此信号置信度中等，建议人工审核后决策</strong></p>
             <p><strong>时间：</strong>{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
             <p><strong>信号：</strong>{signal['signal']}</p>
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import re
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import numpy as np
+from sqlalchemy import select, update
+from ..config import get_config
+from ..database.connection import get_async_db
+from ..database.models import News
+
+
+def _tiers(*tiers: Tuple[float, str]) -> Dict[str, float]:
+    lexicon = {}
+    for weight, terms in tiers:
+        lexicon.update(dict.fromkeys(terms.split("|"), weight))
+    return lexicon
+
+
+# 加密货币新闻情绪词典，权重为 [-1, 1]。英文按整词匹配，中文按子串匹配
+LEXICON = _tiers(
+    (0.8, "surge|surges|soar|soars|record high|all-time high|bullish"),
+    (0.8, "大涨|暴涨|新高"),
+    (0.7, "rally|rallies|利好|看涨"),
+    (0.6, "breakout|approval|approved|approves|legal tender|突破|批准"),
+    (0.5, "jump|jumps|inflow|inflows|adoption|rebound|optimism|optimistic"),
+    (0.5, "outperform|rate cut|rate cuts|上涨|流入|增持|反弹|降息"),
+    (0.4, "gain|gains|rise|rises|adopt|partnership|upgrade|accumulate"),
+    (0.4, "accumulation|recovery|通过"),
+    (0.3, "buy|launch"),
+    (-0.3, "sell|delay|delays|监管"),
+    (-0.4, "drop|drops|fall|falls|decline|declines"),
+    (-0.5, "outflow|outflows|probe|investigation|fear|outage|rate hike|rate hikes"),
+    (-0.5, "下跌|流出|调查|加息"),
+    (-0.6, "liquidation|liquidations|lawsuit|sues|rejects|rejected"),
+    (-0.6, "跌破|清算|起诉"),
+    (-0.7, "tumble|tumbles|slump|selloff|sell-off|breach|ban|bans|banned"),
+    (-0.7, "crackdown|利空|看跌|爆仓|禁止"),
+    (-0.8, "plunge|plunges|bearish|exploit|scam|fraud|大跌|黑客|诈骗"),
+    (-0.9, "crash|crashes|hack|hacked|bankruptcy|insolvent|collapse"),
+    (-0.9, "暴跌|被盗|破产|暴雷"),
+)
+
+# 只作为关键词记录、不计入情绪的主题词
+TOPICS = (
+    "etf|sec|fed|halving|mining|stablecoin|defi|cbdc|blackrock|microstrategy"
+    "|binance|coinbase|tether|lightning|减半|挖矿|稳定币|美联储|交易所"
+).split("|")
+
+# 中文只用多字否定词，避免“不断”“未来”之类的误判
+NEGATORS = "not|no|never|without|fails to|failed to|没有|未能|并未|不会|并非|不是".split(
+    "|"
+)
+
+# 否定词结束位置距情绪词开始位置不超过该字符数时，情绪取反并减弱
+NEGATION_WINDOW = 12
+NEGATION_FACTOR = -0.5
+# 与 VADER 相同的归一化常数：score = s / sqrt(s^2 + alpha)
+NORMALIZATION_ALPHA = 15.0
+# 各条新闻在拼接文本中的分隔符，不会被任何词条匹配
+SEPARATOR = "\n\x00\n"
+
+
+def news_text(news: Dict) -> str:
+    title = news.get("title") or ""
+    content = (news.get("content") or "")[:1000]
+    return f"{title}\n{content}"
+
+
+def _alternation(terms: List[str]) -> str:
+    return "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True))
+
+
+def _is_cjk(term: str) -> bool:
+    return bool(re.match(r"[一-鿿]", term))
+
+
+class LexiconSentimentScorer:
+    """基于词典的批量情绪打分
+
+    整批新闻拼接后一次正则扫描，匹配位置按各条的起始偏移映射回新闻，
+    否定判断和按新闻求和都用 NumPy 向量化完成，单核每秒可处理数万条短新闻。
+    词典可通过 sentiment.lexicon（词 -> 权重）补充或覆盖。
+    """
+
+    def __init__(self, lexicon: Dict[str, float] = None):
+        lexicon = {**LEXICON, **(lexicon or {})}
+        lexicon.update({t: 0.0 for t in TOPICS if t not in lexicon})
+        self.terms = sorted(lexicon, key=len, reverse=True)
+        self.weights = np.array([lexicon[t] for t in self.terms])
+        self.index = {t: i for i, t in enumerate(self.terms)}
+        # 英文词条共用一对 \b，并用前瞻跳过非字母位置，比逐词条 \b 快一个数量级
+        en_neg = _alternation([t for t in NEGATORS if not _is_cjk(t)])
+        en_terms = _alternation([t for t in self.terms if not _is_cjk(t)])
+        zh_neg = _alternation([t for t in NEGATORS if _is_cjk(t)])
+        zh_terms = _alternation([t for t in self.terms if _is_cjk(t)])
+        self.pattern = re.compile(
+            rf"(?=[a-z一-鿿])(?:\b(?:(?P<neg>{en_neg})|(?P<term>{en_terms}))\b"
+            rf"|(?P<zh_neg>{zh_neg})|(?P<zh_term>{zh_terms}))"
+        )
+
+    def score(self, texts: List[str]) -> Tuple[np.ndarray, List[List[str]]]:
+        """返回 [-1, 1] 的情绪分数数组和各条新闻命中的关键词（按影响大小排序）"""
+        n = len(texts)
+        if not n:
+            return np.zeros(0), []
+        lowered = [t.lower() for t in texts]
+        starts = np.cumsum([0] + [len(t) + len(SEPARATOR) for t in lowered[:-1]])
+        joined = SEPARATOR.join(lowered)
+
+        neg_end, term_pos, term_id = [], [], []
+        for match in self.pattern.finditer(joined):
+            if match.lastgroup in ("neg", "zh_neg"):
+                neg_end.append(match.end())
+            else:
+                term_pos.append(match.start())
+                term_id.append(self.index[match.group()])
+        if not term_pos:
+            return np.zeros(n), [[] for _ in range(n)]
+
+        term_pos, term_id = np.array(term_pos), np.array(term_id)
+        doc = np.searchsorted(starts, term_pos, side="right") - 1
+        weight = self.weights[term_id]
+
+        if neg_end:
+            neg_end = np.array(neg_end)
+            nearest = np.searchsorted(neg_end, term_pos, side="right") - 1
+            gap = term_pos - neg_end[np.maximum(nearest, 0)]
+            negated = (nearest >= 0) & (gap >= 0) & (gap <= NEGATION_WINDOW)
+            # 否定词与情绪词须在同一条新闻中
+            neg_doc = np.searchsorted(starts, neg_end, side="right") - 1
+            negated &= neg_doc[np.maximum(nearest, 0)] == doc
+            weight = np.where(negated, weight * NEGATION_FACTOR, weight)
+
+        total = np.bincount(doc, weights=weight, minlength=n)
+        scores = total / np.sqrt(total**2 + NORMALIZATION_ALPHA)
+
+        order = np.lexsort((-np.abs(weight), doc))
+        keywords = [[] for _ in range(n)]
+        for i in order:
+            term = self.terms[term_id[i]]
+            if term not in keywords[doc[i]]:
+                keywords[doc[i]].append(term)
+        limit = get_config("sentiment.max_keywords", 8)
+        return scores, [k[:limit] for k in keywords]
+
+
+@lru_cache()
+def get_scorer() -> LexiconSentimentScorer:
+    return LexiconSentimentScorer(get_config("sentiment.lexicon", {}))
+
+
+def score_news(news_list: List[Dict]) -> List[Dict]:
+    """入库前为新闻批量打分，原地写入 sentiment_score，命中的情绪词并入 keywords
+
+    keywords 中已有的币种标签和去重时合并的关键词保留在前。
+    """
+    scores, keywords = get_scorer().score([news_text(n) for n in news_list])
+    for news, score, words in zip(news_list, scores, keywords):
+        news["sentiment_score"] = round(float(score), 4)
+        news["keywords"] = list(dict.fromkeys([*(news.get("keywords") or []), *words]))
+    return news_list
+
+
+async def score_pending_news(batch_size: int = 1000, limit: int = 10000) -> int:
+    """为尚无情绪分数的历史新闻补打分，每批单独提交"""
+    async with get_async_db() as db:
+        rows = (
+            await db.execute(
+                select(
+                    News.id,
+                    News.published_at,
+                    News.title,
+                    News.content,
+                    News.keywords,
+                )
+                .where(News.sentiment_score.is_(None))
+                .order_by(News.published_at.desc())
+                .limit(limit)
+            )
+        ).all()
+
+    for i in range(0, len(rows), batch_size):
+        chunk = [row._asdict() for row in rows[i : i + batch_size]]
+        score_news(chunk)
+        async with get_async_db() as db:
+            await db.execute(
+                update(News),
+                [
+                    {
+                        "id": row["id"],
+                        "published_at": row["published_at"],
+                        "sentiment_score": row["sentiment_score"],
+                        "keywords": row["keywords"],
+                    }
+                    for row in chunk
+                ],
+            )
+    return len(rows)
+
+
+def aggregate_sentiment(
+    news_list: List[Dict], now: datetime = None, half_life_hours: float = None
+) -> Dict:
+    """按发布时间指数衰减加权的情绪特征
+
+    半衰期为 sentiment.half_life_hours；momentum 为短半衰期（1/4）与常规半衰期
+    加权均值之差，为正表示情绪在改善。没有打分的新闻不参与计算。
+    """
+    scored = [n for n in news_list if n.get("sentiment_score") is not None]
+    if not scored:
+        return {"count": 0}
+    now = now or datetime.now(timezone.utc)
+    half_life = half_life_hours or get_config("sentiment.half_life_hours", 6)
+
+    scores = np.array([float(n["sentiment_score"]) for n in scored])
+    published = [n.get("published_at") or now for n in scored]
+    age = np.array(
+        [
+            (now - (p if p.tzinfo else p.replace(tzinfo=timezone.utc))).total_seconds()
+            for p in published
+        ]
+    )
+    age = np.maximum(age / 3600, 0)
+    weights = 0.5 ** (age / half_life)
+    fast = 0.5 ** (age / (half_life / 4))
+    mean = float(np.sum(weights * scores) / np.sum(weights))
+
+    keyword_weight: Dict[str, float] = {}
+    for news, w in zip(scored, weights):
+        for word in news.get("keywords") or []:
+            keyword_weight[word] = keyword_weight.get(word, 0.0) + float(w)
+    top = sorted(keyword_weight, key=keyword_weight.get, reverse=True)
+
+    total = float(np.sum(weights))
+    band = get_config("sentiment.neutral_band", 0.05)
+    return {
+        "count": len(scored),
+        "effective_count": round(total, 2),
+        "weighted_mean": round(mean, 4),
+        "momentum": round(float(np.sum(fast * scores) / np.sum(fast)) - mean, 4),
+        "positive_share": round(float(np.sum(weights * (scores > band))) / total, 4),
+        "negative_share": round(float(np.sum(weights * (scores < -band))) / total, 4),
+        "top_keywords": top[:10],
+        "half_life_hours": half_life,
+    }
+
+
+async def _main(args: argparse.Namespace):
+    if args.benchmark:
+        texts = [
+            f"Bitcoin ETF inflows hit record high, analysts not bearish, day {i}"
+            for i in range(args.benchmark)
+        ]
+        started = time.perf_counter()
+        get_scorer().score(texts)
+        elapsed = time.perf_counter() - started
+        print(f"{len(texts)} 条用时 {elapsed:.3f}s ({len(texts) / elapsed:.0f} 条/秒)")
+        return
+    total = 0
+    while True:
+        count = await score_pending_news(limit=args.limit)
+        total += count
+        if count < args.limit:
+            break
+    print(f"为 {total} 条新闻补充了情绪分数")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为历史新闻补充情绪分数和关键词")
+    parser.add_argument("--limit", type=int, default=10000, help="每轮处理的新闻数")
+    parser.add_argument(
+        "--benchmark", type=int, default=0, help="只测试打分 N 条文本的速度"
+    )
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+import numpy as np
+from ..candle_batch import CandleBatch
+from ..services.sentiment_service import score_news
+
+# 离线基准：用合成的K线和新闻反复运行完整工作流，统计单次运行耗时。
+# 默认使用 fake 模型（无需网络和密钥），也可以 --provider replay 回放录制的真实响应。
+
+HEADLINES = [
+    "Bitcoin ETF sees record inflows",
+    "Fed signals pause on rate hikes",
+    "Major exchange reports outage",
+    "Whales move large BTC holdings to exchanges",
+    "Mining difficulty reaches new high",
+    "Regulator opens probe into stablecoin issuer",
+    "Bitcoin hashrate climbs after halving",
+    "Options open interest hits yearly high",
+]
+
+
+def synthetic_candles(
+    n: int, seed: int = 0, symbol: str = "BTC/USDT", interval: str = "1h"
+) -> CandleBatch:
+    """按对数正态随机游走生成K线，相同种子结果相同"""
+    rng = np.random.default_rng(seed)
+    close = 60000 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.002, n)) * close
+    return CandleBatch.from_columns(
+        {
+            "timestamp": 1_700_000_000_000 + np.arange(n, dtype=np.int64) * 3_600_000,
+            "open": open_,
+            "high": np.maximum(open_, close) + spread,
+            "low": np.minimum(open_, close) - spread,
+            "close": close,
+            "volume": rng.lognormal(5, 0.5, n),
+            "source": np.full(n, "okx", dtype=object),
+            "symbol": np.full(n, symbol, dtype=object),
+            "interval": np.full(n, interval, dtype=object),
+        }
+    )
+
+
+def synthetic_news(tick: int, count: int = 50) -> List[Dict]:
+    now = datetime.now(timezone.utc)
+    return score_news(
+        [
+            {
+                "published_at": now - timedelta(minutes=15 * i),
+                "title": HEADLINES[(tick + i) % len(HEADLINES)],
+                "content": "",
+                "source": "benchmark",
+            }
+            for i in range(count)
+        ]
+    )
+
+
+async def _main(args: argparse.Namespace):
+    os.environ["LLM_PROVIDER"] = args.provider
+    os.environ.setdefault("EMBEDDING_BACKEND", "hashing")
+    from .graph import AgentWorkflow
+    from ..agents.news_agents import RAGAgent
+
+    workflow = AgentWorkflow()
+    # 检查点存放在数据库中，离线基准不使用
+    workflow.checkpoints = None
+    if not args.rag:
+        # RAGAgent 需要数据库，离线基准默认不运行
+        workflow.news_agents = [
+            a for a in workflow.news_agents if not isinstance(a, RAGAgent)
+        ]
+
+    # 第一个交易对为基准资产，其余为合成交易对，各自使用不同的随机种子
+    symbols = ["BTC/USDT"] + [f"SYM{i}/USDT" for i in range(1, args.symbols)]
+    candles = {
+        symbol: synthetic_candles(args.bars + args.runs, args.seed + i, symbol)
+        for i, symbol in enumerate(symbols)
+    }
+    elapsed, signals, rounds = [], Counter(), []
+    for tick in range(args.runs):
+        started = time.perf_counter()
+        results = await workflow.run_many(
+            {
+                symbol: batch.take(slice(tick, tick + args.bars))
+                for symbol, batch in candles.items()
+            },
+            synthetic_news(tick),
+        )
+        elapsed.append(time.perf_counter() - started)
+        for signal in results.values():
+            signals[signal["signal"]] += 1
+            rounds.append(signal.get("rounds_used", 0))
+
+    p50, p95 = np.percentile(elapsed, [50, 95])
+    print(
+        f"{args.provider}: {args.runs} 次运行 x {len(symbols)} 个交易对，"
+        f"p50 {p50:.3f}s，p95 {p95:.3f}s，"
+        f"最长 {max(elapsed):.3f}s，平均讨论轮数 {np.mean(rounds):.2f}，"
+        f"信号分布 {dict(signals)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线运行工作流并统计耗时")
+    parser.add_argument(
+        "--provider", choices=["fake", "replay", "record", "live"], default="fake"
+    )
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--bars", type=int, default=100, help="每次分析的K线数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--symbols", type=int, default=1, help="每次同时分析的交易对数")
+    parser.add_argument("--rag", action="store_true", help="同时运行 RAGAgent（需要数据库）")
+    asyncio.run(_main(parser.parse_args()))
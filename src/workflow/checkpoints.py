@@ -0,0 +1,91 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from ..config import get_config
+from ..candle_batch import CandleBatch
+from ..database.connection import get_async_db
+from ..database.models import WorkflowCheckpoint
+
+
+def make_run_id(symbol: str, prices: CandleBatch) -> str:
+    """运行 ID：交易对、周期和最新一根K线的开盘时间
+
+    同一根K线内的重试和手动触发得到相同的 ID，从而复用已完成节点的输出；
+    新K线出现后 ID 随之变化，旧检查点不再被读取，到期后清理。
+    """
+    if not len(prices):
+        return f"{symbol}:empty"
+    return f"{symbol}:{prices.interval[-1]}:{int(prices.timestamp[-1])}"
+
+
+def _jsonable(output: Dict) -> Dict:
+    return json.loads(json.dumps(output, ensure_ascii=False, default=str))
+
+
+class CheckpointStore:
+    """把工作流各节点的输出按运行 ID 保存在 workflow_checkpoints
+
+    只保存节点输出，不保存 K 线和快照：运行 ID 由输入决定，恢复时输入会重新读取。
+    并行分支的写入通过 JSONB 合并 (||) 原子完成。检查点在 workflow.checkpoint.ttl
+    秒后过期；读写失败只打印日志，工作流照常运行。
+    """
+
+    def __init__(self, ttl: int = None):
+        self.ttl = ttl or get_config("workflow.checkpoint.ttl", 3600)
+
+    async def load(self, run_id: str) -> Dict[str, Dict]:
+        try:
+            async with get_async_db() as db:
+                nodes = await db.scalar(
+                    select(WorkflowCheckpoint.nodes).where(
+                        WorkflowCheckpoint.run_id == run_id,
+                        WorkflowCheckpoint.expires_at > func.now(),
+                    )
+                )
+        except Exception as e:
+            print(f"读取检查点失败 {run_id}: {e}")
+            return {}
+        return nodes or {}
+
+    async def save(self, run_id: str, symbol: str, node: str, output: Dict):
+        stmt = insert(WorkflowCheckpoint).values(
+            run_id=run_id,
+            symbol=symbol,
+            nodes={node: _jsonable(output)},
+            expires_at=datetime.now(timezone.utc) + timedelta(seconds=self.ttl),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["run_id"],
+            set_={
+                "nodes": WorkflowCheckpoint.nodes.op("||")(stmt.excluded.nodes),
+                "updated_at": func.now(),
+            },
+        )
+        try:
+            async with get_async_db() as db:
+                await db.execute(stmt)
+        except Exception as e:
+            print(f"保存检查点失败 {run_id}/{node}: {e}")
+
+    async def clear(self, run_id: str):
+        """信号保存成功后删除，之后同一根K线的手动触发会重新分析"""
+        try:
+            async with get_async_db() as db:
+                await db.execute(
+                    delete(WorkflowCheckpoint).where(
+                        WorkflowCheckpoint.run_id == run_id
+                    )
+                )
+        except Exception as e:
+            print(f"删除检查点失败 {run_id}: {e}")
+
+    async def purge_expired(self) -> int:
+        async with get_async_db() as db:
+            result = await db.execute(
+                delete(WorkflowCheckpoint).where(
+                    WorkflowCheckpoint.expires_at <= func.now()
+                )
+            )
+        return result.rowcount
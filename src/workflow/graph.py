@@ -1,14 +1,31 @@
 from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Dict, Any
+from typing import Awaitable, Callable, TypedDict, List, Dict, Any
+import asyncio
 from ..agents.technical_agents import TechAgentOpenAI, TechAgentGemini
 from ..agents.news_agents import NewsAgentOpenAI, NewsAgentGemini, RAGAgent
 from ..agents.consensus_agents import TechConsensusAgent, NewsConsensusAgent
 from ..agents.decision_agents import DecisionAgent, DiscussionAgent, ReflectionAgent
+from ..agents.indicators import IndicatorEngine
+from ..candle_batch import CandleBatch
+from ..agents.base_agent import BaseAgent
+from ..config import get_config
+from ..database.connection import get_async_db
+from ..database.writers import insert_discussion_round
+from .checkpoints import CheckpointStore, make_run_id
+from .snapshot import MarketSnapshot, build_snapshot
+
+# 讨论进行中已完成的轮次在检查点中的键，节点中断后据此从下一轮继续
+DISCUSSION_ROUNDS = "discussion_rounds"
 
 
 class AgentState(TypedDict):
-    prices: List[Dict]
-    news: List[Dict]
+    run_id: str
+    symbol: str
+    prices: CandleBatch
+    # 本周期所有交易对共享的新闻、情绪聚合和跨资产上下文，只读
+    snapshot: MarketSnapshot
+    # 此前中断的同一运行中已完成节点的输出，只读
+    checkpoint: Dict[str, Dict]
     tech_results: List[Dict]
     news_results: List[Dict]
     tech_consensus: Dict
@@ -19,7 +36,17 @@ class AgentState(TypedDict):
     final_signal: Dict
 
 
-class BTCAgentWorkflow:
+class AgentWorkflow:
+    """单个交易对的多 Agent 分析工作流
+
+    run 分析一个交易对；run_many 把观察列表中的交易对在 workflow.max_symbols
+    的并发上限内同时分析，共享同一个周期快照。所有交易对的 LLM 调用
+    共用 workflow.max_concurrency / workflow.llm_rate_per_minute 的全局预算。
+
+    启用 workflow.checkpoint 时每个节点完成后保存其输出，同一运行 ID
+    再次运行时已完成的节点直接返回保存的输出，从中断处继续。
+    """
+
     def __init__(self):
         self.tech_agents = [TechAgentOpenAI(), TechAgentGemini()]
         self.news_agents = [NewsAgentOpenAI(), NewsAgentGemini(), RAGAgent()]
@@ -28,6 +55,17 @@ class BTCAgentWorkflow:
         self.decision_agent = DecisionAgent()
         self.discussion_agent = DiscussionAgent()
         self.reflection_agent = ReflectionAgent()
+        # 指标状态跨次运行保留，每次只对新增K线增量计算，并由所有技术 Agent 共享
+        self.indicator_engine = IndicatorEngine(get_config("indicators.params"))
+        # 同时分析的交易对上限；LLM 调用另受全局预算约束，见 llm_calls.LLMBudget
+        self.symbol_semaphore = asyncio.Semaphore(
+            get_config("workflow.max_symbols", 8)
+        )
+        self.checkpoints = (
+            CheckpointStore()
+            if get_config("workflow.checkpoint.enabled", True)
+            else None
+        )
 
         self.graph = self._build_graph()
 
@@ -35,96 +73,208 @@ class BTCAgentWorkflow:
         workflow = StateGraph(AgentState)
 
         # 添加节点
-        workflow.add_node("technical_analysis", self._technical_analysis)
-        workflow.add_node("news_analysis", self._news_analysis)
-        workflow.add_node("tech_consensus", self._tech_consensus)
-        workflow.add_node("news_consensus", self._news_consensus)
-        workflow.add_node("decision", self._decision)
-        workflow.add_node("discussion", self._discussion)
-        workflow.add_node("reflection", self._reflection)
-
-        # 定义流程
+        nodes = {
+            "technical_analysis": self._technical_analysis,
+            "news_analysis": self._news_analysis,
+            "tech_consensus": self._tech_consensus,
+            "news_consensus": self._news_consensus,
+            "decision": self._decision,
+            "discussion": self._discussion,
+            "reflection": self._reflection,
+        }
+        for name, node in nodes.items():
+            workflow.add_node(name, self._checkpointed(name, node))
+
+        # 定义流程：技术分析与新闻分析两个分支并行，两边共识都完成后再决策
         workflow.set_entry_point("technical_analysis")
+        workflow.set_entry_point("news_analysis")
         workflow.add_edge("technical_analysis", "tech_consensus")
         workflow.add_edge("news_analysis", "news_consensus")
-        workflow.add_edge("tech_consensus", "decision")
-        workflow.add_edge("news_consensus", "decision")
+        workflow.add_edge(["tech_consensus", "news_consensus"], "decision")
         workflow.add_edge("decision", "discussion")
         workflow.add_edge("discussion", "reflection")
         workflow.add_edge("reflection", END)
 
-        # 并行执行技术和新闻分析
-        workflow.set_entry_point("technical_analysis")
-        workflow.add_edge("technical_analysis", "news_analysis")
-
         return workflow.compile()
 
-    async def _technical_analysis(self, state: AgentState) -> AgentState:
+    def _checkpointed(
+        self, name: str, node: Callable[[AgentState], Awaitable[Dict]]
+    ) -> Callable[[AgentState], Awaitable[Dict]]:
+        """已完成的节点返回检查点中的输出，否则运行节点并保存其输出"""
+
+        async def run(state: AgentState) -> Dict:
+            if name in state["checkpoint"]:
+                return state["checkpoint"][name]
+            output = await node(state)
+            if self.checkpoints is not None:
+                await self.checkpoints.save(
+                    state["run_id"], state["symbol"], name, output
+                )
+            return output
+
+        return run
+
+    async def _run_agents(
+        self, agents: List[BaseAgent], data: Dict[str, Any]
+    ) -> List[Dict]:
+        """并发运行一组 Agent，单个 Agent 失败时丢弃其结果，保留其余结果"""
+
+        results = await asyncio.gather(
+            *(agent.analyze(data) for agent in agents), return_exceptions=True
+        )
+        succeeded = []
+        for agent, result in zip(agents, results):
+            if isinstance(result, Exception):
+                print(f"{agent.name} 分析失败: {result}")
+            else:
+                succeeded.append(result)
+        return succeeded
+
+    # 各节点只返回自己写入的字段，并行分支在同一步内不会对同一字段产生冲突更新
+
+    async def _technical_analysis(self, state: AgentState) -> Dict:
         """并行执行技术分析"""
-        results = []
-        for agent in self.tech_agents:
-            result = await agent.analyze({"prices": state["prices"]})
-            results.append(result)
-        state["tech_results"] = results
-        return state
-
-    async def _news_analysis(self, state: AgentState) -> AgentState:
+        prices, symbol = state["prices"], state["symbol"]
+        indicators = self.indicator_engine.update(prices)
+        data = {
+            "symbol": symbol,
+            "prices": prices,
+            "indicators": indicators,
+            "market": state["snapshot"].context(symbol),
+        }
+        return {"tech_results": await self._run_agents(self.tech_agents, data)}
+
+    async def _news_analysis(self, state: AgentState) -> Dict:
         """并行执行新闻分析"""
-        results = []
-        for agent in self.news_agents:
-            result = await agent.analyze({"news": state["news"]})
-            results.append(result)
-        state["news_results"] = results
-        return state
-
-    async def _tech_consensus(self, state: AgentState) -> AgentState:
+        snapshot = state["snapshot"]
+        # 情绪聚合和检索向量已在快照中算好，所有交易对和新闻 Agent 共享
+        data = {
+            "symbol": state["symbol"],
+            "news": snapshot.news,
+            "sentiment": snapshot.sentiment,
+            "news_vector": snapshot.news_vector,
+        }
+        return {"news_results": await self._run_agents(self.news_agents, data)}
+
+    async def _tech_consensus(self, state: AgentState) -> Dict:
         """技术面共识"""
         result = await self.tech_consensus.analyze(
             {"tech_results": state["tech_results"]}
         )
-        state["tech_consensus"] = result
-        return state
+        return {"tech_consensus": result}
 
-    async def _news_consensus(self, state: AgentState) -> AgentState:
+    async def _news_consensus(self, state: AgentState) -> Dict:
         """新闻面共识"""
         result = await self.news_consensus.analyze(
             {"news_results": state["news_results"]}
         )
-        state["news_consensus"] = result
-        return state
+        return {"news_consensus": result}
 
-    async def _decision(self, state: AgentState) -> AgentState:
+    async def _decision(self, state: AgentState) -> Dict:
         """初步决策"""
-        result = await self.decision_agent.analyze(
-            {
-                "technical_analysis": [state["tech_consensus"]],
-                "news_analysis": [state["news_consensus"]],
-            }
-        )
-        state["initial_decision"] = result
-        return state
+        try:
+            result = await self.decision_agent.analyze(
+                {
+                    "symbol": state["symbol"],
+                    "technical_analysis": [state["tech_consensus"]],
+                    "news_analysis": [state["news_consensus"]],
+                }
+            )
+        except Exception as e:
+            # 初步决策只作参考，超时不阻塞后续讨论
+            print(f"初步决策失败: {e}")
+            result = {}
+        return {"initial_decision": result}
 
-    async def _discussion(self, state: AgentState) -> AgentState:
+    async def _discussion(self, state: AgentState) -> Dict:
         """多Agent讨论"""
         all_results = state["tech_results"] + state["news_results"]
-        result = await self.discussion_agent.moderate_discussion(all_results, rounds=3)
-        state["discussion_result"] = result
-        return state
+        run_id, symbol = state["run_id"], state["symbol"]
+        saved = state["checkpoint"].get(DISCUSSION_ROUNDS, {})
+        records = list(saved.get("rounds", []))
+        if records:
+            print(f"{symbol} 从第{len(records) + 1}轮继续讨论")
 
-    async def _reflection(self, state: AgentState) -> AgentState:
-        """反思与学习"""
-        result = await self.reflection_agent.reflect(
-            state["discussion_result"], []  # 历史表现数据
+        async def on_round(record: Dict):
+            # 每轮完成即写入 agent_discussions 并记入检查点，节点中断也不会丢失
+            if self.checkpoints is None:
+                return
+            try:
+                async with get_async_db() as db:
+                    await db.run_sync(insert_discussion_round, run_id, record)
+                record["stored"] = True
+            except Exception as e:
+                print(f"讨论记录写入失败 {run_id}: {e}")
+            records.append(record)
+            await self.checkpoints.save(
+                run_id, symbol, DISCUSSION_ROUNDS, {"rounds": records}
+            )
+
+        result = await self.discussion_agent.moderate_discussion(
+            all_results, completed=list(records), on_round=on_round
         )
-        state["reflection"] = result
-        state["final_signal"] = state["discussion_result"]
-        return state
+        return {"discussion_result": result}
+
+    async def _reflection(self, state: AgentState) -> Dict:
+        """反思与学习"""
+        prices = state["prices"]
+        try:
+            result = await self.reflection_agent.reflect(
+                state["discussion_result"], []  # 历史表现数据
+            )
+        except Exception as e:
+            print(f"反思失败: {e}")
+            result = {}
+        return {
+            "reflection": result,
+            # 附带各 Agent 的初始观点，便于写入 agent_discussions
+            "final_signal": {
+                **state["discussion_result"],
+                "run_id": state["run_id"],
+                "symbol": state["symbol"],
+                "price": float(prices.close[-1]) if len(prices) else None,
+                "opinions": state["tech_results"] + state["news_results"],
+            },
+        }
+
+    async def prepare_snapshot(
+        self, candles: Dict[str, CandleBatch], news: List[Dict]
+    ) -> MarketSnapshot:
+        """构造本周期共享的快照；RAGAgent 的新闻检索向量也只在这里计算一次"""
+        snapshot = build_snapshot(candles, news)
+        rag = next((a for a in self.news_agents if isinstance(a, RAGAgent)), None)
+        if rag is not None and news:
+            try:
+                snapshot.news_vector = await rag.embed_news(news)
+            except Exception as e:
+                print(f"新闻向量计算失败: {e}")
+        return snapshot
 
-    async def run(self, prices: List[Dict], news: List[Dict]) -> Dict[str, Any]:
-        """执行完整工作流"""
+    async def run(
+        self,
+        prices: CandleBatch,
+        news: List[Dict] = None,
+        symbol: str = None,
+        snapshot: MarketSnapshot = None,
+    ) -> Dict[str, Any]:
+        """分析单个交易对；未提供快照时只用该交易对的K线和 news 现场构造"""
+        if symbol is None:
+            symbol = prices.symbol[-1] if len(prices) else "BTC/USDT"
+        if snapshot is None:
+            snapshot = await self.prepare_snapshot({symbol: prices}, news or [])
+        run_id = make_run_id(symbol, prices)
+        checkpoint = {}
+        if self.checkpoints is not None:
+            checkpoint = await self.checkpoints.load(run_id)
+            if checkpoint:
+                done = [name for name in checkpoint if name != DISCUSSION_ROUNDS]
+                print(f"{run_id} 从检查点恢复，已完成节点: {done}")
         initial_state = AgentState(
+            run_id=run_id,
+            symbol=symbol,
             prices=prices,
-            news=news,
+            snapshot=snapshot,
+            checkpoint=checkpoint,
             tech_results=[],
             news_results=[],
             tech_consensus={},
@@ -137,3 +287,50 @@ class BTCAgentWorkflow:
 
         final_state = await self.graph.ainvoke(initial_state)
         return final_state["final_signal"]
+
+    async def run_many(
+        self,
+        candles: Dict[str, CandleBatch],
+        news: List[Dict],
+        on_signal: Callable[[str, Dict], Awaitable[None]] = None,
+        symbols: List[str] = None,
+    ) -> Dict[str, Dict]:
+        """在并发上限内分析观察列表中的所有交易对，返回 交易对 -> 信号
+
+        快照每个周期只构造一次；单个交易对失败时跳过，不影响其余交易对。
+        on_signal 在每个交易对完成时立即调用（如写库和通知），不必等待全部完成；
+        其成功返回后才删除该交易对的检查点，写库失败时重试可直接复用结果。
+        symbols 只分析其中的交易对（如重试失败的交易对），快照仍由全部K线构造。
+        """
+        snapshot = await self.prepare_snapshot(candles, news)
+
+        async def run(symbol: str) -> Dict:
+            async with self.symbol_semaphore:
+                signal = await self.run(
+                    candles[symbol], symbol=symbol, snapshot=snapshot
+                )
+            if on_signal is not None:
+                await on_signal(symbol, signal)
+            if self.checkpoints is not None:
+                await self.checkpoints.clear(signal["run_id"])
+            return signal
+
+        symbols = [s for s in symbols or candles if s in candles]
+        missing = [s for s in symbols if not len(candles[s])]
+        if missing:
+            print(f"没有K线，跳过: {missing}")
+        symbols = [s for s in symbols if s not in missing]
+        results = await asyncio.gather(
+            *(run(symbol) for symbol in symbols), return_exceptions=True
+        )
+        signals = {}
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                print(f"{symbol} 分析失败: {result!r}")
+            else:
+                signals[symbol] = result
+        return signals
+
+
+# 兼容旧名称
+BTCAgentWorkflow = AgentWorkflow
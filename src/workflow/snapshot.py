@@ -0,0 +1,102 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import numpy as np
+from ..config import get_config
+from ..candle_batch import CandleBatch
+from ..services.sentiment_service import aggregate_sentiment
+
+
+@dataclass
+class MarketSnapshot:
+    """一个分析周期内所有交易对共享的跨资产上下文
+
+    新闻批次、情绪聚合、新闻检索向量和全市场指标每个周期只算一次，
+    各交易对的工作流直接读取，不再各自重复计算。
+    """
+
+    timestamp: datetime
+    news: List[Dict]
+    sentiment: Dict
+    # 交易对 -> 回看窗口内的涨跌幅、成交额占比和涨跌幅排名
+    assets: Dict[str, Dict] = field(default_factory=dict)
+    benchmark: str = "BTC/USDT"
+    breadth: Optional[float] = None
+    median_return: Optional[float] = None
+    lookback_bars: int = 24
+    # RAGAgent 检索相似历史新闻用的新闻向量，与交易对无关
+    news_vector: Optional[np.ndarray] = None
+
+    def context(self, symbol: str) -> Dict:
+        """交易对相对基准资产和整个观察列表的位置，写入技术分析提示词"""
+        asset = self.assets.get(symbol, {})
+        benchmark = self.assets.get(self.benchmark, {})
+        relative = None
+        if asset.get("return") is not None and benchmark.get("return") is not None:
+            relative = round(asset["return"] - benchmark["return"], 4)
+        return {
+            "symbol": symbol,
+            "lookback_bars": self.lookback_bars,
+            "return": asset.get("return"),
+            "return_rank": asset.get("rank"),
+            "volume_share": asset.get("volume_share"),
+            "relative_to_benchmark": relative,
+            "benchmark": {
+                "symbol": self.benchmark,
+                "return": benchmark.get("return"),
+                # 基准资产在观察列表成交额中的占比，作为市值占比的近似
+                "dominance": benchmark.get("volume_share"),
+            },
+            "watchlist_size": len(self.assets),
+            "breadth": self.breadth,
+            "median_return": self.median_return,
+        }
+
+
+def build_snapshot(
+    candles: Dict[str, CandleBatch],
+    news: List[Dict],
+    now: datetime = None,
+    lookback_bars: int = None,
+    benchmark: str = None,
+) -> MarketSnapshot:
+    """由本周期各交易对的K线和新闻批次构造共享快照
+
+    涨跌幅和成交额都取最近 lookback_bars 根K线；breadth 为上涨交易对的占比。
+    """
+    lookback = lookback_bars or get_config("analysis.context_bars", 24)
+    benchmark = benchmark or get_config("analysis.benchmark", "BTC/USDT")
+
+    assets = {}
+    for symbol, batch in candles.items():
+        if len(batch) < 2:
+            continue
+        close = batch.close[-lookback - 1 :]
+        turnover = float(np.sum(batch.close[-lookback:] * batch.volume[-lookback:]))
+        assets[symbol] = {
+            "return": round(float(close[-1] / close[0] - 1), 4),
+            "turnover": turnover,
+        }
+
+    breadth = median = None
+    if assets:
+        returns = np.array([a["return"] for a in assets.values()])
+        total = sum(a["turnover"] for a in assets.values()) or 1.0
+        # 涨幅最大的排第 1
+        ranks = (-returns).argsort().argsort() + 1
+        for (symbol, asset), rank in zip(assets.items(), ranks):
+            asset["volume_share"] = round(asset.pop("turnover") / total, 4)
+            asset["rank"] = int(rank)
+        breadth = round(float(np.mean(returns > 0)), 4)
+        median = round(float(np.median(returns)), 4)
+
+    return MarketSnapshot(
+        timestamp=now or datetime.now(timezone.utc),
+        news=news,
+        sentiment=aggregate_sentiment(news, now),
+        assets=assets,
+        benchmark=benchmark,
+        breadth=breadth,
+        median_return=median,
+        lookback_bars=lookback,
+    )